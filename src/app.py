@@ -1,10 +1,65 @@
+import asyncio
 import json
+from typing import List, Optional
+
 from logs import logger
 
-from main import run
+from clients import run_until_complete
+from deadline import Deadline
+from job_config import JobMode
+from main import run, run_async
+
+
+async def _run_batch(records: List[dict], deadline: Optional[Deadline]) -> dict:
+    """
+    Runs every job of an SQS batch concurrently on one event loop, sharing the
+    process-wide clients. Returns the records that failed so SQS only retries those.
+    """
+    message_ids_by_job = {}
+    mode_by_job = {}
+    failed_message_ids = []
+
+    for record in records:
+        message_id = record.get("messageId")
+        try:
+            payload = json.loads(record.get("body") or "{}")
+            job_id = payload.get("job_id")
+            mode = JobMode(payload.get("mode", JobMode.GENERATE.value))
+        except (json.JSONDecodeError, AttributeError, ValueError) as e:
+            logger.error(f"Invalid JSON payload in record {message_id}: {e}")
+            failed_message_ids.append(message_id)
+            continue
+
+        if not job_id:
+            logger.error(f"job_id not found in record {message_id}")
+            failed_message_ids.append(message_id)
+            continue
+
+        # Duplicate deliveries of one job in the same batch are processed once
+        message_ids_by_job.setdefault(job_id, []).append(message_id)
+        mode_by_job.setdefault(job_id, mode)
+
+    job_ids = list(message_ids_by_job.keys())
+    logger.info(f"Processing batch of {len(job_ids)} jobs: {job_ids}")
+    results = await asyncio.gather(*(run_async(job_id, deadline, mode_by_job[job_id]) for job_id in job_ids), return_exceptions=True)
+
+    for job_id, result in zip(job_ids, results):
+        if isinstance(result, BaseException):
+            logger.error(f"Job {job_id} failed in batch: {result}")
+            failed_message_ids.extend(message_ids_by_job[job_id])
+
+    return {
+        "batchItemFailures": [{"itemIdentifier": message_id} for message_id in failed_message_ids]
+    }
 
 
 def lambda_handler(event, context):
+    # Jobs degrade gracefully before the function timeout instead of being killed mid-flight
+    deadline = Deadline.from_lambda_context(context) if context else None
+
+    if "Records" in event:
+        return run_until_complete(_run_batch(event["Records"], deadline))
+
     try:
 
         body = event.get("body", event)
@@ -18,9 +73,18 @@ def lambda_handler(event, context):
                 'body': json.dumps({'error': 'job_id is required in the payload.'})
             }
 
-        logger.info(f"Processing job with ID: {job_id}")
+        try:
+            mode = JobMode(payload.get('mode', JobMode.GENERATE.value))
+        except ValueError:
+            logger.error(f"Invalid job mode in payload: {payload.get('mode')}")
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': f"mode must be one of: {', '.join(m.value for m in JobMode)}."})
+            }
+
+        logger.info(f"Processing job with ID: {job_id} in {mode.value} mode")
 
-        result = run(job_id)
+        result = run(job_id, deadline, mode)
         
         return {
             'statusCode': 200,
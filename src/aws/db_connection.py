@@ -12,6 +12,8 @@ DB_NAME = os.environ.get("DB_NAME", "genuis-db")
 DB_USERNAME = os.environ.get("DB_USERNAME")
 DB_PASSWORD = os.environ.get("DB_PASSWORD")
 CERTIFICATE_PATH = "/var/task/global-bundle.pem"
+# Disable to connect to a local mongo container without TLS
+DB_TLS_ENABLED = os.environ.get("DB_TLS_ENABLED", "true").lower() == "true"
 
 client = None
 
@@ -20,11 +22,11 @@ def attempt_connection():
         connection_uri = DATABASE_URI.format(username=DB_USERNAME,password=DB_PASSWORD)
         logger.info(f"Attempting to connect to {DB_NAME}")
 
+        tls_options = {"tls": True, "tlsCAFile": CERTIFICATE_PATH} if DB_TLS_ENABLED else {}
         new_client = MongoClient(
             connection_uri,
-            tls=True,
-            tlsCAFile=CERTIFICATE_PATH,
-            serverSelectionTimeoutMS=5000 
+            serverSelectionTimeoutMS=5000,
+            **tls_options
         )
         new_client.admin.command('ping')
         logger.info("Connection Succesful")
@@ -1,8 +1,8 @@
 import os
 import asyncio
-import aioboto3
 from typing import List, Dict
 from logs import logger
+from clients import get_s3_client, reset_s3_client
 
 async def upload_images_concurrently(image_data_map: Dict[str, List[bytes]]) -> Dict[str, List[str]]:
     """
@@ -19,59 +19,63 @@ async def upload_images_concurrently(image_data_map: Dict[str, List[bytes]]) ->
         logger.error("AWS_S3_BUCKET environment variable not set")
         return {}
 
-    session = aioboto3.Session()
     uploaded_urls_map = {}
+    # Shared per container, see clients.py
+    s3_client = await get_s3_client()
 
-    async with session.client("s3") as s3_client:
-        tasks = []
-        upload_metadata = [] # Stores (component_id, index, key)
+    tasks = []
+    upload_metadata = [] # Stores (component_id, index, key)
 
-        for component_id, images in image_data_map.items():
-            uploaded_urls_map[component_id] = [None] * len(images)
-            for idx, image_bytes in enumerate(images):
-                # Generate unique key
-                import uuid
-                from datetime import datetime
-                
-                # Assume PNG for now as Imagen/Gemini usually outputs PNG/JPEG. 
-                # Ideally we check magic bytes or response mime type.
-                # Assuming PNG from user request context or defaults.
-                extension = "png" 
-                key = f"generated_images/{component_id}/{datetime.now().strftime('%Y%m%d')}/{uuid.uuid4()}.{extension}"
-                
-                upload_metadata.append((component_id, idx, key))
-                
-                tasks.append(
-                    s3_client.put_object(
-                        Bucket=bucket_name,
-                        Key=key,
-                        Body=image_bytes,
-                        ContentType=f"image/{extension}"
-                    )
+    for component_id, images in image_data_map.items():
+        uploaded_urls_map[component_id] = [None] * len(images)
+        for idx, image_bytes in enumerate(images):
+            # Generate unique key
+            import uuid
+            from datetime import datetime
+            
+            # Assume PNG for now as Imagen/Gemini usually outputs PNG/JPEG. 
+            # Ideally we check magic bytes or response mime type.
+            # Assuming PNG from user request context or defaults.
+            extension = "png" 
+            key = f"generated_images/{component_id}/{datetime.now().strftime('%Y%m%d')}/{uuid.uuid4()}.{extension}"
+            
+            upload_metadata.append((component_id, idx, key))
+            
+            tasks.append(
+                s3_client.put_object(
+                    Bucket=bucket_name,
+                    Key=key,
+                    Body=image_bytes,
+                    ContentType=f"image/{extension}"
                 )
-        
-        if not tasks:
-            return {}
+            )
+    
+    if not tasks:
+        return {}
+
+    logger.info(f"Starting upload of {len(tasks)} images to S3 bucket {bucket_name}")
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    # Process results
+    for i, result in enumerate(results):
+        component_id, idx, key = upload_metadata[i]
+        if isinstance(result, Exception):
+            logger.error(f"Failed to upload image {key} for component {component_id}: {result}")
+            # Leave as None or set to empty string? None indicates failure.
+        else:
+            # Construct URL. 
+            # If region is needed, we might need AWS_REGION. 
+            # For standard buckets: https://bucket.s3.amazonaws.com/key
+            # Or https://bucket.s3.region.amazonaws.com/key
+            # We'll use the generic one or try to get region.
+            region = os.environ.get("AWS_REGION", "us-east-1")
+            url = f"https://{bucket_name}.s3.{region}.amazonaws.com/{key}"
+            uploaded_urls_map[component_id][idx] = url
 
-        logger.info(f"Starting upload of {len(tasks)} images to S3 bucket {bucket_name}")
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+    if all(isinstance(result, Exception) for result in results):
+        # Likely a broken connection, reconnect on the next upload
+        await reset_s3_client()
 
-        # Process results
-        for i, result in enumerate(results):
-            component_id, idx, key = upload_metadata[i]
-            if isinstance(result, Exception):
-                logger.error(f"Failed to upload image {key} for component {component_id}: {result}")
-                # Leave as None or set to empty string? None indicates failure.
-            else:
-                # Construct URL. 
-                # If region is needed, we might need AWS_REGION. 
-                # For standard buckets: https://bucket.s3.amazonaws.com/key
-                # Or https://bucket.s3.region.amazonaws.com/key
-                # We'll use the generic one or try to get region.
-                region = os.environ.get("AWS_REGION", "us-east-1")
-                url = f"https://{bucket_name}.s3.{region}.amazonaws.com/{key}"
-                uploaded_urls_map[component_id][idx] = url
-                
     # Filter out None values from lists
     final_map = {}
     for cid, urls in uploaded_urls_map.items():
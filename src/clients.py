@@ -0,0 +1,120 @@
+"""
+Process-wide registry of network clients.
+
+Clients are created once per container and reused across warm Lambda
+invocations. Async clients bind their connection pools to the event loop they
+first run on, so every invocation runs on the same long-lived loop through
+`run_until_complete` instead of a fresh `asyncio.run` loop.
+"""
+import asyncio
+import atexit
+from contextlib import AsyncExitStack
+from typing import Any, Coroutine, Dict, Optional
+
+import aioboto3
+import google.genai as genai
+from openai import AsyncOpenAI
+
+from logs import logger
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_openai_clients: Dict[str, AsyncOpenAI] = {}
+_genai_clients: Dict[str, genai.Client] = {}
+_s3_client = None
+_s3_exit_stack: Optional[AsyncExitStack] = None
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_loop)
+    return _loop
+
+
+def run_until_complete(coro: Coroutine) -> Any:
+    """Runs a coroutine on the process-wide event loop."""
+    return get_event_loop().run_until_complete(coro)
+
+
+def get_openai_client(api_key: str) -> AsyncOpenAI:
+    client = _openai_clients.get(api_key)
+    if client is None or client.is_closed():
+        logger.info("Creating AsyncOpenAI client")
+        # Retries are handled by llm/providers/retry.py, not by the SDK
+        client = AsyncOpenAI(api_key=api_key, max_retries=0)
+        _openai_clients[api_key] = client
+    return client
+
+
+def _genai_session_closed(client: genai.Client) -> bool:
+    # The aio client keeps its aiohttp session on the shared api client
+    session = getattr(getattr(client, "_api_client", None), "_aiohttp_session", None)
+    return session is not None and session.closed
+
+
+def get_genai_client(api_key: str) -> genai.Client:
+    client = _genai_clients.get(api_key)
+    if client is None or _genai_session_closed(client):
+        logger.info("Creating Gemini client")
+        client = genai.Client(api_key=api_key)
+        _genai_clients[api_key] = client
+    return client
+
+
+async def get_s3_client():
+    global _s3_client, _s3_exit_stack
+
+    if _s3_client is None:
+        logger.info("Creating S3 client")
+        _s3_exit_stack = AsyncExitStack()
+        _s3_client = await _s3_exit_stack.enter_async_context(aioboto3.Session().client("s3"))
+    return _s3_client
+
+
+async def reset_s3_client() -> None:
+    """Drops the S3 client so the next call reconnects, e.g. after a connection error."""
+    global _s3_client, _s3_exit_stack
+
+    exit_stack, _s3_client, _s3_exit_stack = _s3_exit_stack, None, None
+    if exit_stack is not None:
+        try:
+            await exit_stack.aclose()
+        except Exception as e:
+            logger.warning(f"Error closing S3 client: {e}")
+
+
+async def close_clients() -> None:
+    for client in _openai_clients.values():
+        try:
+            await client.close()
+        except Exception as e:
+            logger.warning(f"Error closing AsyncOpenAI client: {e}")
+    _openai_clients.clear()
+
+    for client in _genai_clients.values():
+        try:
+            session = getattr(getattr(client, "_api_client", None), "_aiohttp_session", None)
+            if session is not None and not session.closed:
+                await session.close()
+            if hasattr(client, "close"):
+                client.close()
+        except Exception as e:
+            logger.warning(f"Error closing Gemini client: {e}")
+    _genai_clients.clear()
+
+    await reset_s3_client()
+
+
+def _shutdown() -> None:
+    if _loop is None or _loop.is_closed() or _loop.is_running():
+        return
+
+    try:
+        _loop.run_until_complete(close_clients())
+    finally:
+        _loop.close()
+
+
+atexit.register(_shutdown)
@@ -0,0 +1,46 @@
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+COMPONENT_INDEX_COLLECTION = "component_reuse_index"
+# How long a generated component can be offered to later jobs
+COMPONENT_REUSE_TTL_SECONDS = int(os.environ.get("COMPONENT_REUSE_TTL_SECONDS", str(30 * 24 * 3600)))
+# Candidates compared per lookup, the bands of a common sub-prompt can match many components
+COMPONENT_REUSE_MAX_CANDIDATES = 200
+
+_indexes_ready = False
+
+
+def _ensure_indexes(db) -> None:
+    global _indexes_ready
+
+    if not _indexes_ready:
+        db[COMPONENT_INDEX_COLLECTION].create_index("expires_at", expireAfterSeconds=0)
+        db[COMPONENT_INDEX_COLLECTION].create_index([("model", 1), ("device", 1), ("bands", 1)])
+        _indexes_ready = True
+
+
+def find_component_candidates(db: Dict, model: str, device: str, bands: List[str]) -> List[Dict[str, Any]]:
+    """Indexed components of `model` and `device` sharing at least one MinHash band."""
+    _ensure_indexes(db)
+    return list(db[COMPONENT_INDEX_COLLECTION].find(
+        {"model": model, "device": device, "bands": {"$in": bands}},
+        {"signature": 1, "code": 1, "generation_seconds": 1, "component_id": 1}
+    ).limit(COMPONENT_REUSE_MAX_CANDIDATES))
+
+
+def insert_component_index(db: Dict, component_id: str, model: str, device: str, signature: List[int], bands: List[str], sub_prompt: str, code: str, generation_seconds: float) -> None:
+    _ensure_indexes(db)
+    now = datetime.now(timezone.utc)
+    db[COMPONENT_INDEX_COLLECTION].insert_one({
+        "component_id": component_id,
+        "model": model,
+        "device": device,
+        "signature": signature,
+        "bands": bands,
+        "sub_prompt": sub_prompt,
+        "code": code,
+        "generation_seconds": generation_seconds,
+        "created_at": now,
+        "expires_at": now + timedelta(seconds=COMPONENT_REUSE_TTL_SECONDS)
+    })
@@ -0,0 +1,82 @@
+import asyncio
+from typing import Any, Dict, List, Optional, Set
+
+from db.job_utils import bulk_update_components_by_id, component_planning_update, component_result_update
+from job_config import ComponentStatus
+from logs import logger
+
+FLUSH_DELAY_SECONDS = 0.2
+
+
+class ComponentWriteBuffer:
+    """
+    Coalesces the component updates issued by concurrent pipelines into a single
+    bulk_write per flush window. Each write call resolves once its component's
+    update is persisted, or raises its own error, so callers keep the durability
+    and failures of a direct update.
+    """
+
+    def __init__(self, db, flush_delay: float = FLUSH_DELAY_SECONDS):
+        self.db = db
+        self.flush_delay = flush_delay
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._waiters: Dict[str, List[asyncio.Future]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        # Flush tasks not finished yet, the scheduled one included
+        self._flushes: Set[asyncio.Task] = set()
+
+    async def update_planning(self, component_id: str, status: ComponentStatus, sub_prompt: str) -> None:
+        await self._enqueue(component_id, component_planning_update(status, sub_prompt))
+
+    async def update_result(self, component_id: str, status: ComponentStatus, code: str = None, sub_prompt: str = None, error_message: str = None, completed_at: str = None) -> None:
+        await self._enqueue(component_id, component_result_update(status, code, sub_prompt, error_message, completed_at))
+
+    async def _enqueue(self, component_id: str, update_data: Dict[str, Any]) -> None:
+        # Later updates of the same component in one window win, as they would sequentially
+        self._pending.setdefault(component_id, {}).update(update_data)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(component_id, []).append(waiter)
+
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_after_delay())
+            self._flushes.add(self._flush_task)
+            self._flush_task.add_done_callback(self._flushes.discard)
+
+        await waiter
+
+    async def _flush_after_delay(self) -> None:
+        await asyncio.sleep(self.flush_delay)
+        self._flush_task = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        pending, self._pending = self._pending, {}
+        waiters, self._waiters = self._waiters, {}
+        if not pending:
+            return
+
+        try:
+            errors = await asyncio.to_thread(bulk_update_components_by_id, self.db, pending)
+        except Exception as e:
+            errors = {component_id: e for component_id in pending}
+        logger.info(f"Flushed {len(pending)} component updates in one bulk write, {len(errors)} failed")
+
+        # An unmatched or rejected component only fails its own writers
+        for component_id, component_waiters in waiters.items():
+            error = errors.get(component_id)
+            for waiter in component_waiters:
+                if waiter.done():
+                    continue
+                if error is None:
+                    waiter.set_result(None)
+                else:
+                    waiter.set_exception(error)
+
+    async def close(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        # A bulk write already running must land before the caller fails the components it did not persist
+        await asyncio.gather(*self._flushes, return_exceptions=True)
+        await self.flush()
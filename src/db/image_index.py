@@ -0,0 +1,45 @@
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+from pymongo import UpdateOne
+
+IMAGE_INDEX_COLLECTION = "image_prompt_index"
+# Should not outlive the bucket's lifecycle rules for generated_images/
+IMAGE_CACHE_TTL_SECONDS = int(os.environ.get("IMAGE_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+
+_ttl_index_ready = False
+
+
+def _ensure_ttl_index(db) -> None:
+    global _ttl_index_ready
+
+    if not _ttl_index_ready:
+        db[IMAGE_INDEX_COLLECTION].create_index("expires_at", expireAfterSeconds=0)
+        _ttl_index_ready = True
+
+
+def find_image_urls(db: Dict, keys: List[str]) -> Dict[str, str]:
+    """URLs of the stored images whose prompt key is in `keys`."""
+    _ensure_ttl_index(db)
+    docs = db[IMAGE_INDEX_COLLECTION].find(
+        {"_id": {"$in": keys}, "expires_at": {"$gt": datetime.now(timezone.utc)}},
+        {"url": 1}
+    )
+    return {doc["_id"]: doc["url"] for doc in docs}
+
+
+def store_image_urls(db: Dict, entries: Dict[str, Dict[str, str]]) -> None:
+    """Indexes prompt key -> {"prompt", "model", "s3_key", "url"} in a single bulk write."""
+    if not entries:
+        return
+    _ensure_ttl_index(db)
+    now = datetime.now(timezone.utc)
+    db[IMAGE_INDEX_COLLECTION].bulk_write([
+        UpdateOne(
+            {"_id": key},
+            {"$set": {**entry, "created_at": now, "expires_at": now + timedelta(seconds=IMAGE_CACHE_TTL_SECONDS)}},
+            upsert=True
+        )
+        for key, entry in entries.items()
+    ], ordered=False)
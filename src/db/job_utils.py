@@ -1,7 +1,12 @@
+import os
+from datetime import datetime, timedelta, timezone
 from typing import List, Dict, Any, Optional
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
 from models.db_models import Job, Component
-from job_config import JobStatus, ComponentStatus
+from job_config import JobStatus, ComponentStatus, PlanningStep
 from exceptions import (
+    JobAlreadyClaimedException,
     JobNotFoundException,
     JobStatusUpdateFailedException,
     JobPromptUpdateFailedException,
@@ -11,6 +16,11 @@ from exceptions import (
     UserFailedUpdateException
 )
 
+# A RUNNING job whose lease is not extended for this long can be claimed by another invocation
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", "60"))
+# Claims a job gets; one whose lease keeps expiring is not reclaimed past this
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+
 def insert_job_record(db: Dict, job_data: Dict[str, Any]) -> str:
     try:
         Job(**job_data)
@@ -58,6 +68,110 @@ def find_job_components(db: Dict, job_id: str) -> List[Dict[str, Any]]:
     return component_docs
 
 
+def _lease_update(owner: str, now: datetime) -> Dict[str, Any]:
+    return {
+        "$set": {
+            "status": JobStatus.RUNNING.value,
+            "lease_owner": owner,
+            "lease_expires_at": now + timedelta(seconds=JOB_LEASE_SECONDS)
+        },
+        "$inc": {"attempts": 1}
+    }
+
+
+def _expired_lease_filter(now: datetime) -> Dict[str, Any]:
+    # A job that crashed every invocation it was claimed by stays where it is instead of being rerun forever.
+    # $not also matches jobs leased before attempts were counted
+    return {"status": JobStatus.RUNNING.value, "lease_expires_at": {"$lt": now}, "attempts": {"$not": {"$gte": JOB_MAX_ATTEMPTS}}}
+
+
+def claim_next_submitted_job(db: Dict, owner: str) -> Optional[Dict[str, Any]]:
+    """
+    Atomically leases the oldest SUBMITTED job, or a RUNNING one whose lease
+    expired, to `owner` and returns it, or None if there is none.
+    """
+    now = datetime.now(timezone.utc)
+    try:
+        return db["generation_jobs"].find_one_and_update(
+            {"$or": [{"status": JobStatus.SUBMITTED.value}, _expired_lease_filter(now)]},
+            _lease_update(owner, now),
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+    except Exception as e:
+        raise DatabaseQueryFailedException(f"Database query failed: {e}")
+
+
+def claim_job(db: Dict, job_id: str, owner: str, claimable_statuses: List[JobStatus]) -> Dict[str, Any]:
+    """
+    Atomically sets a job RUNNING under a lease held by `owner`, when it is in one
+    of `claimable_statuses`, its lease expired or `owner` already holds it.
+    Returns the job as it was before the claim, so callers still see its status.
+    """
+    now = datetime.now(timezone.utc)
+    try:
+        job = db["generation_jobs"].find_one_and_update(
+            {
+                "_id": job_id,
+                "$or": [
+                    {"status": {"$in": [status.value for status in claimable_statuses]}},
+                    _expired_lease_filter(now)
+                ]
+            },
+            _lease_update(owner, now),
+            return_document=ReturnDocument.BEFORE
+        )
+        if job is None:
+            # Handed over by the worker that claimed it, which is not another attempt
+            job = db["generation_jobs"].find_one_and_update(
+                {"_id": job_id, "status": JobStatus.RUNNING.value, "lease_owner": owner},
+                {"$set": {"lease_expires_at": now + timedelta(seconds=JOB_LEASE_SECONDS)}},
+                return_document=ReturnDocument.BEFORE
+            )
+    except Exception as e:
+        raise DatabaseQueryFailedException(f"Database query failed: {e}")
+
+    if job is None:
+        # Raises JobNotFoundException when the job does not exist at all
+        job = find_job_by_id(db, job_id)
+        raise JobAlreadyClaimedException(f"Job {job_id} is {job.get('status')} and leased by {job.get('lease_owner')}")
+
+    return job
+
+
+def extend_job_lease(db: Dict, job_id: str, owner: str) -> bool:
+    """Extends the lease `owner` holds on a job; False when another owner took it over."""
+    try:
+        result = db["generation_jobs"].update_one(
+            # Not filtered on status, so finishing the job does not read as a lost lease
+            {"_id": job_id, "lease_owner": owner},
+            {"$set": {"lease_expires_at": datetime.now(timezone.utc) + timedelta(seconds=JOB_LEASE_SECONDS)}}
+        )
+    except Exception as e:
+        raise DatabaseQueryFailedException(f"Database query failed: {e}")
+
+    return result.matched_count > 0
+
+
+def release_job(db: Dict, job_id: str, owner: str, status: JobStatus, error_message: str) -> bool:
+    """
+    Sets a job that failed under the lease `owner` holds to `status` and releases
+    the lease, so it is not claimed again; False when another owner took it over.
+    """
+    try:
+        result = db["generation_jobs"].update_one(
+            {"_id": job_id, "lease_owner": owner},
+            {
+                "$set": {"status": status.value, "error_message": error_message},
+                "$unset": {"lease_owner": "", "lease_expires_at": ""}
+            }
+        )
+    except Exception as e:
+        raise DatabaseQueryFailedException(f"Database query failed: {e}")
+
+    return result.matched_count > 0
+
+
 def update_job_status(db: Dict, job_id: str, new_status: JobStatus, completed_at: Optional[str] = None) -> Dict:
     
     try:
@@ -91,60 +205,108 @@ def update_job_planning(db: Dict, job_id: str, plan_objects: dict) -> Dict:
     if result.matched_count <= 0:
         raise JobPromptUpdateFailedException(f"Failed to update job prompt: No job modified")
 
-def update_component_planning(db: Dict, component_id: str, status: ComponentStatus, sub_prompt: str) -> bool:
+def component_planning_update(status: ComponentStatus, sub_prompt: str) -> Dict[str, Any]:
+    return {"status": status.value, "sub_prompt": sub_prompt}
+
+def component_result_update(status: ComponentStatus, code: str = None, sub_prompt: str = None, error_message: str = None, completed_at: str = None) -> Dict[str, Any]:
+    update_data = {"status": status.value}
+    if code is not None:
+        update_data["code"] = code
+    if error_message is not None:
+        update_data["error_message"] = error_message
+    if sub_prompt is not None:
+        update_data["sub_prompt"] = sub_prompt
+    if completed_at is not None:
+        update_data["completed_at"] = completed_at
+    return update_data
+
+def update_job_planning_checkpoint(db: Dict, job_id: str, step: PlanningStep, output: dict) -> Dict:
+    """Stores the structured output of a planning step and marks it as the last completed one."""
     try:
-        result = db["generated_components"].update_one(
-            {"_id": component_id},
-            {"$set": {"status": status.value, "sub_prompt": sub_prompt}}
+        result = db["generation_jobs"].update_one(
+            {"_id": job_id},
+            {"$set": {f"planning_checkpoint.{step.value}": output, "planning_checkpoint.step": step.value}}
         )
 
     except Exception as e:
         raise DatabaseQueryFailedException(f"Database query failed: {e}")
 
     if result.matched_count <= 0:
-        raise ComponentStatusUpdateFailedException(f"Failed to update component planning: No component modified")
+        raise JobPromptUpdateFailedException(f"Failed to update job planning checkpoint: No job modified")
 
-    return True
+    return result
 
-def bulk_update_component_status(db: Dict, component_ids: List[str], new_status: ComponentStatus) -> int:
+def fail_unfinished_components(db: Dict, job_id: str) -> int:
     try:
         result = db["generated_components"].update_many(
-            {"_id": {"$in": component_ids}},
-            {"$set": {"status": new_status.value}}
+            {
+                "parent_job_id": job_id,
+                "status": {"$in": [ComponentStatus.PENDING.value, ComponentStatus.RUNNING.value]}
+            },
+            {"$set": {"status": ComponentStatus.FAILED.value}}
         )
 
     except Exception as e:
         raise DatabaseQueryFailedException(f"Database query failed: {e}")
 
-    if result.matched_count < len(component_ids):
-        raise ComponentStatusUpdateFailedException(f"Failed to update all components")
+    return result.modified_count
 
-    return result.matched_count
+def bulk_update_components_by_id(db: Dict, component_updates: Dict[str, Dict[str, Any]]) -> Dict[str, Exception]:
+    """
+    Applies a $set body per component_id in a single unordered bulk_write round trip.
+    Returns the error of every component whose update failed or matched no document.
+    """
+    if not component_updates:
+        return {}
 
-def update_component_with_result(db: Dict, component_id: str, status: ComponentStatus, code: str = None, sub_prompt: str = None, error_message: str = None, completed_at: str = None) -> bool:
+    component_ids = list(component_updates.keys())
+    operations = [UpdateOne({"_id": component_id}, {"$set": component_updates[component_id]}) for component_id in component_ids]
+    errors: Dict[str, Exception] = {}
     try:
-        update_data = {"status": status.value}
-        if code is not None:
-            update_data["code"] = code
-        if error_message is not None:
-            update_data["error_message"] = error_message
-        if sub_prompt is not None:
-            update_data["sub_prompt"] = sub_prompt
-        if completed_at is not None:
-            update_data["completed_at"] = completed_at
-
-        result = db["generated_components"].update_one(
-            {"_id": component_id},
-            {"$set": update_data}
-        )
+        matched_count = db["generated_components"].bulk_write(operations, ordered=False).matched_count
 
-    except Exception as e:
-        raise DatabaseQueryFailedException(f"Database query failed: {e}")
-
-    if result.matched_count <= 0:
-        raise ComponentStatusUpdateFailedException(f"Failed to update component with result: No component modified")
+    except BulkWriteError as e:
+        # Unordered, every operation without a write error was still applied
+        for write_error in e.details.get("writeErrors", []):
+            errors[component_ids[write_error["index"]]] = DatabaseQueryFailedException(f"Database query failed: {write_error.get('errmsg')}")
+        matched_count = e.details.get("nMatched", 0)
 
-    return result
+    except Exception as e:
+        error = DatabaseQueryFailedException(f"Database query failed: {e}")
+        return {component_id: error for component_id in component_ids}
+
+    if matched_count < len(component_ids) - len(errors):
+        # The bulk result only carries totals, look up which components were not matched
+        written_ids = [component_id for component_id in component_ids if component_id not in errors]
+        try:
+            found_ids = {doc["_id"] for doc in db["generated_components"].find({"_id": {"$in": written_ids}}, {"_id": 1})}
+        except Exception as e:
+            error = DatabaseQueryFailedException(f"Database query failed: {e}")
+            return {component_id: errors.get(component_id, error) for component_id in component_ids}
+
+        for component_id in written_ids:
+            if component_id not in found_ids:
+                errors[component_id] = ComponentStatusUpdateFailedException(f"Failed to update component {component_id}: not found")
+
+    return errors
+
+def bulk_update_components(db: Dict, component_updates: Dict[str, Dict[str, Any]]) -> int:
+    """Applies a $set body per component_id in a single unordered bulk_write round trip."""
+    errors = bulk_update_components_by_id(db, component_updates)
+    for error in errors.values():
+        if isinstance(error, DatabaseQueryFailedException):
+            raise error
+    if errors:
+        raise ComponentStatusUpdateFailedException(f"Failed to update components: {list(errors)} not modified")
+
+    return len(component_updates)
+
+def bulk_update_components_with_results(db: Dict, component_results: Dict[str, Dict[str, Any]]) -> int:
+    """component_results maps component_id to the keyword arguments of component_result_update."""
+    return bulk_update_components(db, {
+        component_id: component_result_update(**result)
+        for component_id, result in component_results.items()
+    })
 
 def consume_user_credits(db: Dict, user_id: str, successful_component_count: int) -> int:    
     if successful_component_count == 0:
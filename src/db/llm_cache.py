@@ -0,0 +1,40 @@
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+LLM_CACHE_COLLECTION = "llm_response_cache"
+# How long a response is shared between instances before it has to be generated again
+LLM_CACHE_TTL_SECONDS = int(os.environ.get("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+_ttl_index_ready = False
+
+
+def _ensure_ttl_index(db) -> None:
+    global _ttl_index_ready
+
+    if not _ttl_index_ready:
+        db[LLM_CACHE_COLLECTION].create_index("expires_at", expireAfterSeconds=0)
+        _ttl_index_ready = True
+
+
+def find_cached_response(db: Dict, key: str) -> Optional[str]:
+    _ensure_ttl_index(db)
+    # The TTL monitor only runs about once a minute, expired documents can still be read
+    doc = db[LLM_CACHE_COLLECTION].find_one({"_id": key, "expires_at": {"$gt": datetime.now(timezone.utc)}})
+    return doc["response"] if doc else None
+
+
+def store_cached_response(db: Dict, key: str, model_name: str, response: str) -> None:
+    _ensure_ttl_index(db)
+    now = datetime.now(timezone.utc)
+    # An upsert rather than an insert, so an expired document the TTL monitor has not removed yet is refreshed
+    db[LLM_CACHE_COLLECTION].replace_one(
+        {"_id": key},
+        {
+            "model": model_name,
+            "response": response,
+            "created_at": now,
+            "expires_at": now + timedelta(seconds=LLM_CACHE_TTL_SECONDS)
+        },
+        upsert=True
+    )
@@ -0,0 +1,108 @@
+import asyncio
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from aws.db_connection import get_db
+from deadline import current_deadline
+from exceptions import RateLimitExceededException
+from logs import logger
+
+RATE_LIMIT_COLLECTION = "rate_limit_windows"
+RATE_LIMIT_WINDOW_SECONDS = int(os.environ.get("RATE_LIMIT_WINDOW_SECONDS", "60"))
+# Account-level limits per model shared by every instance, e.g.
+# {"gpt-5-mini": {"rpm": 500, "tpm": 500000}, "models/imagen-4.0-fast-generate-001": {"rpm": 60}}.
+# Models without an entry are not limited and cost no database round trip.
+RATE_LIMITS: Dict[str, Dict[str, int]] = json.loads(os.environ.get("RATE_LIMITS", "{}"))
+
+_ttl_index_ready = False
+
+
+def estimate_tokens(messages: List[Dict[str, str]]) -> int:
+    """Rough prompt size in tokens (about 4 characters each), used to lease TPM capacity."""
+    return sum(len(message.get("content") or "") for message in messages) // 4
+
+
+def _ensure_ttl_index(db) -> None:
+    global _ttl_index_ready
+
+    if not _ttl_index_ready:
+        db[RATE_LIMIT_COLLECTION].create_index("expires_at", expireAfterSeconds=0)
+        _ttl_index_ready = True
+
+
+def lease_rate_limit_window(db, key: str, tokens: int, limits: Dict[str, int], now: float) -> Optional[float]:
+    """
+    Atomically leases one request and `tokens` tokens from the current window of
+    `key` with a conditional `$inc`. Returns None when granted, otherwise the
+    seconds until the next window opens.
+    """
+    window_start = int(now // RATE_LIMIT_WINDOW_SECONDS) * RATE_LIMIT_WINDOW_SECONDS
+    window_end = window_start + RATE_LIMIT_WINDOW_SECONDS
+
+    query = {"_id": f"{key}:{window_start}"}
+    if "rpm" in limits:
+        query["requests"] = {"$lte": limits["rpm"] - 1}
+    if "tpm" in limits:
+        query["tokens"] = {"$lte": limits["tpm"] - tokens}
+
+    update = {
+        "$inc": {"requests": 1, "tokens": tokens},
+        "$setOnInsert": {
+            "key": key,
+            "window_start": window_start,
+            "expires_at": datetime.fromtimestamp(window_end, tz=timezone.utc) + timedelta(seconds=RATE_LIMIT_WINDOW_SECONDS)
+        }
+    }
+    try:
+        db[RATE_LIMIT_COLLECTION].find_one_and_update(query, update, upsert=True, return_document=ReturnDocument.AFTER)
+        return None
+    except DuplicateKeyError:
+        # Either the window has no capacity left, or another instance created it concurrently;
+        # leasing again without the upsert tells the two apart
+        pass
+
+    if db[RATE_LIMIT_COLLECTION].find_one_and_update(query, {"$inc": update["$inc"]}, return_document=ReturnDocument.AFTER) is not None:
+        return None
+    return window_end - now
+
+
+def _next_wait(key: str, tokens: int) -> Optional[float]:
+    limits = RATE_LIMITS.get(key)
+    if not limits:
+        return None
+    # A prompt larger than the whole TPM limit would otherwise never fit in a window
+    tokens = min(tokens, limits.get("tpm", tokens))
+
+    try:
+        db = get_db()
+        _ensure_ttl_index(db)
+        return lease_rate_limit_window(db, key, tokens, limits, time.time())
+    except Exception as e:
+        # The limiter protects provider quotas, it must not take generation down with it
+        logger.warning(f"Rate limiter unavailable for {key}, proceeding without a lease: {e}")
+        return None
+
+
+def _check_deadline(key: str, wait: float) -> None:
+    deadline = current_deadline.get()
+    if deadline is not None and wait >= deadline.budget():
+        raise RateLimitExceededException(f"Rate limit of {key} leaves no capacity before the job deadline")
+
+
+async def acquire_rate_limit(key: str, tokens: int = 0) -> None:
+    """Waits until every instance together stays within the account limits of `key`."""
+    while True:
+        wait = await asyncio.to_thread(_next_wait, key, tokens)
+        if wait is None:
+            return
+        _check_deadline(key, wait)
+        logger.info(f"Rate limit window of {key} is full, waiting {wait:.2f}s")
+        # Jitter spreads the instances that were waiting over the new window
+        await asyncio.sleep(wait + random.uniform(0, 1))
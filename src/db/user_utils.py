@@ -24,6 +24,15 @@ def get_user_by_auth0_sub(db: Dict, auth0_sub: str) -> Dict:
     return user
 
 
+def find_user_by_id(db: Dict, user_id: str) -> Dict:
+    try:
+        user = db["users"].find_one({"_id": user_id})
+    except Exception as e:
+        raise UserNotFoundException(f"Database query failed: {e}")
+    
+    return user
+
+
 def update_user(db: Dict, update_filter: Dict, update_data: Dict) -> None:
     try:
         db["users"].update_one(
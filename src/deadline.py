@@ -0,0 +1,48 @@
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+
+# Time always kept back at the end of a job to persist finished work
+PERSIST_RESERVE_SECONDS = float(os.environ.get("DEADLINE_PERSIST_RESERVE_SECONDS", "10"))
+# Image generation is skipped when less than this is left after the persist reserve
+IMAGE_STAGE_MIN_SECONDS = float(os.environ.get("DEADLINE_IMAGE_STAGE_MIN_SECONDS", "25"))
+# Budget for jobs that run without an invocation deadline (e.g. the worker)
+DEFAULT_JOB_TIMEOUT_SECONDS = float(os.environ.get("JOB_TIMEOUT_SECONDS", "180"))
+
+
+class Deadline:
+    """A point in time, on the monotonic clock, by which a job has to be finished."""
+
+    def __init__(self, expires_at: float):
+        self.expires_at = expires_at
+
+    @classmethod
+    def from_timeout(cls, seconds: float) -> "Deadline":
+        return cls(time.monotonic() + seconds)
+
+    @classmethod
+    def from_lambda_context(cls, context) -> "Deadline":
+        return cls.from_timeout(context.get_remaining_time_in_millis() / 1000)
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def budget(self, reserve: float = PERSIST_RESERVE_SECONDS) -> float:
+        """Time left for work once `reserve` is kept back."""
+        return max(0.0, self.remaining() - reserve)
+
+    def expired(self, reserve: float = PERSIST_RESERVE_SECONDS) -> bool:
+        return self.budget(reserve) <= 0
+
+
+current_deadline: ContextVar[Optional[Deadline]] = ContextVar("deadline", default=None)
+
+
+def get_call_timeout(default: float) -> float:
+    """Timeout for a single outbound call: `default`, shortened to the current job budget."""
+    deadline = current_deadline.get()
+    if deadline is None:
+        return default
+    return max(1.0, min(default, deadline.budget()))
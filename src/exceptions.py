@@ -16,6 +16,9 @@ class LLMProviderInstantiationFailedException(Exception):
 class LLMProviderUnsupportedModelException(Exception):
     """LLMCompletionException is raised for errors during LLM completion requests."""
 
+class RateLimitExceededException(Exception):
+    """RateLimitExceededException is raised when a shared rate limit leaves no capacity before the job deadline."""
+
 class LLMAPIKeyMissingError(Exception):
     """LLMAPIKeyMissingError is raised when the API key for the LLM provider is missing."""
 
@@ -25,6 +28,12 @@ class JobNotFoundException(Exception):
 class JobStatusUpdateFailedException(Exception):
     """JobStatusUpdateFailedException is raised when updating a job's status fails."""
 
+class JobAlreadyClaimedException(Exception):
+    """JobAlreadyClaimedException is raised when a job is held by another invocation's unexpired lease."""
+
+class JobLeaseLostException(Exception):
+    """JobLeaseLostException is raised when a running job's lease is taken over by another invocation."""
+
 class JobPromptUpdateFailedException(Exception):
  """JobPromprUpdateFailedException is raised when updating a job's status fails."""
 
@@ -14,6 +14,16 @@ class JobStatus(str, Enum):
     SUBMITTED = "SUBMITTED"
     RUNNING = "RUNNING"
     COMPLETED = "COMPLETED"
+    FAILED = "FAILED"
+
+class JobMode(str, Enum):
+    GENERATE = "generate"
+    REGENERATE_FAILED = "regenerate_failed"
+
+class PlanningStep(str, Enum):
+    BRIEF = "brief"
+    SITEMAP = "sitemap"
+    SUB_PROMPTS = "sub_prompts"
 
 class ComponentStatus(str, Enum):
     PENDING = "PENDING"
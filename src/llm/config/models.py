@@ -1,5 +1,6 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
+from typing import List
 
 
 @dataclass
@@ -14,6 +15,10 @@ class LLMModelConfig:
     description: str
     max_tokens: int
     temperature_options: TemperatureOptions
+    # Initial concurrent component generation calls to this model in one process, adapted at runtime (see concurrency.py)
+    max_in_flight: int = 6
+    # Models tried in order by the async provider while this one's circuit breaker is open or it fails
+    fallback_models: List[str] = field(default_factory=list)
     
 MAX_TOKENS_OPENAI = 8192
 class LLMAvailableModels(Enum):
@@ -34,7 +39,8 @@ class LLMAvailableModels(Enum):
         temperature_options=TemperatureOptions(
             default=1,
             creative=1.0,
-        )
+        ),
+        fallback_models=["gemini-3-flash-preview"]
     )
 
     GPT_o3 = LLMModelConfig(
@@ -74,7 +80,8 @@ class LLMAvailableModels(Enum):
         temperature_options=TemperatureOptions(
             default=0.7,
             creative=1.0
-        )
+        ),
+        fallback_models=["gemini-3-flash-preview", "gpt-5-mini"]
     )
 
     GEMINI_3_FLASH = LLMModelConfig(
@@ -84,7 +91,8 @@ class LLMAvailableModels(Enum):
         temperature_options=TemperatureOptions(
             default=0.7,
             creative=1.0
-        )
+        ),
+        fallback_models=["gpt-5-mini"]
     )
 
     @classmethod
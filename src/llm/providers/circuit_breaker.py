@@ -0,0 +1,129 @@
+import os
+import time
+from collections import deque
+from enum import Enum
+from typing import Deque, Dict, Tuple
+
+from exceptions import LLMProviderCompletionFailedException
+from llm.providers.retry import RETRYABLE_EXCEPTIONS, error_status_code
+from logs import logger
+
+# Recent calls the error and slow-call rates are computed over
+BREAKER_WINDOW = int(os.environ.get("LLM_BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.environ.get("LLM_BREAKER_MIN_CALLS", "5"))
+# The breaker opens when either rate reaches its threshold
+BREAKER_ERROR_RATE = float(os.environ.get("LLM_BREAKER_ERROR_RATE", "0.5"))
+BREAKER_SLOW_CALL_RATE = float(os.environ.get("LLM_BREAKER_SLOW_CALL_RATE", "0.8"))
+BREAKER_SLOW_CALL_SECONDS = float(os.environ.get("LLM_BREAKER_SLOW_CALL_SECONDS", "90"))
+# Time an open breaker rejects calls before letting a single probe through
+BREAKER_OPEN_SECONDS = float(os.environ.get("LLM_BREAKER_OPEN_SECONDS", "30"))
+
+
+class BreakerState(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Tracks the recent error rate and latency of one model. While open, calls are
+    rejected without being sent; after BREAKER_OPEN_SECONDS one probe call is let
+    through and its outcome closes or reopens the breaker.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = BreakerState.CLOSED
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        # (failed, slow) per recent call
+        self._calls: Deque[Tuple[bool, bool]] = deque(maxlen=BREAKER_WINDOW)
+
+    def allow_request(self) -> bool:
+        if self.state == BreakerState.CLOSED:
+            return True
+
+        if self.state == BreakerState.OPEN:
+            if time.monotonic() - self.opened_at < BREAKER_OPEN_SECONDS:
+                return False
+            self.state = BreakerState.HALF_OPEN
+            self._probe_in_flight = False
+
+        if self._probe_in_flight:
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def record_success(self, latency: float) -> None:
+        slow = latency >= BREAKER_SLOW_CALL_SECONDS
+        if self.state == BreakerState.HALF_OPEN:
+            if slow:
+                self._open()
+            else:
+                logger.info(f"Circuit breaker for {self.name} closed")
+                self.state = BreakerState.CLOSED
+                self._calls.clear()
+            return
+
+        self._calls.append((False, slow))
+        self._evaluate()
+
+    def record_failure(self) -> None:
+        if self.state == BreakerState.HALF_OPEN:
+            self._open()
+            return
+
+        self._calls.append((True, False))
+        self._evaluate()
+
+    def release_probe(self) -> None:
+        """Lets another probe through when one ended without an outcome, e.g. cancelled."""
+        self._probe_in_flight = False
+
+    def _evaluate(self) -> None:
+        if self.state != BreakerState.CLOSED or len(self._calls) < BREAKER_MIN_CALLS:
+            return
+
+        error_rate = sum(1 for failed, _ in self._calls if failed) / len(self._calls)
+        slow_rate = sum(1 for _, slow in self._calls if slow) / len(self._calls)
+        if error_rate >= BREAKER_ERROR_RATE or slow_rate >= BREAKER_SLOW_CALL_RATE:
+            logger.warning(f"Circuit breaker for {self.name}: error rate {error_rate:.2f}, slow call rate {slow_rate:.2f}")
+            self._open()
+
+    def _open(self) -> None:
+        logger.warning(f"Circuit breaker for {self.name} opened for {BREAKER_OPEN_SECONDS}s")
+        self.state = BreakerState.OPEN
+        self.opened_at = time.monotonic()
+        self._probe_in_flight = False
+        self._calls.clear()
+
+
+def is_model_failure(error: BaseException) -> bool:
+    """
+    Whether an error says the model's service is unhealthy: a transport error, a
+    timeout or a 5xx. Rate limits, safety blocks and other rejected requests are not.
+    """
+    # Providers wrap the SDK error they failed with, possibly more than once
+    while isinstance(error, LLMProviderCompletionFailedException):
+        cause = error.__cause__ or error.__context__
+        if cause is None:
+            break
+        error = cause
+
+    status_code = error_status_code(error)
+    if status_code is not None:
+        return status_code >= 500 or status_code == 408
+    return isinstance(error, RETRYABLE_EXCEPTIONS)
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_circuit_breaker(model_name: str) -> CircuitBreaker:
+    """Returns the process-wide breaker of a model, so concurrent jobs share its health."""
+    breaker = _breakers.get(model_name)
+    if breaker is None:
+        breaker = CircuitBreaker(model_name)
+        _breakers[model_name] = breaker
+    return breaker
@@ -0,0 +1,113 @@
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Mapping, Optional, TypeVar
+
+from llm.providers.retry import error_status_code
+from logs import logger
+
+T = TypeVar("T")
+
+CONCURRENCY_MIN = int(os.environ.get("LLM_CONCURRENCY_MIN", "1"))
+CONCURRENCY_MAX = int(os.environ.get("LLM_CONCURRENCY_MAX", "32"))
+# Multiplicative decrease applied on a 429 or an exhausted rate limit
+CONCURRENCY_BACKOFF = float(os.environ.get("LLM_CONCURRENCY_BACKOFF", "0.5"))
+# Decreases closer together than this count as one, a burst of 429s is a single signal
+CONCURRENCY_DECREASE_INTERVAL_SECONDS = float(os.environ.get("LLM_CONCURRENCY_DECREASE_INTERVAL_SECONDS", "5"))
+# The window stops growing when latency exceeds this multiple of the baseline
+CONCURRENCY_LATENCY_FACTOR = float(os.environ.get("LLM_CONCURRENCY_LATENCY_FACTOR", "2"))
+# ...or when less than this share of the provider's rate limit is left
+CONCURRENCY_HEADROOM = float(os.environ.get("LLM_CONCURRENCY_HEADROOM", "0.1"))
+
+_RATE_LIMIT_HEADERS = (
+    ("x-ratelimit-remaining-requests", "x-ratelimit-limit-requests"),
+    ("x-ratelimit-remaining-tokens", "x-ratelimit-limit-tokens")
+)
+
+
+class AdaptiveConcurrency:
+    """
+    Per-model concurrency window adjusted with AIMD: every healthy completion
+    grows it by 1/window (about +1 per window of calls), a 429 or an exhausted
+    rate limit halves it. Latency well above the baseline, or rate-limit headers
+    reporting little headroom, hold it where it is.
+    """
+
+    def __init__(self, name: str, initial: int, minimum: int = CONCURRENCY_MIN, maximum: int = CONCURRENCY_MAX):
+        self.name = name
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.window = float(min(self.maximum, max(self.minimum, initial)))
+        self._latency_baseline: Optional[float] = None
+        self._near_limit = False
+        self._last_decrease = 0.0
+
+    @property
+    def limit(self) -> int:
+        return int(self.window)
+
+    def on_success(self, latency: float) -> None:
+        congested = self._latency_baseline is not None and latency > CONCURRENCY_LATENCY_FACTOR * self._latency_baseline
+        # Slow moving average, so a congested period does not become the new normal right away
+        self._latency_baseline = latency if self._latency_baseline is None else 0.9 * self._latency_baseline + 0.1 * latency
+        if congested or self._near_limit:
+            return
+        self._resize(self.window + 1 / self.window)
+
+    def on_error(self, error: Exception) -> None:
+        if error_status_code(error) == 429:
+            self._decrease("rate limited")
+
+    def observe_headers(self, headers: Optional[Mapping[str, Any]]) -> None:
+        """Reads OpenAI style x-ratelimit-* headers, ignoring any that are missing or malformed."""
+        if not headers:
+            return
+
+        near_limit = False
+        for remaining_header, limit_header in _RATE_LIMIT_HEADERS:
+            try:
+                remaining = float(headers.get(remaining_header))
+                limit = float(headers.get(limit_header))
+            except (TypeError, ValueError):
+                continue
+            if limit <= 0:
+                continue
+            if remaining <= 0:
+                self._decrease(f"{remaining_header} exhausted")
+            near_limit = near_limit or remaining / limit < CONCURRENCY_HEADROOM
+        self._near_limit = near_limit
+
+    async def observe(self, request: Callable[[], Awaitable[T]]) -> T:
+        """Awaits a single provider request and feeds its outcome to the window."""
+        started_at = time.monotonic()
+        try:
+            result = await request()
+        except Exception as e:
+            self.on_error(e)
+            raise
+        self.on_success(time.monotonic() - started_at)
+        return result
+
+    def _decrease(self, reason: str) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease < CONCURRENCY_DECREASE_INTERVAL_SECONDS:
+            return
+        self._last_decrease = now
+        self._resize(self.window * CONCURRENCY_BACKOFF, reason)
+
+    def _resize(self, window: float, reason: str = "") -> None:
+        previous = self.limit
+        self.window = min(self.maximum, max(self.minimum, window))
+        if self.limit != previous:
+            logger.info(f"Concurrency window for {self.name}: {previous} -> {self.limit}" + (f" ({reason})" if reason else ""))
+
+
+_controllers: Dict[str, AdaptiveConcurrency] = {}
+
+
+def get_concurrency_controller(name: str, initial: int) -> AdaptiveConcurrency:
+    """Returns the process-wide window of a model; `initial` only applies on first use."""
+    controller = _controllers.get(name)
+    if controller is None:
+        controller = AdaptiveConcurrency(name, initial)
+        _controllers[name] = controller
+    return controller
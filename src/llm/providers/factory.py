@@ -1,30 +1,15 @@
-from enum import Enum
-
-
-from llm.config.models import LLMAvailableModels
+from llm.config.models import LLMAvailableModels, LLMModelConfig
 from llm.providers.base import LLMProvider
-from llm.providers.openai import OpenAIProvider, AsyncOpenAIProvider
-from llm.providers.google import GeminiProvider, AsyncGeminiProvider
+from llm.providers.openai import AsyncOpenAIProvider
+from llm.providers.google import AsyncGeminiProvider
+from llm.providers.failover import FailoverProvider
+from llm.providers.response_cache import CachedProvider
 from logs import logger
 
 
-class ProviderType(str, Enum):
-    SYNC = "sync"
-    ASYNC = "async" 
-
 class LLMFactory:
     """Factory to create appropriate LLM provider"""
     
-    _providers = {
-        LLMAvailableModels.GPT_4.value.name: {"class": OpenAIProvider, "config": LLMAvailableModels.GPT_4.value},
-        LLMAvailableModels.GPT_5_MINI.value.name: {"class": OpenAIProvider, "config": LLMAvailableModels.GPT_5_MINI.value},
-        LLMAvailableModels.GPT_o3.value.name: {"class": OpenAIProvider, "config": LLMAvailableModels.GPT_o3.value},
-        LLMAvailableModels.GPT_o4_MINI.value.name: {"class": OpenAIProvider, "config": LLMAvailableModels.GPT_o4_MINI.value},
-        LLMAvailableModels.GEMINI_2_5_PRO.value.name: {"class": GeminiProvider, "config": LLMAvailableModels.GEMINI_2_5_PRO.value},
-        LLMAvailableModels.GEMINI_3_PRO.value.name: {"class": GeminiProvider, "config": LLMAvailableModels.GEMINI_3_PRO.value},
-        LLMAvailableModels.GEMINI_3_FLASH.value.name: {"class": GeminiProvider, "config": LLMAvailableModels.GEMINI_3_FLASH.value}
-    }
-
     _async_providers = {
         LLMAvailableModels.GPT_4.value.name: {"class": AsyncOpenAIProvider, "config": LLMAvailableModels.GPT_4.value},
         LLMAvailableModels.GPT_o3.value.name: {"class": AsyncOpenAIProvider, "config": LLMAvailableModels.GPT_o3.value},
@@ -36,10 +21,8 @@ class LLMFactory:
     }
 
     @classmethod
-    def _create_provider_base(cls, model_name: str, provider_type: ProviderType) -> LLMProvider:
-        providers_dict = cls._providers if provider_type == ProviderType.SYNC else cls._async_providers
-
-        provider_data = providers_dict.get(model_name)
+    def _create_provider_base(cls, model_name: str) -> LLMProvider:
+        provider_data = cls._async_providers.get(model_name)
         if not provider_data:
             raise ValueError(f"Unsupported model: {model_name}")
 
@@ -55,9 +38,25 @@ class LLMFactory:
         return provider
 
     @classmethod
-    def create_provider(cls, model_name: str) -> LLMProvider:
-        return cls._create_provider_base(model_name, ProviderType.SYNC)
+    def get_model_config(cls, model_name: str) -> LLMModelConfig:
+        provider_data = cls._async_providers.get(model_name)
+        if not provider_data:
+            raise ValueError(f"Unsupported model: {model_name}")
+
+        return provider_data["config"]
 
     @classmethod
     def create_async_provider(cls, model_name: str) -> LLMProvider:
-        return cls._create_provider_base(model_name, ProviderType.ASYNC)
\ No newline at end of file
+        """
+        Async provider for `model_name` behind the response cache and its circuit
+        breaker, falling back to the model's configured `fallback_models` that are
+        available in this deployment.
+        """
+        providers = [(model_name, cls._create_provider_base(model_name))]
+        for fallback_model in cls.get_model_config(model_name).fallback_models:
+            try:
+                providers.append((fallback_model, cls._create_provider_base(fallback_model)))
+            except ValueError as e:
+                logger.warning(f"Skipping fallback model {fallback_model}: {e}")
+
+        return CachedProvider(FailoverProvider(providers))
\ No newline at end of file
@@ -0,0 +1,101 @@
+import time
+from contextvars import ContextVar
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from exceptions import LLMProviderCompletionFailedException
+from llm.providers.base import LLMProvider
+from llm.providers.circuit_breaker import CircuitBreaker, get_circuit_breaker, is_model_failure
+from llm.providers.schemas import ResponseSchema
+from logs import logger
+
+# Model of the chain that served the current task's last completion, read by CachedProvider
+served_model: ContextVar[Optional[str]] = ContextVar("served_model", default=None)
+
+
+def _record_error(breaker: CircuitBreaker, error: LLMProviderCompletionFailedException) -> None:
+    if is_model_failure(error):
+        breaker.record_failure()
+    else:
+        # Rate limits and rejected requests say nothing about the model's health
+        breaker.release_probe()
+
+
+class FailoverProvider(LLMProvider):
+    """
+    Async provider over a fallback chain of models, tried in order. A model whose
+    circuit breaker is open is skipped without being called, so a brownout costs
+    one hop to the next healthy model instead of a timeout per request. Only
+    transport errors, timeouts and 5xx count against a breaker.
+    """
+
+    def __init__(self, providers: List[Tuple[str, LLMProvider]]):
+        # (model_name, provider) in fallback order, the job's own model first
+        self.providers = providers
+        self.model_name = providers[0][0]
+
+    def is_available(self) -> bool:
+        return bool(self.providers)
+
+    async def completion(self, messages: List[Dict[str, str]], response_schema: ResponseSchema = ResponseSchema.COMPONENT) -> str:
+        errors = []
+        for model_name, provider in self.providers:
+            breaker = get_circuit_breaker(model_name)
+            if not breaker.allow_request():
+                errors.append(f"{model_name}: circuit open")
+                continue
+
+            started_at = time.monotonic()
+            try:
+                result = await provider.completion(messages, response_schema=response_schema)
+            except LLMProviderCompletionFailedException as e:
+                _record_error(breaker, e)
+                errors.append(f"{model_name}: {e}")
+                logger.warning(f"Completion with {model_name} failed, trying the next model in the chain")
+                continue
+            except BaseException:
+                breaker.release_probe()
+                raise
+
+            breaker.record_success(time.monotonic() - started_at)
+            served_model.set(model_name)
+            if model_name != self.model_name:
+                logger.info(f"Completion served by fallback model {model_name} instead of {self.model_name}")
+            return result
+
+        raise LLMProviderCompletionFailedException(f"No model in the fallback chain succeeded: {'; '.join(errors)}")
+
+    async def stream_completion(self, messages: List[Dict[str, str]], response_schema: ResponseSchema = ResponseSchema.SCREENS) -> AsyncIterator[str]:
+        """Falls back to the next model only while nothing has been yielded yet."""
+        errors = []
+        for model_name, provider in self.providers:
+            breaker = get_circuit_breaker(model_name)
+            if not breaker.allow_request():
+                errors.append(f"{model_name}: circuit open")
+                continue
+
+            started_at = time.monotonic()
+            # Streams run long by design, the breaker judges the time to the first chunk
+            first_chunk_latency = None
+            yielded = False
+            try:
+                async for chunk in provider.stream_completion(messages, response_schema=response_schema):
+                    if first_chunk_latency is None:
+                        first_chunk_latency = time.monotonic() - started_at
+                    yielded = True
+                    yield chunk
+            except LLMProviderCompletionFailedException as e:
+                _record_error(breaker, e)
+                if yielded:
+                    raise
+                errors.append(f"{model_name}: {e}")
+                logger.warning(f"Streaming with {model_name} failed, trying the next model in the chain")
+                continue
+            except BaseException:
+                breaker.release_probe()
+                raise
+
+            breaker.record_success(first_chunk_latency if first_chunk_latency is not None else time.monotonic() - started_at)
+            served_model.set(model_name)
+            return
+
+        raise LLMProviderCompletionFailedException(f"No model in the fallback chain succeeded: {'; '.join(errors)}")
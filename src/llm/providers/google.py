@@ -1,12 +1,21 @@
-import os
-from typing import List, Dict, Any
+from typing import AsyncIterator, List, Dict, Any
 
-import google.genai as genai
-from google.genai.types import SafetySetting, HarmCategory, GenerateContentConfig
-from llm.providers.schemas import GEMINI_GENERATOR_SCHEMA, COMPONENT_JSON_SCHEMA_TEXT
+from google.genai.types import SafetySetting, HarmCategory, GenerateContentConfig, HttpOptions
+from llm.providers.schemas import GEMINI_GENERATOR_SCHEMA, COMPONENT_JSON_SCHEMA_TEXT, ResponseSchema
 from llm.providers.factory import LLMProvider
 from exceptions import LLMAPIKeyMissingError, LLMProviderCompletionFailedException
 from logs import logger
+from clients import get_genai_client
+from deadline import get_call_timeout
+from llm.providers.hedging import hedged_call
+from llm.providers.retry import retry_async
+from llm.providers.concurrency import get_concurrency_controller
+from db.rate_limiter import acquire_rate_limit, estimate_tokens
+from llm.providers.key_pool import get_google_key_pool
+from llm.providers.prompt_cache import record_prompt_usage
+
+
+TIMEOUT = 120
 
 
 def _format_messages(messages: List[Dict[str, str]]) -> Dict[str, Any]:
@@ -22,97 +31,45 @@ def _format_messages(messages: List[Dict[str, str]]) -> Dict[str, Any]:
             contents = message["content"]
     return {"system_instruction": system_instruction, "contents": contents}
 
-class GeminiProvider(LLMProvider):
-    def __init__(self, model_name: str, config: Any):
-        self.api_key = os.environ.get("GOOGLE_API_KEY")
-        self.client = genai.Client(api_key=self.api_key) if self.api_key else None
-        self.model_name = model_name
-        self.config = config
-
-    def completion(self, messages: List[Dict[str, str]]) -> str:
-        if not self.client:
-            raise LLMAPIKeyMissingError("Google API key not configured")
-
-        try:
-
-            safety_settings: List[SafetySetting] = [
-                {"category": HarmCategory.HARM_CATEGORY_HARASSMENT, "threshold": "BLOCK_NONE"},
-                {"category": HarmCategory.HARM_CATEGORY_HATE_SPEECH, "threshold": "BLOCK_NONE"},
-                {"category": HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT, "threshold": "BLOCK_NONE"},
-                {"category": HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT, "threshold": "BLOCK_NONE"},
-            ]
-
-            formatted_messages = _format_messages(messages)
-
-            generation_config = GenerateContentConfig(
-                response_mime_type="application/json",
-                system_instruction=formatted_messages["system_instruction"],
-                safety_settings=safety_settings,
-                response_schema=GEMINI_GENERATOR_SCHEMA
-            )
-
-            
-            response = self.client.models.generate_content(
-                model=f"models/{self.model_name}",
-                contents=formatted_messages["contents"],
-                config=generation_config
-            )
 
-            if response.prompt_feedback and response.prompt_feedback.block_reason:
-                 raise LLMProviderCompletionFailedException(
-                    f"Content blocked by safety filters: {response.prompt_feedback.block_reason.name}"
-                )
-            
-            return response.text
+def _record_usage(model_name: str, usage_metadata) -> None:
+    # Gemini caches repeated prefixes implicitly, cached_content_token_count reports the hits
+    if usage_metadata is None:
+        return
+    record_prompt_usage(model_name, usage_metadata.prompt_token_count, usage_metadata.cached_content_token_count)
 
-        except Exception as e:
-            logger.error(f"Gemini API request failed: {str(e)}")
-            raise LLMProviderCompletionFailedException(f"Gemini API request failed: {str(e)}")
-
-    def is_available(self) -> bool:
-        return self.client
-        
-    def close(self):
-        """Closes the underlying client session if applicable."""
-        if self.client and hasattr(self.client, "close"):
-            try:
-                self.client.close()
-            except Exception as e:
-                logger.warning(f"Failed to close Gemini sync client: {e}")
-    
 
 class AsyncGeminiProvider(LLMProvider):
     def __init__(self, model_name: str, config: Any):
-        self.api_key = os.environ.get("GOOGLE_API_KEY")
+        # Clients are shared per container and key, see clients.py
+        self.key_pool = get_google_key_pool()
         self.model_name = model_name
         self.config = config
-        
-        if self.api_key:
-            self.client = genai.Client(api_key=self.api_key)
-            self.async_client = self.client.aio
-        else:
-            self.client = None
-            self.async_client = None
-
+        self.concurrency = get_concurrency_controller(model_name, config.max_in_flight)
 
-    async def completion(self, messages: List[Dict[str, str]]) -> str:
-        if not self.async_client:
-            raise LLMAPIKeyMissingError("Google API key not configured")
 
-        try:
+    def _build_generation_config(self, system_instruction: str, response_schema: ResponseSchema) -> GenerateContentConfig:
+        safety_settings: List[SafetySetting] = [
+            {"category": HarmCategory.HARM_CATEGORY_HARASSMENT, "threshold": "BLOCK_NONE"},
+            {"category": HarmCategory.HARM_CATEGORY_HATE_SPEECH, "threshold": "BLOCK_NONE"},
+            {"category": HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT, "threshold": "BLOCK_NONE"},
+            {"category": HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT, "threshold": "BLOCK_NONE"},
+        ]
 
-            safety_settings: List[SafetySetting] = [
-                {"category": HarmCategory.HARM_CATEGORY_HARASSMENT, "threshold": "BLOCK_NONE"},
-                {"category": HarmCategory.HARM_CATEGORY_HATE_SPEECH, "threshold": "BLOCK_NONE"},
-                {"category": HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT, "threshold": "BLOCK_NONE"},
-                {"category": HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT, "threshold": "BLOCK_NONE"},
-            ]
+        # Bound every call by the remaining job budget (HttpOptions timeout is in ms)
+        http_options = HttpOptions(timeout=int(get_call_timeout(TIMEOUT) * 1000))
 
-            formatted_messages = _format_messages(messages)
+        if response_schema == ResponseSchema.SCREENS:
+            return GenerateContentConfig(
+                response_mime_type="application/json",
+                system_instruction=system_instruction,
+                safety_settings=safety_settings,
+                response_schema=GEMINI_GENERATOR_SCHEMA,
+                http_options=http_options
+            )
 
-            system_instruction = formatted_messages["system_instruction"]
-            if system_instruction:
-                schema_section = f"""
+        if system_instruction:
+            schema_section = f"""
                     <json_schema>
                     Your output MUST conform to the following JSON schema. This schema defines the exact structure, property types, and valid values for the component tree. Pay special attention to:
                     - The "children" property uses "$ref": "#" which means it recursively references the root schema - children can contain the same structure as the parent
@@ -125,58 +82,80 @@ class AsyncGeminiProvider(LLMProvider):
                     </json_schema>
 
                     """
-                system_instruction = schema_section + system_instruction
+            system_instruction = schema_section + system_instruction
 
-            generation_config = GenerateContentConfig(
-                response_mime_type="application/json",
-                system_instruction=system_instruction,
-                safety_settings=safety_settings
-            )
+        return GenerateContentConfig(
+            response_mime_type="application/json",
+            system_instruction=system_instruction,
+            safety_settings=safety_settings,
+            http_options=http_options
+        )
+
+    async def completion(self, messages: List[Dict[str, str]], response_schema: ResponseSchema = ResponseSchema.COMPONENT) -> str:
+        if not self.key_pool:
+            raise LLMAPIKeyMissingError("Google API key not configured")
+
+        async def request() -> str:
+            # Every attempt, hedges included, leases capacity from the limit shared by all instances
+            await acquire_rate_limit(self.model_name, estimate_tokens(messages))
+            formatted_messages = _format_messages(messages)
+            generation_config = self._build_generation_config(formatted_messages["system_instruction"], response_schema)
 
-            response = await self.async_client.models.generate_content(
+            # ...and goes to the key with the most headroom, see key_pool.py
+            response = await self.key_pool.call(lambda api_key: self.concurrency.observe(lambda: get_genai_client(api_key).aio.models.generate_content(
                 model=self.model_name,
                 contents=formatted_messages["contents"],
                 config=generation_config
-            )
+            )))
+            self.concurrency.observe_headers(getattr(getattr(response, "sdk_http_response", None), "headers", None))
 
             if response.prompt_feedback and response.prompt_feedback.block_reason:
                  raise LLMProviderCompletionFailedException(
                     f"Content blocked by safety filters: {response.prompt_feedback.block_reason.name}"
                 )
-            
+
+            _record_usage(self.model_name, response.usage_metadata)
             return response.text
 
+        try:
+            # Transient errors are retried and slow calls may be duplicated, see retry.py and hedging.py
+            return await retry_async(self.model_name, lambda: hedged_call(self.model_name, response_schema.value, request))
+
         except Exception as e:
             logger.error(f"Gemini API request failed: {str(e)}")
             raise LLMProviderCompletionFailedException(f"Gemini API request failed: {str(e)}")
 
-    def is_available(self) -> bool:
-        return self.async_client
-        
-    async def close(self):
-        """Closes the underlying client session."""
+    async def stream_completion(self, messages: List[Dict[str, str]], response_schema: ResponseSchema = ResponseSchema.SCREENS) -> AsyncIterator[str]:
+        """Yields the completion text in chunks as the model produces it."""
+        if not self.key_pool:
+            raise LLMAPIKeyMissingError("Google API key not configured")
+
         try:
-            if self.async_client:
-                # Attempt to find the underlying aiohttp session hidden in the client
-                # Structure found via inspection: async_client._api_client._aiohttp_session
-                if hasattr(self.async_client, "_api_client"):
-                    api_client = self.async_client._api_client
-                    if hasattr(api_client, "_aiohttp_session") and api_client._aiohttp_session:
-                        await api_client._aiohttp_session.close()
-                
-                # Also try standard close if it exists (it returned False in inspection but good practice)
-                if hasattr(self.async_client, "close"):
-                    await self.async_client.close()
+            await acquire_rate_limit(self.model_name, estimate_tokens(messages))
+            formatted_messages = _format_messages(messages)
+            generation_config = self._build_generation_config(formatted_messages["system_instruction"], response_schema)
 
-        except Exception as e:
-            logger.warning(f"Error during AsyncGeminiProvider cleanup: {e}")
+            # Only opening the stream is retried, chunks already yielded cannot be taken back
+            stream = await retry_async(self.model_name, lambda: self.key_pool.call(lambda api_key: get_genai_client(api_key).aio.models.generate_content_stream(
+                model=self.model_name,
+                contents=formatted_messages["contents"],
+                config=generation_config
+            )))
+            usage_metadata = None
+            async for chunk in stream:
+                if chunk.prompt_feedback and chunk.prompt_feedback.block_reason:
+                    raise LLMProviderCompletionFailedException(
+                        f"Content blocked by safety filters: {chunk.prompt_feedback.block_reason.name}"
+                    )
+                # Every chunk carries the usage so far, the last one the total
+                usage_metadata = chunk.usage_metadata or usage_metadata
+                if chunk.text:
+                    yield chunk.text
+            _record_usage(self.model_name, usage_metadata)
 
-        # Sync client cleanup
-        if self.client and hasattr(self.client, "close"):
-            try:
-                self.client.close()
-            except: pass
+        except Exception as e:
+            logger.error(f"Gemini API streaming request failed: {str(e)}")
+            raise LLMProviderCompletionFailedException(f"Gemini API streaming request failed: {str(e)}")
 
-        # Allow time for underlying aiohttp connector to close
-        import asyncio
-        await asyncio.sleep(0.250)
\ No newline at end of file
+    def is_available(self) -> bool:
+        return bool(self.key_pool)
@@ -0,0 +1,144 @@
+import asyncio
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+from logs import logger
+
+HEDGING_ENABLED = os.environ.get("LLM_HEDGING_ENABLED", "false").lower() == "true"
+# A duplicate request is sent once a call is slower than this percentile of recent calls
+HEDGE_PERCENTILE = float(os.environ.get("LLM_HEDGE_PERCENTILE", "95"))
+# Recent calls kept per model and response schema, and how many are needed before hedging
+HEDGE_WINDOW = int(os.environ.get("LLM_HEDGE_WINDOW", "200"))
+HEDGE_MIN_SAMPLES = int(os.environ.get("LLM_HEDGE_MIN_SAMPLES", "20"))
+# Upper bound on the share of calls that may be hedged, which caps the extra spend
+HEDGE_MAX_RATE = float(os.environ.get("LLM_HEDGE_MAX_RATE", "0.1"))
+
+
+class LatencyTracker:
+    """Sliding window of recent completion latencies."""
+
+    def __init__(self, window: int = HEDGE_WINDOW):
+        self._latencies: Deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self._latencies.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._latencies)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(round(percentile / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+
+@dataclass
+class HedgeStats:
+    calls: int = 0
+    hedged: int = 0
+    hedge_wins: int = 0
+    # Lower bound: time the cancelled primary had run beyond the winning hedge's latency
+    latency_saved: float = 0.0
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "calls": self.calls,
+            "hedged": self.hedged,
+            "hedge_rate": round(self.hedged / self.calls, 3) if self.calls else 0.0,
+            "hedge_wins": self.hedge_wins,
+            "latency_saved": round(self.latency_saved, 3)
+        }
+
+
+_trackers: Dict[Tuple[str, str], LatencyTracker] = {}
+_stats: Dict[str, HedgeStats] = {}
+
+
+def get_latency_tracker(model_name: str, kind: str) -> LatencyTracker:
+    """Process-wide tracker per model and kind of call, whose latencies differ widely."""
+    tracker = _trackers.get((model_name, kind))
+    if tracker is None:
+        tracker = LatencyTracker()
+        _trackers[(model_name, kind)] = tracker
+    return tracker
+
+
+def get_hedge_stats(model_name: str) -> HedgeStats:
+    stats = _stats.get(model_name)
+    if stats is None:
+        stats = HedgeStats()
+        _stats[model_name] = stats
+    return stats
+
+
+async def _first_valid(primary: asyncio.Task, hedge: asyncio.Task) -> Tuple[asyncio.Task, str]:
+    """Waits for the first of two attempts that succeeds; raises the primary's error if both fail."""
+    pending = {primary, hedge}
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is None:
+                return task, task.result()
+    return primary, primary.result()
+
+
+async def hedged_call(model_name: str, kind: str, request: Callable[[], Awaitable[str]]) -> str:
+    """
+    Runs `request`, and when it is slower than HEDGE_PERCENTILE of the recent
+    latencies of this model and kind, sends a duplicate. The first valid response
+    wins and the other attempt is cancelled. Without hedging enabled, or until
+    enough latencies are known, it is a plain await.
+    """
+    tracker = get_latency_tracker(model_name, kind)
+    stats = get_hedge_stats(model_name)
+    stats.calls += 1
+
+    threshold = tracker.percentile(HEDGE_PERCENTILE) if len(tracker) >= HEDGE_MIN_SAMPLES else None
+    if not HEDGING_ENABLED or threshold is None:
+        started_at = time.monotonic()
+        result = await request()
+        tracker.record(time.monotonic() - started_at)
+        return result
+
+    started_at = time.monotonic()
+    primary = asyncio.create_task(request())
+    hedge: Optional[asyncio.Task] = None
+    try:
+        done, _ = await asyncio.wait({primary}, timeout=threshold)
+        if done or stats.hedged >= HEDGE_MAX_RATE * stats.calls:
+            result = await primary
+            tracker.record(time.monotonic() - started_at)
+            return result
+
+        stats.hedged += 1
+        hedge_started_at = time.monotonic()
+        logger.info(f"Hedging {model_name} {kind} call after {threshold:.2f}s")
+        hedge = asyncio.create_task(request())
+        winner, result = await _first_valid(primary, hedge)
+        finished_at = time.monotonic()
+
+        if winner is hedge:
+            hedge_latency = finished_at - hedge_started_at
+            tracker.record(hedge_latency)
+            stats.hedge_wins += 1
+            if not primary.done():
+                # The primary is cancelled now, the time it ran is a lower bound of its latency.
+                # Recorded too, so slow tails keep their weight in the percentile.
+                primary_elapsed = finished_at - started_at
+                tracker.record(primary_elapsed)
+                stats.latency_saved += max(0.0, primary_elapsed - hedge_latency)
+        else:
+            tracker.record(finished_at - started_at)
+
+        logger.info(f"Hedged {model_name} {kind} call won by the {'hedge' if winner is hedge else 'primary'}: {stats.summary()}")
+        return result
+    finally:
+        for task in (primary, hedge):
+            if task is not None and not task.done():
+                task.cancel()
+        await asyncio.gather(*(task for task in (primary, hedge) if task is not None), return_exceptions=True)
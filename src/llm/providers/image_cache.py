@@ -0,0 +1,116 @@
+import asyncio
+import hashlib
+import os
+import re
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+from urllib.parse import urlparse
+
+from aws.db_connection import get_db
+from db.image_index import find_image_urls, store_image_urls
+from llm.providers.response_cache import cache_bypass
+from logs import logger
+
+IMAGE_CACHE_ENABLED = os.environ.get("IMAGE_CACHE_ENABLED", "true").lower() == "true"
+IMAGE_CACHE_MEMORY_ENTRIES = int(os.environ.get("IMAGE_CACHE_MEMORY_ENTRIES", "2048"))
+
+
+@dataclass
+class ImageCacheStats:
+    memory_hits: int = 0
+    db_hits: int = 0
+    misses: int = 0
+
+    def summary(self) -> Dict[str, float]:
+        hits = self.memory_hits + self.db_hits
+        lookups = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0
+        }
+
+
+_stats = ImageCacheStats()
+# Prompt key -> URL, in front of the shared index
+_urls: "OrderedDict[str, str]" = OrderedDict()
+
+
+def get_image_cache_stats() -> ImageCacheStats:
+    return _stats
+
+
+def normalize_image_prompt(prompt: str) -> str:
+    """Case, whitespace and surrounding punctuation do not change the image a prompt describes."""
+    return re.sub(r"\s+", " ", prompt.lower()).strip(" .,;:!?\"'")
+
+
+def image_prompt_key(model_name: str, prompt: str, variant: int = 0) -> str:
+    """Key of the image of a prompt; variant n > 0 is another image of the same prompt."""
+    suffix = f"\n{variant}" if variant else ""
+    return hashlib.sha256(f"{model_name}\n{normalize_image_prompt(prompt)}{suffix}".encode("utf-8")).hexdigest()
+
+
+def _remember(key: str, url: str) -> None:
+    _urls[key] = url
+    _urls.move_to_end(key)
+    while len(_urls) > IMAGE_CACHE_MEMORY_ENTRIES:
+        _urls.popitem(last=False)
+
+
+def _enabled() -> bool:
+    return IMAGE_CACHE_ENABLED and not cache_bypass.get()
+
+
+async def find_cached_image_urls(keys: List[str]) -> Dict[str, str]:
+    """URLs of images already generated for any of the `image_prompt_key`s in `keys`."""
+    if not _enabled() or not keys:
+        return {}
+
+    keys = set(keys)
+    found: Dict[str, str] = {}
+    for key in keys:
+        url = _urls.get(key)
+        if url is not None:
+            _urls.move_to_end(key)
+            found[key] = url
+            _stats.memory_hits += 1
+
+    missing = [key for key in keys if key not in found]
+    if missing:
+        try:
+            stored = await asyncio.to_thread(find_image_urls, get_db(), missing)
+        except Exception as e:
+            # The cache saves generations, it must not fail them
+            logger.warning(f"Image cache database tier unavailable: {e}")
+            stored = {}
+        for key, url in stored.items():
+            _remember(key, url)
+            found[key] = url
+        _stats.db_hits += len(stored)
+        _stats.misses += len(missing) - len(stored)
+
+    return found
+
+
+async def store_image_urls_for_prompts(model_name: str, images: Dict[str, Tuple[str, str]]) -> None:
+    """Indexes freshly uploaded images, image_prompt_key -> (prompt, url), so later components and jobs reuse them."""
+    if not _enabled() or not images:
+        return
+
+    entries = {}
+    for key, (prompt, url) in images.items():
+        _remember(key, url)
+        entries[key] = {
+            "prompt": normalize_image_prompt(prompt),
+            "model": model_name,
+            "s3_key": urlparse(url).path.lstrip("/"),
+            "url": url
+        }
+
+    try:
+        await asyncio.to_thread(store_image_urls, get_db(), entries)
+    except Exception as e:
+        logger.warning(f"Failed to index {len(entries)} images for reuse: {e}")
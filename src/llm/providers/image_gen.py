@@ -2,16 +2,30 @@ import os
 import asyncio
 import base64
 from typing import List, Dict, Tuple
-from google import genai
 from google.genai import types
 from logs import logger
+from clients import get_genai_client
+from workflows.scheduler import get_scheduler
+from llm.providers.key_pool import KeyPool, get_google_key_pool
+from db.rate_limiter import acquire_rate_limit
+from llm.providers.image_cache import image_prompt_key
 
 # Models
 # Fallback to standard Imagen 3 model as fast variant was# Models
 IMAGEN_3_FAST = "models/imagen-4.0-fast-generate-001" 
 GEMINI_2_5_FLASH = "gemini-2.5-flash-image"
 
-async def _generate_single_image_set(client, model_name: str, prompt: str, count: int = 1) -> List[bytes]:
+# Initial image requests in flight per process, adapted at runtime (see concurrency.py)
+IMAGE_MAX_IN_FLIGHT = int(os.environ.get("IMAGE_MAX_IN_FLIGHT", "8"))
+# Repeats of a prompt within a component, e.g. the cards of a list, get different images
+IMAGE_DISTINCT_VARIANTS = os.environ.get("IMAGE_DISTINCT_VARIANTS", "true").lower() == "true"
+# Imagen returns at most 4 images per request
+IMAGES_PER_REQUEST = 4
+
+# Shared image requests in flight per normalised prompt, so concurrent components reuse one generation
+_in_flight: Dict[str, asyncio.Future] = {}
+
+async def _generate_single_image_set(key_pool: KeyPool, model_name: str, prompt: str, count: int = 1) -> List[bytes]:
     """Generates images for a single prompt."""
     try:
         # Gemini 2.5 Flash Image uses generate_images or generate_content
@@ -20,91 +34,108 @@ async def _generate_single_image_set(client, model_name: str, prompt: str, count
         # Let's assume the standard client.models.generate_images works for it if it's in the list.
         # If not, we might need a fallback to generate_content, but let's try this standard path.
 
-        response = await client.models.generate_images(
-            model=model_name,
-            prompt=prompt,
-            config=types.GenerateImagesConfig(
-                number_of_images=count,
-            )
-        )
+        # Image slots are shared fairly between users like component slots, see scheduler.py
+        scheduler = get_scheduler(model_name, IMAGE_MAX_IN_FLIGHT)
+
+        async def request():
+            await acquire_rate_limit(model_name)
+            # Shared per container and key, see clients.py and key_pool.py
+            return await key_pool.call(lambda api_key: scheduler.controller.observe(lambda: get_genai_client(api_key).aio.models.generate_images(
+                model=model_name,
+                prompt=prompt,
+                config=types.GenerateImagesConfig(
+                    number_of_images=count,
+                )
+            )))
+
+        response = await scheduler.submit(request, label=f"image '{prompt[:30]}'")
         return [img.image.image_bytes for img in response.generated_images]
 
     except Exception as e:
         logger.error(f"Image generation failed for prompt '{prompt[:30]}...' with model {model_name}: {e}")
         return []
 
-async def generate_images_concurrently(component_prompts: Dict[str, List[str]]) -> Dict[str, List[bytes]]:
+async def _generate_shared_image(key_pool: KeyPool, model_name: str, prompt: str) -> List[bytes]:
+    """
+    Generates one image for `prompt`, joining the request already in flight for
+    the same normalised prompt when there is one.
+    """
+    key = image_prompt_key(model_name, prompt)
+    task = _in_flight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_generate_single_image_set(key_pool, model_name, prompt, count=1))
+        _in_flight[key] = task
+        task.add_done_callback(lambda _: _in_flight.pop(key, None))
+    # A caller that times out must not cancel the generation other components are waiting on
+    return await asyncio.shield(task)
+
+
+async def generate_images_concurrently(component_prompts: Dict[str, List[str]], distinct_variants: bool = False) -> Dict[str, List[bytes]]:
     """
     Generates images concurrently for multiple components.
-    
+
+    Prompts are grouped after normalisation. By default a group is generated
+    once, joining any request for it already in flight in this process, and its
+    image is shared by every occurrence. With `distinct_variants` every
+    occurrence gets its own image, batched through `number_of_images` up to
+    IMAGES_PER_REQUEST per request; a group of one still joins the request in flight.
+
     Args:
         component_prompts: Dictionary mapping component_id to a list of prompt strings.
                            (e.g., {"comp1": ["avatar description"], "comp2": ["header bg"]})
-    
+        distinct_variants: Whether repeated prompts should get different images.
+
     Returns:
         Dictionary mapping component_id to a list of generated image bytes.
     """
-    api_key = os.environ.get("GOOGLE_API_KEY")
-    if not api_key:
-        logger.error("GOOGLE_API_KEY not set")
+    key_pool = get_google_key_pool()
+    if not key_pool:
+        logger.error("GOOGLE_API_KEYS or GOOGLE_API_KEY not set")
         return {}
 
-    raw_client = genai.Client(api_key=api_key)
-    client = raw_client.aio
-    
-    try:
-        # Try primary model first, fallback logic could be complex concurrently.
-        # For now, we fix to IMAGEN_3_FAST as per plan.
-        model_name = IMAGEN_3_FAST
-        tasks = []
-        metadata = [] # (component_id, prompt_index)
-
-        for component_id, prompts in component_prompts.items():
-            for i, prompt in enumerate(prompts):
-                metadata.append(component_id)
-                # We generate 1 image per prompt for now. 
-                tasks.append(_generate_single_image_set(client, model_name, prompt, count=1))
-
-        logger.info(f"Starting concurrent image generation for {len(tasks)} prompts using {model_name}")
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-    finally:
-        try:
-            # Deep cleanup to find the underlying aiohttp session
-            if hasattr(client, "_api_client"):
-                api_client = client._api_client
-                if hasattr(api_client, "_aiohttp_session") and api_client._aiohttp_session:
-                    await api_client._aiohttp_session.close()
-
-            if hasattr(client, "close"):
-                await client.close()
-        except Exception as e:
-            logger.warning(f"Error closing image gen client: {e}")
-        
-        if hasattr(raw_client, "close"):
-            try:
-                raw_client.close()
-            except:
-                pass
-
-        # Allow time for underlying aiohttp connector to close
-        await asyncio.sleep(0.250)
-        # Hack/Workaround for aiohttp session inside genai client if plain close doesn't work well
-        # or if it is inside .aio
-    
-    # ... (process results)
-    
+    # Try primary model first, fallback logic could be complex concurrently.
+    # For now, we fix to IMAGEN_3_FAST as per plan.
+    model_name = IMAGEN_3_FAST
+
+    prompts_by_key: Dict[str, str] = {}
+    group_sizes: Dict[str, int] = {}
+    occurrences: List[Tuple[str, str, int]] = []  # (component_id, prompt key, index within its group)
+    for component_id, prompts in component_prompts.items():
+        for prompt in prompts:
+            key = image_prompt_key(model_name, prompt)
+            prompts_by_key.setdefault(key, prompt)
+            occurrences.append((component_id, key, group_sizes.get(key, 0)))
+            group_sizes[key] = group_sizes.get(key, 0) + 1
+
+    keys, tasks = [], []
+    for key, prompt in prompts_by_key.items():
+        if not distinct_variants or group_sizes[key] == 1:
+            keys.append(key)
+            tasks.append(_generate_shared_image(key_pool, model_name, prompt))
+            continue
+        for start in range(0, group_sizes[key], IMAGES_PER_REQUEST):
+            keys.append(key)
+            tasks.append(_generate_single_image_set(key_pool, model_name, prompt, count=min(IMAGES_PER_REQUEST, group_sizes[key] - start)))
+
+    logger.info(f"Starting concurrent image generation for {len(occurrences)} prompts ({len(prompts_by_key)} distinct) in {len(tasks)} requests using {model_name}")
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    images_by_key: Dict[str, List[bytes]] = {}
+    for key, result in zip(keys, results):
+        if isinstance(result, list):
+            images_by_key.setdefault(key, []).extend(result)
+
+    # Fan the images back out to every occurrence, in the order the prompts were given
     final_images: Dict[str, List[bytes]] = {}
+    for component_id, key, index in occurrences:
+        images = images_by_key.get(key, [])
+        if not distinct_variants:
+            index = 0
 
-    for i, result in enumerate(results):
-        component_id = metadata[i]
-        
-        if component_id not in final_images:
-            final_images[component_id] = []
-            
-        if isinstance(result, list) and result:
-            # Result is a list of bytes (we requested 1, so list of 1)
-            final_images[component_id].extend(result)
+        final_images.setdefault(component_id, [])
+        if index < len(images):
+            final_images[component_id].append(images[index])
         else:
-             logger.warning(f"No images generated for component {component_id} (index {i})")
+            logger.warning(f"No image generated for component {component_id} (prompt '{prompts_by_key[key][:30]}')")
 
     return final_images
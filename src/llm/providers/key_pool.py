@@ -0,0 +1,132 @@
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, TypeVar
+
+from llm.providers.retry import error_status_code, retry_after_seconds
+from logs import logger
+
+T = TypeVar("T")
+
+# Time a key that returned 429 is avoided when no Retry-After hint says otherwise
+KEY_COOLDOWN_SECONDS = float(os.environ.get("API_KEY_COOLDOWN_SECONDS", "30"))
+# Rate-limit headers older than this no longer describe the key's headroom
+KEY_HEADROOM_TTL_SECONDS = 60.0
+
+
+@dataclass
+class _KeyState:
+    index: int
+    in_flight: int = 0
+    remaining_requests: Optional[float] = None
+    observed_at: float = 0.0
+    cooldown_until: float = 0.0
+    last_used: float = 0.0
+
+    def headroom(self, now: float) -> float:
+        if self.remaining_requests is None or now - self.observed_at > KEY_HEADROOM_TTL_SECONDS:
+            return float("inf")
+        return self.remaining_requests - self.in_flight
+
+
+class KeyPool:
+    """
+    API keys of one provider. Every call is assigned to the key with the most
+    remaining headroom (x-ratelimit-remaining-requests when the provider reports
+    it, otherwise the fewest calls in flight); a key that returns 429 cools down
+    until its Retry-After, or KEY_COOLDOWN_SECONDS, has passed.
+    """
+
+    def __init__(self, name: str, keys: List[str]):
+        self.name = name
+        self.keys = keys
+        self._states: Dict[str, _KeyState] = {key: _KeyState(index) for index, key in enumerate(keys)}
+
+    def __bool__(self) -> bool:
+        return bool(self.keys)
+
+    def select(self) -> str:
+        now = time.monotonic()
+        available = [key for key in self.keys if self._states[key].cooldown_until <= now]
+        if not available:
+            # Every key is cooling down, the one that recovers first is the best bet
+            return min(self.keys, key=lambda key: self._states[key].cooldown_until)
+
+        return max(available, key=lambda key: (
+            self._states[key].headroom(now),
+            -self._states[key].in_flight,
+            -self._states[key].last_used
+        ))
+
+    def observe_headers(self, key: str, headers: Optional[Mapping[str, Any]]) -> None:
+        try:
+            remaining = float((headers or {}).get("x-ratelimit-remaining-requests"))
+        except (TypeError, ValueError):
+            return
+        state = self._states[key]
+        state.remaining_requests = remaining
+        state.observed_at = time.monotonic()
+
+    def _cool_down(self, key: str, error: Exception) -> None:
+        state = self._states[key]
+        cooldown = retry_after_seconds(error) or KEY_COOLDOWN_SECONDS
+        state.cooldown_until = time.monotonic() + cooldown
+        state.remaining_requests = 0
+        state.observed_at = time.monotonic()
+        logger.warning(f"{self.name} API key #{state.index} rate limited, cooling down for {cooldown:.1f}s")
+
+    def _start(self) -> str:
+        key = self.select()
+        state = self._states[key]
+        state.in_flight += 1
+        state.last_used = time.monotonic()
+        return key
+
+    def _finish(self, key: str, error: Optional[Exception] = None) -> None:
+        self._states[key].in_flight -= 1
+        if error is not None and error_status_code(error) == 429:
+            self._cool_down(key, error)
+
+    async def call(self, request: Callable[[str], Awaitable[T]]) -> T:
+        """Runs `request` with the key that has the most headroom."""
+        key = self._start()
+        try:
+            result = await request(key)
+        except Exception as e:
+            self._finish(key, e)
+            raise
+        except BaseException:
+            self._finish(key)
+            raise
+        self._finish(key)
+        return result
+
+
+def _keys_from_env(pool_variable: str, single_variable: str) -> List[str]:
+    keys = [key.strip() for key in os.environ.get(pool_variable, "").split(",") if key.strip()]
+    if not keys and os.environ.get(single_variable):
+        keys = [os.environ[single_variable]]
+    return keys
+
+
+_pools: Dict[str, KeyPool] = {}
+
+
+def get_key_pool(name: str, pool_variable: str, single_variable: str) -> KeyPool:
+    """
+    Process-wide pool read from `pool_variable` (comma separated keys), falling
+    back to the single key in `single_variable`.
+    """
+    pool = _pools.get(name)
+    if pool is None:
+        pool = KeyPool(name, _keys_from_env(pool_variable, single_variable))
+        _pools[name] = pool
+    return pool
+
+
+def get_openai_key_pool() -> KeyPool:
+    return get_key_pool("OpenAI", "OPENAI_API_KEYS", "OPENAI_API_KEY")
+
+
+def get_google_key_pool() -> KeyPool:
+    return get_key_pool("Google", "GOOGLE_API_KEYS", "GOOGLE_API_KEY")
@@ -1,70 +1,106 @@
-from typing import List, Dict
-import os
-from openai import OpenAI, AsyncOpenAI
-from llm.providers.schemas import OPEN_AI_GENERATOR_SCHEMA, OPEN_AI_COMPONENT_JSON_SCHEMA
+from typing import AsyncIterator, List, Dict
+from llm.providers.schemas import OPEN_AI_GENERATOR_SCHEMA, OPEN_AI_COMPONENT_JSON_SCHEMA, ResponseSchema
 from llm.providers.factory import LLMProvider
 from exceptions import LLMAPIKeyMissingError, LLMProviderCompletionFailedException
 from logs import logger
+from clients import get_openai_client
+from deadline import get_call_timeout
+from llm.providers.hedging import hedged_call
+from llm.providers.retry import retry_async
+from llm.providers.concurrency import get_concurrency_controller
+from db.rate_limiter import acquire_rate_limit, estimate_tokens
+from llm.providers.key_pool import get_openai_key_pool
+from llm.providers.prompt_cache import prompt_cache_key, record_prompt_usage
 
 TIMEOUT = 120
-class  OpenAIProvider(LLMProvider):
+RESPONSE_FORMATS = {
+    ResponseSchema.SCREENS: OPEN_AI_GENERATOR_SCHEMA,
+    ResponseSchema.COMPONENT: OPEN_AI_COMPONENT_JSON_SCHEMA
+}
+
+
+def _record_usage(model_name: str, usage) -> None:
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    record_prompt_usage(model_name, usage.prompt_tokens, getattr(details, "cached_tokens", None))
+
+
+class AsyncOpenAIProvider(LLMProvider):
     def __init__(self, model_name: str, config):
-        self.api_key = os.environ.get("OPENAI_API_KEY")
-        self.client = OpenAI(api_key=self.api_key) if self.api_key else None
+        # Clients are shared per container and key, see clients.py
+        self.key_pool = get_openai_key_pool()
         self.model_name = model_name
         self.config = config
         self.timeout = TIMEOUT
+        self.count = 0
+        self.concurrency = get_concurrency_controller(model_name, config.max_in_flight)
 
-    def completion(self, messages: List[Dict[str, str]]) -> str:
-        if not self.client:
+    async def completion(self, messages: List[Dict[str, str]], response_schema: ResponseSchema = ResponseSchema.COMPONENT) -> str:
+        if not self.key_pool:
             raise LLMAPIKeyMissingError("OpenAI API key not configured")
 
-        try:
-            response = self.client.chat.completions.create(
+        async def send(api_key: str):
+            # The raw response exposes the rate-limit headers the concurrency window and key pool adapt to
+            raw_response = await self.concurrency.observe(lambda: get_openai_client(api_key).chat.completions.with_raw_response.create(
                 model=self.model_name,
                 messages=messages,
                 temperature=self.config.temperature_options.default,
                 max_completion_tokens=self.config.max_tokens,
-                timeout=self.timeout,
-                response_format=OPEN_AI_GENERATOR_SCHEMA
-            )
+                timeout=get_call_timeout(self.timeout),
+                response_format=RESPONSE_FORMATS[response_schema],
+                prompt_cache_key=prompt_cache_key(self.model_name, messages)
+            ))
+            self.key_pool.observe_headers(api_key, raw_response.headers)
+            return raw_response
+
+        async def request() -> str:
+            # Every attempt, hedges included, leases capacity from the limit shared by all instances
+            await acquire_rate_limit(self.model_name, estimate_tokens(messages))
+            # ...and goes to the key with the most headroom, see key_pool.py
+            raw_response = await self.key_pool.call(send)
+            self.concurrency.observe_headers(raw_response.headers)
+            response = raw_response.parse()
+            _record_usage(self.model_name, response.usage)
+            self.count += 1
+            logger.info(f"AsyncOpenAI {self.count} response: {response}")
             return response.choices[0].message.content
+
+        try:
+            # Transient errors are retried and slow calls may be duplicated, see retry.py and hedging.py
+            return await retry_async(self.model_name, lambda: hedged_call(self.model_name, response_schema.value, request))
         except Exception as e:
             logger.error(f"OpenAI API request failed: {str(e)}")
             raise LLMProviderCompletionFailedException(f"OpenAI API request failed: {str(e)}")
     
     def is_available(self) -> bool:
-        return self.client is not None
-    
-
-class AsyncOpenAIProvider(LLMProvider):
-    def __init__(self, model_name: str, config):
-        self.api_key = os.environ.get("OPENAI_API_KEY")
-        self.client = AsyncOpenAI(api_key=self.api_key) if self.api_key else None
-        self.model_name = model_name
-        self.config = config
-        self.timeout = TIMEOUT
-        self.count = 0
+        return bool(self.key_pool)
 
-    async def completion(self, messages: List[Dict[str, str]]) -> str:
-        if not self.client:
+    async def stream_completion(self, messages: List[Dict[str, str]], response_schema: ResponseSchema = ResponseSchema.SCREENS) -> AsyncIterator[str]:
+        """Yields the completion text in chunks as the model produces it."""
+        if not self.key_pool:
             raise LLMAPIKeyMissingError("OpenAI API key not configured")
-            
+
         try:
-            response = await self.client.chat.completions.create(
+            await acquire_rate_limit(self.model_name, estimate_tokens(messages))
+            # Only opening the stream is retried, chunks already yielded cannot be taken back
+            stream = await retry_async(self.model_name, lambda: self.key_pool.call(lambda api_key: get_openai_client(api_key).chat.completions.create(
                 model=self.model_name,
                 messages=messages,
                 temperature=self.config.temperature_options.default,
                 max_completion_tokens=self.config.max_tokens,
-                timeout=self.timeout,
-                response_format=OPEN_AI_COMPONENT_JSON_SCHEMA
-            )
-            self.count += 1
-            logger.info(f"AsyncOpenAI {self.count} response: {response}")
-            return response.choices[0].message.content
+                timeout=get_call_timeout(self.timeout),
+                response_format=RESPONSE_FORMATS[response_schema],
+                prompt_cache_key=prompt_cache_key(self.model_name, messages),
+                stream=True,
+                # The usage, cached tokens included, arrives in a last chunk without choices
+                stream_options={"include_usage": True}
+            )))
+            async for chunk in stream:
+                if chunk.usage:
+                    _record_usage(self.model_name, chunk.usage)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
         except Exception as e:
-            logger.error(f"OpenAI API request failed: {str(e)}")
-            raise LLMProviderCompletionFailedException(f"OpenAI API request failed: {str(e)}")
-    
-    def is_available(self) -> bool:
-        return self.client is not None
\ No newline at end of file
+            logger.error(f"OpenAI API streaming request failed: {str(e)}")
+            raise LLMProviderCompletionFailedException(f"OpenAI API streaming request failed: {str(e)}")
@@ -0,0 +1,48 @@
+import hashlib
+from dataclasses import dataclass
+from itertools import takewhile
+from typing import Dict, List, Optional
+
+
+@dataclass
+class PromptCacheStats:
+    requests: int = 0
+    prompt_tokens: int = 0
+    # Prompt tokens the provider served from its prefix cache, billed and processed at a discount
+    cached_tokens: int = 0
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "requests": self.requests,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "cached_ratio": round(self.cached_tokens / self.prompt_tokens, 3) if self.prompt_tokens else 0.0
+        }
+
+
+_stats: Dict[str, PromptCacheStats] = {}
+
+
+def get_prompt_cache_stats(model: str) -> PromptCacheStats:
+    stats = _stats.get(model)
+    if stats is None:
+        stats = PromptCacheStats()
+        _stats[model] = stats
+    return stats
+
+
+def record_prompt_usage(model: str, prompt_tokens: Optional[int], cached_tokens: Optional[int]) -> None:
+    """Adds the prompt token counts of one response's usage, missing counts count as 0."""
+    stats = get_prompt_cache_stats(model)
+    stats.requests += 1
+    stats.prompt_tokens += prompt_tokens or 0
+    stats.cached_tokens += cached_tokens or 0
+
+
+def prompt_cache_key(model_name: str, messages: List[Dict[str, str]]) -> str:
+    """
+    Key of the leading system messages, the static prefix of every request.
+    Requests that share it are routed to the same OpenAI prompt cache.
+    """
+    prefix = "\n".join(message["content"] for message in takewhile(lambda message: message["role"] == "system", messages))
+    return hashlib.sha256(f"{model_name}\n{prefix}".encode("utf-8")).hexdigest()[:32]
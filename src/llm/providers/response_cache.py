@@ -0,0 +1,286 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional
+
+from aws.db_connection import get_db
+from db.llm_cache import find_cached_response, store_cached_response
+from llm.providers.base import LLMProvider
+from llm.providers.failover import served_model
+from llm.providers.schemas import ResponseSchema
+from logs import logger
+
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_MEMORY_ENTRIES = int(os.environ.get("LLM_CACHE_MEMORY_ENTRIES", "512"))
+LLM_CACHE_DIR = os.environ.get("LLM_CACHE_DIR", "/tmp/llm_cache")
+# Lambda's /tmp defaults to 512MB and is shared with everything else the function writes
+LLM_CACHE_DISK_MAX_BYTES = int(os.environ.get("LLM_CACHE_DISK_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Set per job, a job that asks for fresh output neither reads nor writes the cache
+cache_bypass: ContextVar[bool] = ContextVar("cache_bypass", default=False)
+# Set per job to bypass only this cache; images and reused components are still served
+response_cache_bypass: ContextVar[bool] = ContextVar("response_cache_bypass", default=False)
+
+
+@dataclass
+class CacheStats:
+    memory_hits: int = 0
+    disk_hits: int = 0
+    db_hits: int = 0
+    misses: int = 0
+    bypassed: int = 0
+
+    def summary(self) -> Dict[str, float]:
+        hits = self.memory_hits + self.disk_hits + self.db_hits
+        lookups = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0
+        }
+
+
+_stats: Dict[str, CacheStats] = {}
+
+
+def get_cache_stats(model: str) -> CacheStats:
+    stats = _stats.get(model)
+    if stats is None:
+        stats = CacheStats()
+        _stats[model] = stats
+    return stats
+
+
+def cache_key(model_name: str, messages: List[Dict[str, str]], response_schema: ResponseSchema) -> str:
+    """Hash of everything that determines a response: model, output schema and messages, system prompt included."""
+    payload = json.dumps(
+        {"model": model_name, "response_schema": response_schema.value, "messages": messages},
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _is_cacheable(response: str) -> bool:
+    # Every schema is structured JSON output, a truncated or malformed response must not be served again
+    try:
+        json.loads(response)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+class _MemoryTier:
+    """In-process LRU, lives as long as the container or worker."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: str) -> None:
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class _DiskTier:
+    """
+    One file per response under `directory`, which survives warm Lambda
+    invocations. Reads refresh a file's mtime, so eviction drops the least
+    recently used files once `max_bytes` is exceeded.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._size: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def _scan(self) -> None:
+        if self._size is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._size = sum(entry.stat().st_size for entry in os.scandir(self.directory) if entry.is_file())
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                value = f.read()
+            os.utime(path)
+            return value
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, value: str) -> None:
+        data = value.encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+
+        with self._lock:
+            self._scan()
+            path = self._path(key)
+            previous_size = os.path.getsize(path) if os.path.exists(path) else 0
+            # Written aside and renamed, so a concurrent reader never sees a partial file
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            self._size += len(data) - previous_size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        # Down to 90% of the bound, so the next writes do not each trigger a directory scan
+        entries = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.is_file()),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        for entry in entries:
+            if self._size <= 0.9 * self.max_bytes:
+                break
+            size = entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            self._size -= size
+
+
+_memory_tier = _MemoryTier(LLM_CACHE_MEMORY_ENTRIES)
+_disk_tier = _DiskTier(LLM_CACHE_DIR, LLM_CACHE_DISK_MAX_BYTES)
+
+
+def _lookup_disk_and_db(key: str, stats: CacheStats) -> Optional[str]:
+    try:
+        value = _disk_tier.get(key)
+        if value is not None:
+            stats.disk_hits += 1
+            return value
+    except OSError as e:
+        logger.warning(f"LLM cache disk tier unavailable: {e}")
+
+    try:
+        value = find_cached_response(get_db(), key)
+    except Exception as e:
+        # The cache saves calls, it must not fail them
+        logger.warning(f"LLM cache database tier unavailable: {e}")
+        return None
+
+    if value is not None:
+        stats.db_hits += 1
+        try:
+            _disk_tier.put(key, value)
+        except OSError as e:
+            logger.warning(f"LLM cache disk tier unavailable: {e}")
+    return value
+
+
+def _store_disk_and_db(key: str, model_name: str, value: str) -> None:
+    try:
+        _disk_tier.put(key, value)
+    except OSError as e:
+        logger.warning(f"LLM cache disk tier unavailable: {e}")
+
+    try:
+        store_cached_response(get_db(), key, model_name, value)
+    except Exception as e:
+        logger.warning(f"LLM cache database tier unavailable: {e}")
+
+
+class CachedProvider(LLMProvider):
+    """
+    Async provider that answers repeated requests from a tiered cache: an
+    in-process LRU, files under /tmp and a Mongo collection shared by every
+    instance with a TTL. Only responses that parse as JSON are cached.
+    """
+
+    def __init__(self, provider: LLMProvider):
+        self.provider = provider
+        self.model_name = provider.model_name
+
+    def is_available(self) -> bool:
+        return self.provider.is_available()
+
+    def _enabled(self, stats: CacheStats) -> bool:
+        if not LLM_CACHE_ENABLED:
+            return False
+        if cache_bypass.get() or response_cache_bypass.get():
+            stats.bypassed += 1
+            return False
+        return True
+
+    async def _lookup(self, key: str, stats: CacheStats) -> Optional[str]:
+        value = _memory_tier.get(key)
+        if value is not None:
+            stats.memory_hits += 1
+            return value
+
+        value = await asyncio.to_thread(_lookup_disk_and_db, key, stats)
+        if value is not None:
+            _memory_tier.put(key, value)
+        else:
+            stats.misses += 1
+        return value
+
+    async def _store(self, messages: List[Dict[str, str]], response_schema: ResponseSchema, value: str) -> None:
+        if not _is_cacheable(value):
+            return
+        # A fallback model's response is keyed on that model, requests to the primary never read it
+        model_name = served_model.get() or self.model_name
+        key = cache_key(model_name, messages, response_schema)
+        _memory_tier.put(key, value)
+        await asyncio.to_thread(_store_disk_and_db, key, model_name, value)
+
+    async def completion(self, messages: List[Dict[str, str]], response_schema: ResponseSchema = ResponseSchema.COMPONENT) -> str:
+        stats = get_cache_stats(self.model_name)
+        if not self._enabled(stats):
+            return await self.provider.completion(messages, response_schema=response_schema)
+
+        key = cache_key(self.model_name, messages, response_schema)
+        cached = await self._lookup(key, stats)
+        if cached is not None:
+            return cached
+
+        served_model.set(None)
+        response = await self.provider.completion(messages, response_schema=response_schema)
+        await self._store(messages, response_schema, response)
+        return response
+
+    async def stream_completion(self, messages: List[Dict[str, str]], response_schema: ResponseSchema = ResponseSchema.SCREENS) -> AsyncIterator[str]:
+        """A hit is yielded as a single chunk; a miss is cached once the stream has completed."""
+        stats = get_cache_stats(self.model_name)
+        if not self._enabled(stats):
+            async for chunk in self.provider.stream_completion(messages, response_schema=response_schema):
+                yield chunk
+            return
+
+        key = cache_key(self.model_name, messages, response_schema)
+        cached = await self._lookup(key, stats)
+        if cached is not None:
+            yield cached
+            return
+
+        served_model.set(None)
+        chunks = []
+        async for chunk in self.provider.stream_completion(messages, response_schema=response_schema):
+            chunks.append(chunk)
+            yield chunk
+        await self._store(messages, response_schema, "".join(chunks))
@@ -0,0 +1,152 @@
+import asyncio
+import os
+import random
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+import aiohttp
+import httpx
+import openai
+
+from deadline import Deadline, current_deadline
+from logs import logger
+
+T = TypeVar("T")
+
+RETRY_MAX_ATTEMPTS = int(os.environ.get("LLM_RETRY_MAX_ATTEMPTS", "3"))
+RETRY_BASE_DELAY_SECONDS = float(os.environ.get("LLM_RETRY_BASE_DELAY_SECONDS", "1"))
+RETRY_MAX_DELAY_SECONDS = float(os.environ.get("LLM_RETRY_MAX_DELAY_SECONDS", "20"))
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_EXCEPTIONS = (
+    openai.APIConnectionError,
+    httpx.TransportError,
+    aiohttp.ClientConnectionError,
+    asyncio.TimeoutError,
+    TimeoutError,
+    ConnectionError
+)
+
+
+@dataclass
+class RetryStats:
+    calls: int = 0
+    retries: int = 0
+    # Retryable failures given up on, out of attempts or out of job budget
+    gave_up: int = 0
+    total_delay: float = 0.0
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "gave_up": self.gave_up,
+            "total_delay": round(self.total_delay, 3)
+        }
+
+
+_stats: Dict[str, RetryStats] = {}
+
+
+def get_retry_stats(name: str) -> RetryStats:
+    stats = _stats.get(name)
+    if stats is None:
+        stats = RetryStats()
+        _stats[name] = stats
+    return stats
+
+
+def error_status_code(error: Exception) -> Optional[int]:
+    # openai errors carry status_code, google.genai errors carry code
+    for attribute in ("status_code", "code"):
+        value = getattr(error, attribute, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def is_retryable(error: Exception) -> bool:
+    status_code = error_status_code(error)
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES
+    return isinstance(error, RETRYABLE_EXCEPTIONS)
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Server-requested delay from Retry-After headers or a Gemini RetryInfo detail."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        retry_after_ms = headers.get("retry-after-ms")
+        if retry_after_ms is not None:
+            return float(retry_after_ms) / 1000
+
+        retry_after = headers.get("retry-after")
+        if retry_after is not None:
+            try:
+                return float(retry_after)
+            except ValueError:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        pass
+
+    details = getattr(error, "details", None)
+    if isinstance(details, dict):
+        for detail in details.get("error", {}).get("details", []):
+            retry_delay = detail.get("retryDelay") if isinstance(detail, dict) else None
+            if isinstance(retry_delay, str) and retry_delay.endswith("s"):
+                try:
+                    return float(retry_delay[:-1])
+                except ValueError:
+                    pass
+    return None
+
+
+def _next_delay(name: str, attempt: int, error: Exception, deadline: Optional[Deadline]) -> Optional[float]:
+    """Delay before the next attempt, or None when the call should not be retried."""
+    if attempt >= RETRY_MAX_ATTEMPTS or not is_retryable(error):
+        return None
+
+    # Full jitter keeps concurrent components from retrying in lockstep
+    delay = random.uniform(0, min(RETRY_MAX_DELAY_SECONDS, RETRY_BASE_DELAY_SECONDS * 2 ** (attempt - 1)))
+    retry_after = retry_after_seconds(error)
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+
+    if deadline is not None and delay >= deadline.budget():
+        logger.warning(f"{name}: not retrying, a {delay:.2f}s delay would exceed the job deadline")
+        return None
+    return delay
+
+
+def _record_retry(name: str, attempt: int, delay: float, error: Exception) -> None:
+    stats = get_retry_stats(name)
+    stats.retries += 1
+    stats.total_delay += delay
+    logger.warning(f"{name}: attempt {attempt} failed ({error}), retrying in {delay:.2f}s: {stats.summary()}")
+
+
+async def retry_async(name: str, request: Callable[[], Awaitable[T]], deadline: Optional[Deadline] = None) -> T:
+    """
+    Awaits `request`, retrying transient errors (429, 5xx, timeouts, connection
+    errors) with jittered exponential backoff or the provider's Retry-After hint.
+    Gives up when the next delay would not fit in `deadline`, by default the
+    current job's.
+    """
+    deadline = deadline or current_deadline.get()
+    stats = get_retry_stats(name)
+    stats.calls += 1
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            return await request()
+        except Exception as e:
+            delay = _next_delay(name, attempt, e, deadline)
+            if delay is None:
+                if is_retryable(e):
+                    stats.gave_up += 1
+                raise
+            _record_retry(name, attempt, delay, e)
+        await asyncio.sleep(delay)
@@ -1,5 +1,13 @@
 import copy
 import json
+from enum import Enum
+
+
+class ResponseSchema(str, Enum):
+    """Structured output a completion is expected to follow."""
+    SCREENS = "screens"
+    COMPONENT = "component"
+
 
 def format_schema_for_prompt(schema):
     """Format a JSON schema dict into a readable string for inclusion in LLM prompts."""
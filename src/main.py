@@ -1,45 +1,59 @@
 import asyncio
 import json
+import time
 import traceback
+import uuid
 from datetime import datetime
-from typing import List
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
 
 from aws.db_connection import get_db
+from clients import run_until_complete
+from deadline import Deadline, current_deadline, DEFAULT_JOB_TIMEOUT_SECONDS, IMAGE_STAGE_MIN_SECONDS
 from workflows.prompt_generator import PromptGenerator
 from workflows.component_generator import AsyncComponentGenerator
+from workflows.component_reuse import find_reusable_component, get_reuse_stats, index_component
+from workflows.scheduler import ComponentScheduler, Tenant, TaskTiming, current_tenant, get_scheduler, summarize_timings
+from db.component_writer import ComponentWriteBuffer
+from db.user_utils import find_user_by_id
 from db.job_utils import (
-    find_job_by_id,
+    JOB_LEASE_SECONDS,
+    claim_job,
+    extend_job_lease,
+    release_job,
     find_job_components,
     update_job_status,
     update_job_planning,
-    update_component_planning,
-    bulk_update_component_status,
-    update_component_with_result,
+    update_job_planning_checkpoint,
+    bulk_update_components_with_results,
+    fail_unfinished_components,
     consume_user_credits
 )
 from models.db_models import Job, Component
-from job_config import JobStatus, ComponentStatus
+from models.request_models import Component as GeneratedComponent
+from job_config import JobMode, JobStatus, ComponentStatus, PlanningStep
 from llm.providers.factory import LLMFactory, LLMProvider
+from llm.providers.hedging import get_hedge_stats
+from llm.providers.prompt_cache import get_prompt_cache_stats
+from llm.providers.response_cache import cache_bypass, get_cache_stats, response_cache_bypass
+from llm.providers.retry import get_retry_stats
 from exceptions import (
     ComponentGenerationFailedException,
-    ComponentGeneratedLengthMismatchException,
     ComponentsNotFoundException,
     ComponentStatusUpdateFailedException,
+    DatabaseQueryFailedException,
+    JobAlreadyClaimedException,
+    JobLeaseLostException,
     JobNotFoundException,
+    JobPromptUpdateFailedException,
     JobStatusUpdateFailedException,
     PromptGenerationFailedException
 )
 from logs import logger
-from llm.providers.image_gen import generate_images_concurrently
+from llm.providers.image_cache import find_cached_image_urls, get_image_cache_stats, image_prompt_key, store_image_urls_for_prompts
+from llm.providers.image_gen import IMAGE_DISTINCT_VARIANTS, IMAGEN_3_FAST, generate_images_concurrently
 from aws.s3 import upload_images_concurrently
 
 
-def generate_component_prompts(job_data: Job) -> List[str]:
-    prompt_generator = PromptGenerator(job_data)
-    component_prompts = prompt_generator.run()
-    return component_prompts
-
-
 async def _generate_single_component(job_data: Job, prompt: str, provider: LLMProvider, component_id: str, device_info: dict) -> Component:
     try:
         component_generator = AsyncComponentGenerator(
@@ -54,198 +68,488 @@ async def _generate_single_component(job_data: Job, prompt: str, provider: LLMPr
     
     except Exception as e:
         logger.error(f"Component generation failed. Error: {str(e)}")
-        # We also want the failed exception to carry the real ID if possible, 
-        # though Exception wrapper might not have it. The current logic in 
-        # save_generation_results_to_db uses zip(job_components, results) so 
-        # order is preserved, which is fine for DB updates.
-        # But for our image generation logic, we filter by isinstance(Exception).
+        # The failed exception does not carry the real ID, the pipeline that
+        # awaits this call persists it against its own component_id.
         raise ComponentGenerationFailedException(message=str(e), invalid_code=None, sub_prompt=prompt)
     
 
-async def generate_components_concurrently(job_data: Job, component_prompts: List[str], job_components: List[dict], component_prompts_info: dict) -> List:
-    logger.info(f"Starting concurrent generation for {len(component_prompts)} prompts for job {job_data['_id']}. ")
-
-    provider = LLMFactory.create_async_provider(job_data["model"])
+async def generate_components_concurrently(writer: ComponentWriteBuffer, job_data: Job, screens: AsyncIterator[dict], job_components: List[dict], device_info: dict, provider: LLMProvider, outcomes: Dict[str, bool]) -> None:
+    """
+    Starts a component pipeline for every screen as soon as the planning stream
+    yields it, pairing screens with DB components in order. LLM calls go through
+    the model's bounded scheduler, prioritised by the screen's position in the IA
+    so the home screen is dispatched first. Every persisted component is recorded
+    in `outcomes` (component_id -> succeeded) as it lands, so the record survives
+    the cancellation of this coroutine. When the planning stream fails midway, the
+    components it already dispatched still finish. Images are shared between the
+    job's components by prompt.
+    """
+    logger.info(f"Starting streamed generation for {len(job_components)} components for job {job_data['_id']}. ")
+
+    model_config = LLMFactory.get_model_config(job_data["model"])
+    scheduler = get_scheduler(job_data["model"], model_config.max_in_flight)
+    timings: List[TaskTiming] = []
+    image_urls: Dict[str, str] = {}
+    tasks = []
+    screen_count = 0
+    planning_error: Optional[PromptGenerationFailedException] = None
+    try:
+        async for screen in screens:
+            screen_count += 1
+            if screen_count > len(job_components):
+                continue
 
-    # Zip prompts with actual DB components to ensure we use the real ID
-    if len(component_prompts) != len(job_components):
-         logger.warning(f"Length mismatch: {len(component_prompts)} prompts vs {len(job_components)} DB components. This might cause ID misalignment.")
+            db_comp = job_components[screen_count - 1]
+            if db_comp.get("status") == ComponentStatus.SUCCESSFUL.value:
+                # Persisted by a previous attempt of this job, only the remaining work is redone
+                outcomes[db_comp["_id"]] = True
+                continue
 
-    tasks = [
-        _generate_single_component(job_data, prompt['sub_prompt'], provider, db_comp['_id'], component_prompts_info)
-        for prompt, db_comp in zip(component_prompts, job_components)
-    ]
+            priority = screen_count - 1
+            tasks.append(asyncio.create_task(
+                _run_component_pipeline(writer, scheduler, priority, timings, outcomes, image_urls, job_data, screen["sub_prompt"], provider, db_comp["_id"], device_info)
+            ))
+    except PromptGenerationFailedException as e:
+        # Pipelines already dispatched have their sub-prompts and run to completion,
+        # the components the stream never reached are failed by the caller
+        logger.error(f"Sub-prompt stream failed after {screen_count} of {len(job_components)} screens: {e}")
+        planning_error = e
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+    # Screens are paired with the actual DB components in order to ensure we use the real ID
+    if planning_error is None and screen_count != len(job_components):
+         logger.warning(f"Length mismatch: {screen_count} prompts vs {len(job_components)} DB components. This might cause ID misalignment.")
 
     try:
         results = await asyncio.gather(*tasks, return_exceptions=True)
-        return results
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
     finally:
-        if hasattr(provider, "close"):
-            await provider.close()
+        logger.info(f"Component scheduling for job {job_data['_id']}: {summarize_timings(timings)}")
+        logger.info(f"LLM hedging for model {job_data['model']}: {get_hedge_stats(job_data['model']).summary()}")
+        logger.info(f"LLM retries for model {job_data['model']}: {get_retry_stats(job_data['model']).summary()}")
+        logger.info(f"LLM response cache for model {job_data['model']}: {get_cache_stats(job_data['model']).summary()}")
+        logger.info(f"Provider prompt cache for model {job_data['model']}: {get_prompt_cache_stats(job_data['model']).summary()}")
+        logger.info(f"Component reuse for model {job_data['model']}: {get_reuse_stats(job_data['model']).summary()}")
+        logger.info(f"Image cache: {get_image_cache_stats().summary()}")
 
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+
+
+async def save_component_result(writer: ComponentWriteBuffer, component_id: str, result, current_time: str) -> bool:
+    """Persists a single generation result and returns whether the component succeeded"""
+    if isinstance(result, ComponentGenerationFailedException):
+        logger.info(f"Updating component {component_id} as FAILED. Error: {str(result)}")
+        await writer.update_result(
+            component_id=component_id,
+            status=ComponentStatus.FAILED,
+            code=getattr(result, 'invalid_code', None),
+            sub_prompt=getattr(result, 'sub_prompt', None),
+            error_message=result.message,
+            completed_at=current_time
+        )
+        return False
+
+    logger.info(f"Updating component {component_id} as SUCCESSFUL")
+    await writer.update_result(
+        component_id=component_id,
+        status=ComponentStatus.SUCCESSFUL,
+        code=result.code,
+        sub_prompt=getattr(result, 'sub_prompt', None),
+        completed_at=current_time
+    )
+    return True
+
+
+def _find_image_prompts(node, prompts: List[str]) -> List[str]:
+    if isinstance(node, dict):
+        if node.get("type") == "image" and "prompt" in node:
+            prompts.append(node["prompt"])
+        for key, value in node.items():
+            _find_image_prompts(value, prompts)
+    elif isinstance(node, list):
+        for item in node:
+            _find_image_prompts(item, prompts)
+    return prompts
+
+
+def _image_node_keys(prompts: List[str]) -> List[str]:
+    """
+    image_prompt_key of every image node, in the order of `_find_image_prompts`.
+    With IMAGE_DISTINCT_VARIANTS the n-th repeat of a prompt within the component
+    is its n-th variant, so the cards of a list do not all show the same picture.
+    """
+    repeats: Dict[str, int] = {}
+    keys = []
+    for prompt in prompts:
+        prompt_key = image_prompt_key(IMAGEN_3_FAST, prompt)
+        variant = repeats.get(prompt_key, 0) if IMAGE_DISTINCT_VARIANTS else 0
+        repeats[prompt_key] = variant + 1
+        keys.append(image_prompt_key(IMAGEN_3_FAST, prompt, variant))
+    return keys
+
+
+def _inject_image_urls(node, urls: Iterator[Optional[str]]) -> None:
+    """Sets the src of every image node to the next URL of `urls`, in the order of `_find_image_prompts`."""
+    if isinstance(node, dict):
+        if node.get("type") == "image" and "prompt" in node:
+            url = next(urls)
+            if url is not None:
+                node["src"] = url
+        for key, value in node.items():
+            _inject_image_urls(value, urls)
+    elif isinstance(node, list):
+        for item in node:
+            _inject_image_urls(item, urls)
+
+
+def _images_resolved(code: Optional[str]) -> bool:
+    """Whether every image node of the component code has been given a URL."""
+    try:
+        code_json = json.loads(code)
+    except (TypeError, json.JSONDecodeError):
+        return False
+    return len(_find_image_prompts(code_json, [])) == sum(1 for _ in _image_sources(code_json))
 
-# ... (save_generation_results_to_db remains unchanged) ...
 
+def _image_sources(node):
+    if isinstance(node, dict):
+        if node.get("type") == "image" and "prompt" in node and node.get("src"):
+            yield node["src"]
+        for value in node.values():
+            yield from _image_sources(value)
+    elif isinstance(node, list):
+        for item in node:
+            yield from _image_sources(item)
 
-async def _orchestrate_generation(job_data, prompts, job_components):
-    # Pass job_components down to use real IDs
-    results = await generate_components_concurrently(job_data, prompts, job_components)
-    await _process_and_upload_images(results)
-    return results
 
+async def _process_component_images(component: Component, job_image_urls: Dict[str, str]) -> Component:
+    """
+    Extracts the image prompts of a single component, generates its images,
+    uploads them to S3 and patches the component code with the URLs. Prompts
+    this job or another one already generated an image for reuse that image's
+    URL instead; `job_image_urls` (image_prompt_key -> URL) holds the job's own,
+    which are reused even when the job bypasses the image cache.
+    """
+    # 1. Extract Prompts
+    if not component.code:
+        return component
 
+    try:
+        code_json = json.loads(component.code)
+    except json.JSONDecodeError:
+        logger.warning(f"Failed to parse JSON for component {component.id}")
+        return component
 
-def save_generation_results_to_db(db, job_components: List[dict], generation_results: List, current_time: str):
-    """Save generation results to database and update component statuses"""
-    if len(job_components) != len(generation_results):
-        raise ComponentGeneratedLengthMismatchException(f"Mismatch between job components ({len(job_components)}) and generation results ({len(generation_results)})")
+    prompts = _find_image_prompts(code_json, [])
+    if not prompts:
+        return component
+
+    node_keys = _image_node_keys(prompts)
+    prompts_by_key: Dict[str, str] = {}
+    for key, prompt in zip(node_keys, prompts):
+        prompts_by_key.setdefault(key, prompt)
+
+    # 2. Reuse the Job's and Cached Images
+    urls = {key: job_image_urls[key] for key in prompts_by_key if key in job_image_urls}
+    urls.update(await find_cached_image_urls([key for key in prompts_by_key if key not in urls]))
+
+    # 3. Generate and Upload the Rest, keyed by image so every URL lands on its nodes.
+    # Variants of a prompt are batched into one request
+    missing_prompts = {key: prompt for key, prompt in prompts_by_key.items() if key not in urls}
+    if missing_prompts:
+        generated_images_map = await generate_images_concurrently({key: [prompt] for key, prompt in missing_prompts.items()}, distinct_variants=IMAGE_DISTINCT_VARIANTS)
+        s3_urls_map = await upload_images_concurrently(generated_images_map)
+        fresh_urls = {key: key_urls[0] for key, key_urls in s3_urls_map.items()}
+        urls.update(fresh_urls)
+        await store_image_urls_for_prompts(IMAGEN_3_FAST, {key: (missing_prompts[key], url) for key, url in fresh_urls.items()})
+
+    if not urls:
+        return component
+    job_image_urls.update(urls)
 
-    successful_component_count = 0
+    # 4. Patch Component
+    try:
+        _inject_image_urls(code_json, iter([urls.get(key) for key in node_keys]))
+        component.code = json.dumps(code_json)
+    except Exception as e:
+        logger.error(f"Failed to patch component {component.id} with images: {e}")
 
-    for db_component, result in zip(job_components, generation_results):
-        if isinstance(result, ComponentGenerationFailedException):
-            logger.info(f"Updating component {db_component['_id']} as FAILED. Error: {str(result)}")
-            update_component_with_result(
-                db,
-                component_id=db_component['_id'],
-                status=ComponentStatus.FAILED,
-                code=getattr(result, 'invalid_code', None),
-                sub_prompt=getattr(result, 'sub_prompt', None),
-                error_message=result.message,
-                completed_at=current_time
+    return component
+
+
+async def _run_component_pipeline(writer: ComponentWriteBuffer, scheduler: ComponentScheduler, priority: int, timings: List[TaskTiming], outcomes: Dict[str, bool], image_urls: Dict[str, str], job_data: Job, prompt: str, provider: LLMProvider, component_id: str, device_info: dict) -> bool:
+    """
+    Generates a single component through the model scheduler, runs its own image
+    pipeline as soon as it is ready and persists it right away. Returns whether
+    the component succeeded. Images are skipped when the job deadline is too
+    close for them. A past component generated from a near-duplicate sub-prompt
+    is reused as is, images included, instead of being generated again.
+    """
+    # Mark the component RUNNING without holding back its LLM call
+    planning_write = asyncio.ensure_future(writer.update_planning(component_id, ComponentStatus.RUNNING, prompt))
+    started_at = time.monotonic()
+    reused_code = await find_reusable_component(job_data["model"], device_info, prompt)
+    if reused_code is not None:
+        result = GeneratedComponent(id=component_id, code=reused_code, sub_prompt=prompt)
+    else:
+        try:
+            result = await scheduler.submit(
+                lambda: _generate_single_component(job_data, prompt, provider, component_id, device_info),
+                priority=priority,
+                label=f"component {component_id}",
+                timings=timings
             )
+        except ComponentGenerationFailedException as e:
+            result = e
         else:
-            logger.info(f"Updating component {db_component['_id']} as SUCCESSFUL")
-            update_component_with_result(
-                db,
-                component_id=db_component['_id'],
-                status=ComponentStatus.SUCCESSFUL,
-                code=result.code,
-                sub_prompt=getattr(result, 'sub_prompt', None),
-                completed_at=current_time
-            )
-            successful_component_count += 1
-        
-    return successful_component_count
+            deadline = current_deadline.get()
+            image_budget = deadline.budget() if deadline else None
+            if image_budget is not None and image_budget < IMAGE_STAGE_MIN_SECONDS:
+                logger.warning(f"Skipping images for component {component_id}, only {image_budget:.1f}s left before the deadline")
+            else:
+                try:
+                    result = await asyncio.wait_for(_process_component_images(result, image_urls), timeout=image_budget)
+                except Exception as e:
+                    # Images are best effort, the component is still usable without them
+                    logger.error(f"Image pipeline failed for component {component_id}: {e!r}")
+
+    await planning_write
+    succeeded = await save_component_result(writer, component_id, result, datetime.now().isoformat())
+    outcomes[component_id] = succeeded
+    # Only components with all their images are offered for reuse, a reused component skips the image stage
+    if succeeded and reused_code is None and _images_resolved(result.code):
+        await index_component(job_data["model"], device_info, component_id, prompt, result.code, time.monotonic() - started_at)
+    return succeeded
+
+
+async def _replay_screens(screens: List[dict]) -> AsyncIterator[dict]:
+    for screen in screens:
+        yield screen
+
+
+def _select_failed_components(job_data: Job, job_components: List[dict]) -> Tuple[List[dict], List[dict]]:
+    """
+    Pairs every FAILED component with the sub-prompt it was planned with: the one
+    persisted on the component, or its screen in the job's planning checkpoint.
+    Returns the components that can be regenerated and their screens, in IA order.
+    """
+    checkpointed = (job_data.get("planning_checkpoint") or {}).get(PlanningStep.SUB_PROMPTS.value) or {}
+    checkpoint_screens = checkpointed.get("screens", [])
+
+    failed_components, screens = [], []
+    for index, component in enumerate(job_components):
+        if component.get("status") != ComponentStatus.FAILED.value:
+            continue
+
+        sub_prompt = component.get("sub_prompt")
+        if not sub_prompt and index < len(checkpoint_screens):
+            sub_prompt = checkpoint_screens[index].get("sub_prompt")
+        if not sub_prompt:
+            logger.warning(f"Component {component['_id']} has no persisted sub-prompt, it cannot be regenerated")
+            continue
+
+        failed_components.append(component)
+        screens.append({"sub_prompt": sub_prompt})
 
+    return failed_components, screens
 
-async def _process_and_upload_images(results: List):
+
+async def _orchestrate_generation(db, provider: LLMProvider, job_data: Job, screens: AsyncIterator[dict], job_components: List[dict], device_info: dict, deadline: Deadline) -> Dict[str, bool]:
     """
-    Extracts image prompts from successful components, generates images,
-    uploads them to S3, and updates the component code with the URLs.
+    Runs the component phase within the deadline's budget. Stragglers still running
+    when it runs out are cancelled; only components that were persisted are returned.
     """
-    component_prompts: dict = {}
-    
-    # 1. Extract Prompts
-    for result in results:
-        if isinstance(result, Exception):
-            continue
-        
+    outcomes: Dict[str, bool] = {}
+    writer = ComponentWriteBuffer(db)
+    try:
+        await asyncio.wait_for(
+            generate_components_concurrently(writer, job_data, screens, job_components, device_info, provider, outcomes),
+            timeout=deadline.budget()
+        )
+    except asyncio.TimeoutError:
+        logger.warning(f"Deadline reached for job {job_data['_id']}, cancelled {len(job_components) - len(outcomes)} unfinished components")
+    finally:
+        await writer.close()
+
+    return outcomes
+
+
+async def _fail_unfinished_components(db, job_components: List[dict], outcomes: Dict[str, bool], error_message: str, current_time: str) -> None:
+    unfinished_results = {
+        component["_id"]: {
+            "status": ComponentStatus.FAILED,
+            "error_message": error_message,
+            "completed_at": current_time
+        }
+        for component in job_components if component["_id"] not in outcomes
+    }
+    if unfinished_results:
+        logger.info(f"Setting {len(unfinished_results)} unfinished components as failed.")
+        await asyncio.to_thread(bulk_update_components_with_results, db, unfinished_results)
+
+
+async def _regenerate_failed_components(db, provider: LLMProvider, job_data: Job, job_components: List[dict], deadline: Deadline) -> None:
+    """
+    Reruns only the FAILED components of a finished job from their persisted
+    sub-prompts and the job's device, skipping the planning chain. Only the new
+    successes are charged.
+    """
+    job_id = job_data["_id"]
+    failed_components, screens = _select_failed_components(job_data, job_components)
+    logger.info(f"Regenerating {len(failed_components)} of {len(job_components)} components for job {job_id}")
+
+    outcomes: Dict[str, bool] = {}
+    if failed_components:
+        device_info = PromptGenerator(job_data).get_device_info()
+        outcomes = await _orchestrate_generation(db, provider, job_data, _replay_screens(screens), failed_components, device_info, deadline)
+
+    current_time = datetime.now().isoformat()
+    await _fail_unfinished_components(db, failed_components, outcomes, "Component did not complete before the job deadline", current_time)
+
+    successful_component_count = sum(1 for succeeded in outcomes.values() if succeeded)
+    await asyncio.to_thread(update_job_status, db, job_id, JobStatus.COMPLETED, current_time)
+    await asyncio.to_thread(consume_user_credits, db, job_data["user_id"], successful_component_count)
+
+
+async def _complete_job(db, job_data: Job, job_components: List[dict], outcomes: Dict[str, bool], error_message: str) -> None:
+    """Fails the components missing from `outcomes`, sets the job COMPLETED and charges its successes."""
+    current_time = datetime.now().isoformat()
+    await _fail_unfinished_components(db, job_components, outcomes, error_message, current_time)
+
+    # Components reused from a previous attempt were already charged if that attempt completed the job
+    reused_component_ids = {c["_id"] for c in job_components if c.get("status") == ComponentStatus.SUCCESSFUL.value}
+    already_charged = bool(job_data.get("completed_at"))
+    successful_component_count = sum(
+        1 for component_id, succeeded in outcomes.items()
+        if succeeded and not (already_charged and component_id in reused_component_ids)
+    )
+    await asyncio.to_thread(update_job_status, db, job_data["_id"], JobStatus.COMPLETED, current_time)
+    await asyncio.to_thread(consume_user_credits, db, job_data["user_id"], successful_component_count)
+
+
+# Statuses a job can be claimed from in each mode, besides RUNNING with an expired lease
+CLAIMABLE_STATUSES = {
+    JobMode.GENERATE: [JobStatus.SUBMITTED],
+    JobMode.REGENERATE_FAILED: [JobStatus.COMPLETED]
+}
+
+
+async def _heartbeat_job_lease(db, job_id: str, owner: str, job_task: asyncio.Task, lease_lost: asyncio.Event) -> None:
+    """Extends the job's lease until cancelled, and stops the job if another invocation took it over."""
+    while True:
+        await asyncio.sleep(JOB_LEASE_SECONDS / 3)
         try:
-            if not result.code:
-                continue
-                
-            code_json = json.loads(result.code)
-            
-            prompts = []
-            
-            def _find_prompts_recursive(node):
-                if isinstance(node, dict):
-                    if node.get("type") == "image" and "prompt" in node:
-                        prompts.append(node["prompt"])
-                    for key, value in node.items():
-                        _find_prompts_recursive(value)
-                elif isinstance(node, list):
-                    for item in node:
-                        _find_prompts_recursive(item)
-            
-            _find_prompts_recursive(code_json)
-            
-            if prompts:
-                component_prompts[result.id] = prompts
-                
-        except json.JSONDecodeError:
-            logger.warning(f"Failed to parse JSON for component {result.id}")
+            held = await asyncio.to_thread(extend_job_lease, db, job_id, owner)
+        except DatabaseQueryFailedException as e:
+            logger.warning(f"Failed to extend the lease of job {job_id}: {e}")
             continue
 
-    if not component_prompts:
-        return
+        if not held:
+            logger.error(f"Lease of job {job_id} was taken over by another invocation, stopping this one")
+            lease_lost.set()
+            job_task.cancel()
+            return
 
-    # 2. Generate Images
-    generated_images_map = await generate_images_concurrently(component_prompts)
-    
-    # 3. Upload Images
-    s3_urls_map = await upload_images_concurrently(generated_images_map)
-    
-    # 4. Patch Components
-    for result in results:
-        if isinstance(result, Exception) or result.id not in s3_urls_map:
-            continue
-            
-        try:
-            code_json = json.loads(result.code)
-            urls = s3_urls_map[result.id]
-            url_iter = iter(urls)
-            
-            def _inject_urls_recursive(node):
-                if isinstance(node, dict):
-                    if node.get("type") == "image" and "prompt" in node:
-                        try:
-                            url = next(url_iter)
-                            node["src"] = url
-                        except StopIteration:
-                            pass
-                    for key, value in node.items():
-                        _inject_urls_recursive(value)
-                elif isinstance(node, list):
-                    for item in node:
-                        _inject_urls_recursive(item)
-            
-            _inject_urls_recursive(code_json)
-            
-            # Update the component code
-            result.code = json.dumps(code_json)
-            
-        except Exception as e:
-            logger.error(f"Failed to patch component {result._id} with images: {e}")
-
-
-async def _orchestrate_generation(job_data, prompts, job_components, device_info):
-    results = await generate_components_concurrently(job_data, prompts, job_components, device_info)
-    await _process_and_upload_images(results)
-    return results
-
-
-def run(job_id: str):
-    try:
-        db = get_db()
-        job_data: Job = find_job_by_id(db, job_id)
 
-        update_job_status(db, job_id, JobStatus.RUNNING)
-        job_components = find_job_components(db, job_id)
-        job_component_ids = [c["_id"] for c in job_components]
-        components_prompts: dict = generate_component_prompts(job_data)
-        update_job_planning(db, job_id, components_prompts)
+async def _release_failed_job(db, job_id: str, owner: str, mode: JobMode, error: Exception) -> None:
+    """
+    Releases the lease of a job whose run raised outside of the database, so redeliveries
+    drop it instead of failing the same way again. A regenerated job keeps the results
+    it completed with.
+    """
+    status = JobStatus.COMPLETED if mode == JobMode.REGENERATE_FAILED else JobStatus.FAILED
+    try:
+        await asyncio.to_thread(release_job, db, job_id, owner, status, str(error))
+        await asyncio.to_thread(fail_unfinished_components, db, job_id)
+    except DatabaseQueryFailedException as e:
+        # The lease still expires, and reclaims are capped by JOB_MAX_ATTEMPTS
+        logger.error(f"Failed to release job {job_id}: {e}")
 
-        # Update each component with its newly generated sub_prompt and set status to RUNNING
-        for db_component, prompt_data in zip(job_components, components_prompts["sub_prompts"]["screens"]):
-            update_component_planning(db, db_component["_id"], ComponentStatus.RUNNING, prompt_data["sub_prompt"])
 
-        generation_results: dict = asyncio.run(_orchestrate_generation(job_data, components_prompts["sub_prompts"]["screens"], job_components, components_prompts["device_info"]))
+async def run_async(job_id: str, deadline: Optional[Deadline] = None, mode: JobMode = JobMode.GENERATE, owner: Optional[str] = None):
+    """
+    Runs the whole job on the current event loop: one async provider serves the
+    planning chain and the component phase, blocking DB calls run in threads.
+    Every stage is bounded by `deadline`, keeping time back to persist finished work.
+    In REGENERATE_FAILED mode only the job's FAILED components are generated again.
+    The job is claimed under a lease for `owner` first, so duplicate deliveries
+    of a job someone else is running are dropped.
+    """
+    deadline = deadline or Deadline.from_timeout(DEFAULT_JOB_TIMEOUT_SECONDS)
+    current_deadline.set(deadline)
+    owner = owner or uuid.uuid4().hex
+    heartbeat = None
+    lease_lost = asyncio.Event()
+    try:
+        db = get_db()
+        job_data: Job = await asyncio.to_thread(claim_job, db, job_id, owner, CLAIMABLE_STATUSES[mode])
+        heartbeat = asyncio.create_task(_heartbeat_job_lease(db, job_id, owner, asyncio.current_task(), lease_lost))
+
+        # Component and image slots are shared fairly between users, capped by subscription
+        user = await asyncio.to_thread(find_user_by_id, db, job_data["user_id"])
+        current_tenant.set(Tenant.from_user(job_data["user_id"], user))
+        cache_bypass.set(bool(job_data.get("bypass_cache")))
+        # Regeneration asks for different output than the cached responses that produced the failures,
+        # but still reuses cached images and near-duplicate components
+        response_cache_bypass.set(mode == JobMode.REGENERATE_FAILED)
+        job_components = await asyncio.to_thread(find_job_components, db, job_id)
+
+        # Provider clients are shared per container and closed at shutdown, see clients.py
+        provider = LLMFactory.create_async_provider(job_data["model"])
+
+        if mode == JobMode.REGENERATE_FAILED:
+            await _regenerate_failed_components(db, provider, job_data, job_components, deadline)
+            return
+
+        async def checkpoint_planning_step(step: PlanningStep, output: dict) -> None:
+            await asyncio.to_thread(update_job_planning_checkpoint, db, job_id, step, output)
+
+        # Planning steps finished by a previous attempt are resumed from the job's checkpoint
+        prompt_generator = PromptGenerator(job_data, on_step_completed=checkpoint_planning_step)
+        try:
+            planning: dict = await asyncio.wait_for(prompt_generator.prepare(provider), timeout=deadline.budget())
+        except asyncio.TimeoutError:
+            raise PromptGenerationFailedException("Planning chain did not finish before the job deadline")
+        await asyncio.to_thread(update_job_planning, db, job_id, planning)
+
+        # Sub-prompts are streamed from step 3 of the planning chain; each component is set to RUNNING
+        # with its sub_prompt, starts generating as soon as its screen arrives and is persisted as it finishes
+        screens = prompt_generator.stream_sub_prompts(provider, planning)
+        outcomes = await _orchestrate_generation(db, provider, job_data, screens, job_components, planning["device_info"], deadline)
+
+        # Components without a sub-prompt or cancelled at the deadline never completed
+        error_message = "Component did not complete before the job deadline" if deadline.expired() else "No sub-prompt was generated for this component"
+        await _complete_job(db, job_data, job_components, outcomes, error_message)
+
+    except JobAlreadyClaimedException as e:
+        logger.info(f"Skipping job {job_id}: {e}")
+        return
 
-        current_time = datetime.now().isoformat()
-        successful_component_count = save_generation_results_to_db(db, job_components, generation_results, current_time)
-        update_job_status(db, job_id, JobStatus.COMPLETED, current_time)
-        consume_user_credits(db, job_data["user_id"], successful_component_count)
+    except asyncio.CancelledError:
+        if lease_lost.is_set():
+            raise JobLeaseLostException(f"Lease of job {job_id} was taken over by another invocation")
+        raise
 
-    except (PromptGenerationFailedException, ComponentGeneratedLengthMismatchException) as e:
-        logger.info(f"Setting all components as failed. Reason: {e}")
-        update_job_status(db, job_id, JobStatus.COMPLETED)
-        bulk_update_component_status(db, job_component_ids, ComponentStatus.FAILED)
+    except PromptGenerationFailedException as e:
+        logger.info(f"Setting unfinished components as failed. Reason: {e}")
+        # Only components persisted by a previous attempt of the job succeeded
+        outcomes = {c["_id"]: True for c in job_components if c.get("status") == ComponentStatus.SUCCESSFUL.value}
+        await _complete_job(db, job_data, job_components, outcomes, str(e))
         return
 
-    except (JobNotFoundException, JobStatusUpdateFailedException, ComponentsNotFoundException, ComponentStatusUpdateFailedException) as e:
+    except (JobNotFoundException, JobStatusUpdateFailedException, JobPromptUpdateFailedException, ComponentsNotFoundException, ComponentStatusUpdateFailedException, DatabaseQueryFailedException) as e:
         #Don't change  state in case of dabatase errors to protect data integrity.
+        # The lease is kept and expires, so the job is reclaimed and resumes from its checkpoint.
         logger.error(f"Database error: {e}")
         logger.error(f"Traceback: {traceback.format_exc()}")
         raise e
@@ -253,4 +557,17 @@ def run(job_id: str):
     except Exception as e:
         logger.error(f"Internal error: {e}")
         logger.error(f"Traceback: {traceback.format_exc()}")
+        if heartbeat is not None:
+            # Stopped first, the released lease would otherwise read as taken over
+            heartbeat.cancel()
+            await _release_failed_job(db, job_id, owner, mode, e)
         raise e
+
+    finally:
+        if heartbeat is not None:
+            heartbeat.cancel()
+
+
+def run(job_id: str, deadline: Optional[Deadline] = None, mode: JobMode = JobMode.GENERATE):
+    # The process-wide loop keeps shared clients usable across warm invocations
+    return run_until_complete(run_async(job_id, deadline, mode))
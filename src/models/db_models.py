@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from datetime import datetime
 from typing import Optional, Dict
 from job_config import JobStatus, ComponentStatus, AvailablePlatforms, GenerationType, DeviceSize, AvailableDeviceSizes
 
@@ -44,6 +45,11 @@ class Job:
     information_architecture: Optional[str] = None
     completed_at: Optional[str] = None
     error_message: Optional[str] = None
+    planning_checkpoint: Optional[Dict] = None
+    lease_owner: Optional[str] = None
+    lease_expires_at: Optional[datetime] = None
+    attempts: int = 0
+    bypass_cache: bool = False
     
     def to_dict(self):
         return {
@@ -60,7 +66,12 @@ class Job:
             "information_architecture": self.information_architecture,
             "created_at": self.created_at,
             "completed_at": self.completed_at,
-            "error_message": self.error_message
+            "error_message": self.error_message,
+            "planning_checkpoint": self.planning_checkpoint,
+            "lease_owner": self.lease_owner,
+            "lease_expires_at": self.lease_expires_at,
+            "attempts": self.attempts,
+            "bypass_cache": self.bypass_cache
         }
 
   
@@ -0,0 +1,114 @@
+import asyncio
+import os
+import signal
+import threading
+import uuid
+from typing import Set
+
+from aws.db_connection import get_db
+from clients import run_until_complete
+from db.job_utils import claim_next_submitted_job
+from job_config import JobStatus
+from logs import logger
+from main import run_async
+
+MAX_CONCURRENT_JOBS = int(os.environ.get("WORKER_MAX_CONCURRENT_JOBS", "4"))
+POLL_INTERVAL_SECONDS = float(os.environ.get("WORKER_POLL_INTERVAL_SECONDS", "5"))
+SHUTDOWN_GRACE_SECONDS = float(os.environ.get("WORKER_SHUTDOWN_GRACE_SECONDS", "170"))
+
+
+class JobWorker:
+    """
+    Long-running alternative to the Lambda handler. Claims SUBMITTED jobs, and
+    RUNNING ones whose lease expired, from `generation_jobs` and runs up to `max_concurrent_jobs` of them at once on a
+    single event loop with the shared clients. New jobs are noticed through a
+    change stream when the database supports it, otherwise by polling.
+    """
+
+    def __init__(self, max_concurrent_jobs: int = MAX_CONCURRENT_JOBS, poll_interval: float = POLL_INTERVAL_SECONDS):
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.poll_interval = poll_interval
+        self.db = get_db()
+        self.active_jobs: Set[asyncio.Task] = set()
+        self._wakeup = asyncio.Event()
+        self._stopping = asyncio.Event()
+        self._watch_stop = threading.Event()
+
+    def stop(self) -> None:
+        if not self._stopping.is_set():
+            logger.info("Worker shutdown requested, finishing in-flight jobs...")
+            self._stopping.set()
+            self._wakeup.set()
+            self._watch_stop.set()
+
+    def _watch_submitted_jobs(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Wakes the claim loop on every new SUBMITTED job. Runs in its own thread."""
+        pipeline = [{"$match": {"operationType": "insert", "fullDocument.status": JobStatus.SUBMITTED.value}}]
+        try:
+            with self.db["generation_jobs"].watch(pipeline, max_await_time_ms=1000) as stream:
+                logger.info("Watching generation_jobs change stream")
+                while not self._watch_stop.is_set():
+                    if stream.try_next() is not None:
+                        loop.call_soon_threadsafe(self._wakeup.set)
+        except Exception as e:
+            logger.info(f"Change stream unavailable, polling every {self.poll_interval}s: {e}")
+
+    async def _run_job(self, job: dict) -> None:
+        job_id = job["_id"]
+        try:
+            logger.info(f"Worker processing job {job_id}")
+            await run_async(job_id, owner=job["lease_owner"])
+        except Exception as e:
+            logger.error(f"Worker job {job_id} failed: {e}")
+        finally:
+            # A freed slot may be able to claim a waiting job right away
+            self._wakeup.set()
+
+    async def _claim_jobs(self) -> None:
+        while len(self.active_jobs) < self.max_concurrent_jobs and not self._stopping.is_set():
+            # One lease owner per claim, a job this worker reclaims after its lease expired is a new run
+            job = await asyncio.to_thread(claim_next_submitted_job, self.db, uuid.uuid4().hex)
+            if job is None:
+                return
+
+            task = asyncio.create_task(self._run_job(job))
+            self.active_jobs.add(task)
+            task.add_done_callback(self.active_jobs.discard)
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self.stop)
+
+        watcher = loop.run_in_executor(None, self._watch_submitted_jobs, loop)
+        logger.info(f"Worker started with up to {self.max_concurrent_jobs} concurrent jobs")
+
+        while not self._stopping.is_set():
+            self._wakeup.clear()
+            try:
+                await self._claim_jobs()
+            except Exception as e:
+                logger.error(f"Failed to claim jobs: {e}")
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+        if self.active_jobs:
+            logger.info(f"Waiting up to {SHUTDOWN_GRACE_SECONDS}s for {len(self.active_jobs)} jobs to finish")
+            _, pending = await asyncio.wait(self.active_jobs, timeout=SHUTDOWN_GRACE_SECONDS)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        await watcher
+        logger.info("Worker stopped")
+
+
+async def _main() -> None:
+    await JobWorker().run()
+
+
+if __name__ == "__main__":
+    run_until_complete(_main())
@@ -6,17 +6,23 @@ from typing import List, Optional, Dict
 from exceptions import LLMProviderCompletionFailedException, DeviceSizeNotFoundException
 from models.request_models import Component
 from llm.providers.factory import LLMProvider
-from workflows.prompts.component_gen import JSON_UI_GENERATOR_SYSTEM_PROMPT
+from workflows.prompts.component_gen import JSON_UI_GENERATOR_SYSTEM_PROMPT, DEVICE_SPECS_BLOCK
 from workflows.prompts.general import JSON_RULES_SNIPPET, UX_LAWS_SNIPPET
 from job_config import AvailableDeviceSizes, DeviceSize
 from logs import logger
 
 
+# Formatted once: a byte-identical system prompt lets providers cache it as a prefix across jobs and devices
+COMPONENT_SYSTEM_PROMPT = JSON_UI_GENERATOR_SYSTEM_PROMPT.format(
+    JSON_RULES_SNIPPET=JSON_RULES_SNIPPET,
+    UX_LAWS_SNIPPET=UX_LAWS_SNIPPET
+)
+
+
 class AsyncComponentGenerator:
     def __init__(self, model_name: str, user_prompt: str):
         self.model_name = model_name
-        # Note: We delay prompt formatting to the generate call where we have all context
-        self.base_system_prompt = JSON_UI_GENERATOR_SYSTEM_PROMPT
+        self.system_prompt = COMPONENT_SYSTEM_PROMPT
         self.user_prompt = user_prompt
 
 
@@ -52,29 +58,24 @@ class AsyncComponentGenerator:
             "corner_radius": device_info.get("corner_radius")
         }, indent=2)
 
-        # 3. Format System Prompt with Snippets and Device Info
-        formatted_system_prompt = self.base_system_prompt.format(
-            JSON_RULES_SNIPPET=JSON_RULES_SNIPPET,
-            UX_LAWS_SNIPPET=UX_LAWS_SNIPPET,
-            device_specs=device_specs_str
-        )
-
-        # 4. Enhance User Prompt with IA Context (if available)
-        final_user_content = self.user_prompt
+        # 3. Order the request from the most to the least shared content: the static system
+        # prompt, then what every screen of the job shares, then this screen's sub-prompt
+        sections = []
         if ia_context:
             iac_str = json.dumps(ia_context, indent=2)
-            final_user_content = (
-                f"{self.user_prompt}\n\n"
+            sections.append(
                 f"<information_architecture_context>\n"
                 f"You are part of a larger app. Here is the full Sitemap/IA for context. "
                 f"Use this to ensure any navigation links (navigates_to) or hierarchy align with the global plan.\n"
                 f"{iac_str}\n"
                 f"</information_architecture_context>"
             )
+        sections.append(DEVICE_SPECS_BLOCK.format(device_specs=device_specs_str))
+        sections.append(self.user_prompt)
 
         messages = [
-            {"role": "system", "content": formatted_system_prompt},
-            {"role": "user", "content": final_user_content}
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": "\n\n".join(sections)}
         ]
 
         generated_code = await self._make_llm_request(messages, provider)
@@ -0,0 +1,147 @@
+import asyncio
+import hashlib
+import os
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from aws.db_connection import get_db
+from db.component_index import find_component_candidates, insert_component_index
+from llm.providers.response_cache import cache_bypass
+from logs import logger
+
+COMPONENT_REUSE_ENABLED = os.environ.get("COMPONENT_REUSE_ENABLED", "true").lower() == "true"
+# Estimated Jaccard similarity of the sub-prompts' word sets above which a past component is reused.
+# Paraphrases of the same screen score about 0.85, a different screen of the same app about 0.65.
+COMPONENT_REUSE_MIN_SIMILARITY = float(os.environ.get("COMPONENT_REUSE_MIN_SIMILARITY", "0.8"))
+# Shorter sub-prompts have too few words for their similarity to mean much
+COMPONENT_REUSE_MIN_WORDS = 8
+
+MINHASH_PERMUTATIONS = 128
+# 32 bands of 4 rows: sub-prompts at 0.8 similarity share a band with near certainty, at 0.3 rarely
+MINHASH_BAND_ROWS = 4
+_MERSENNE_PRIME = (1 << 61) - 1
+# Derived from fixed seeds, signatures have to stay comparable across processes and deployments
+_PERMUTATIONS = [
+    (
+        int.from_bytes(hashlib.blake2b(f"minhash-a-{i}".encode(), digest_size=8).digest(), "big") % (_MERSENNE_PRIME - 1) + 1,
+        int.from_bytes(hashlib.blake2b(f"minhash-b-{i}".encode(), digest_size=8).digest(), "big") % _MERSENNE_PRIME
+    )
+    for i in range(MINHASH_PERMUTATIONS)
+]
+
+
+@dataclass
+class ReuseStats:
+    lookups: int = 0
+    hits: int = 0
+    # Generation time, images included, the reused components originally took
+    latency_saved: float = 0.0
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.lookups, 3) if self.lookups else 0.0,
+            "latency_saved": round(self.latency_saved, 3)
+        }
+
+
+_stats: Dict[str, ReuseStats] = {}
+
+
+def get_reuse_stats(model: str) -> ReuseStats:
+    stats = _stats.get(model)
+    if stats is None:
+        stats = ReuseStats()
+        _stats[model] = stats
+    return stats
+
+
+def _normalize(text: str) -> List[str]:
+    return re.sub(r"[^a-z0-9]+", " ", text.lower()).split()
+
+
+def minhash_signature(text: str) -> Optional[List[int]]:
+    """MinHash signature of the normalised text's word set, None when it is too short."""
+    words = set(_normalize(text))
+    if len(words) < COMPONENT_REUSE_MIN_WORDS:
+        return None
+
+    hashes = [int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "big") for word in words]
+    return [min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def signature_bands(signature: List[int]) -> List[str]:
+    """LSH band keys; sub-prompts that share one are compared."""
+    bands = []
+    for start in range(0, len(signature), MINHASH_BAND_ROWS):
+        rows = ",".join(str(value) for value in signature[start:start + MINHASH_BAND_ROWS])
+        bands.append(f"{start // MINHASH_BAND_ROWS}:{hashlib.blake2b(rows.encode(), digest_size=8).hexdigest()}")
+    return bands
+
+
+def estimated_similarity(signature: List[int], other: List[int]) -> float:
+    return sum(1 for a, b in zip(signature, other) if a == b) / len(signature)
+
+
+def device_key(device_info: dict) -> str:
+    return f"{device_info.get('name')}:{device_info.get('width')}x{device_info.get('height')}"
+
+
+def _enabled() -> bool:
+    return COMPONENT_REUSE_ENABLED and not cache_bypass.get()
+
+
+def _find_reusable_code(model: str, device: str, signature: List[int]) -> Optional[dict]:
+    best, best_similarity = None, COMPONENT_REUSE_MIN_SIMILARITY
+    for candidate in find_component_candidates(get_db(), model, device, signature_bands(signature)):
+        similarity = estimated_similarity(signature, candidate["signature"])
+        if similarity >= best_similarity:
+            best, best_similarity = candidate, similarity
+    return best
+
+
+async def find_reusable_component(model: str, device_info: dict, sub_prompt: str) -> Optional[str]:
+    """
+    Code of a past successful component of the same model and device whose
+    sub-prompt is a near duplicate of `sub_prompt`, or None.
+    """
+    if not _enabled():
+        return None
+    signature = minhash_signature(sub_prompt)
+    if signature is None:
+        return None
+
+    stats = get_reuse_stats(model)
+    stats.lookups += 1
+    try:
+        match = await asyncio.to_thread(_find_reusable_code, model, device_key(device_info), signature)
+    except Exception as e:
+        # Reuse only saves calls, an unavailable index falls back to generating
+        logger.warning(f"Component reuse index unavailable: {e}")
+        return None
+
+    if match is None:
+        return None
+    stats.hits += 1
+    stats.latency_saved += match.get("generation_seconds") or 0.0
+    logger.info(f"Reusing component {match.get('component_id')} for a near-duplicate sub-prompt")
+    return match["code"]
+
+
+async def index_component(model: str, device_info: dict, component_id: str, sub_prompt: str, code: str, generation_seconds: float) -> None:
+    """Offers a freshly generated component to later jobs."""
+    if not _enabled() or not code:
+        return
+    signature = minhash_signature(sub_prompt)
+    if signature is None:
+        return
+
+    try:
+        await asyncio.to_thread(
+            insert_component_index, get_db(), component_id, model, device_key(device_info),
+            signature, signature_bands(signature), sub_prompt, code, generation_seconds
+        )
+    except Exception as e:
+        logger.warning(f"Failed to index component {component_id} for reuse: {e}")
@@ -1,115 +1,180 @@
 import json
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
 from models.db_models import Job
 from exceptions import PromptGenerationFailedException, DeviceSizeNotFoundException
-from llm.providers.factory import LLMFactory
-from workflows.prompts.prompt_gen import PROMPT_ENHANCER, INFORMATION_ARCHITECTURE, SCREEN_SUB_PROMPT_GENERATOR_AGENT
+from llm.providers.factory import LLMProvider
+from llm.providers.schemas import ResponseSchema
+from workflows.prompts.prompt_gen import PROMPT_ENHANCER, INFORMATION_ARCHITECTURE, SCREEN_SUB_PROMPT_GENERATOR_AGENT, DEVICE_INFO_BLOCK
 from workflows.prompts.general import JSON_RULES_SNIPPET, UX_LAWS_SNIPPET
-from job_config import AvailableDeviceSizes
+from job_config import AvailableDeviceSizes, PlanningStep
+from workflows.screen_stream import ScreenStreamParser
 from logs import logger
 
+# Formatted once: byte-identical system prompts let providers cache them as a prefix across jobs and devices
+ENHANCER_SYSTEM_PROMPT = PROMPT_ENHANCER.format(json_rules=JSON_RULES_SNIPPET, ux_laws=UX_LAWS_SNIPPET)
+IA_SYSTEM_PROMPT = INFORMATION_ARCHITECTURE.format(json_rules=JSON_RULES_SNIPPET, ux_laws=UX_LAWS_SNIPPET)
+SUB_PROMPT_SYSTEM_PROMPT = SCREEN_SUB_PROMPT_GENERATOR_AGENT.format(json_rules=JSON_RULES_SNIPPET, ux_laws=UX_LAWS_SNIPPET)
+
+
+def _with_device_info(content: str, device_info: dict) -> str:
+    """Appends the device block after the variable input, keeping the static prefix intact."""
+    return f"{content}\n\n{DEVICE_INFO_BLOCK.format(device_info=json.dumps(device_info, indent=2))}"
+
+
 class PromptGenerator:
-    def __init__(self, job_data: Job):
+    def __init__(self, job_data: Job, on_step_completed: Optional[Callable[[PlanningStep, dict], Awaitable[None]]] = None):
         self.job_data: Job = job_data 
-    
-    def run(self):            
+        # Outputs of the steps completed by a previous attempt are reused instead of regenerated
+        self.checkpoint: dict = dict(job_data.get("planning_checkpoint") or {})
+        self.on_step_completed = on_step_completed
+
+    async def _complete_step(self, step: PlanningStep, output: dict) -> None:
+        self.checkpoint[step.value] = output
+        if self.on_step_completed:
+            try:
+                await self.on_step_completed(step, output)
+            except Exception as e:
+                # A checkpoint only spares a retry some work, the step itself succeeded
+                logger.warning(f"Failed to checkpoint planning step {step.value}: {e}")
+
+    def get_device_info(self) -> dict:
+        # Detect device size or default
+        device = self.job_data.get("device")
+        if not device or "name" not in device:
+            raise DeviceSizeNotFoundException("Device information is missing from job data.")
+        
+        device_name = device["name"]
+        try:
+            device_enum = AvailableDeviceSizes.get_device_by_name(device_name)
+            # Store device info as dict
+            return {
+                "name": device_enum.name,
+                "width": device_enum.width,
+                "height": device_enum.height,
+                "corner_radius": device_enum.corner_radius
+            }
+        except ValueError:
+             raise DeviceSizeNotFoundException("Device size not found for device: " + device_name)
+
+    async def _plan(self, provider: LLMProvider) -> dict:
+        """Runs steps 1 and 2 of the chain, which the sub-prompt generator depends on."""
+        user_prompt = self.job_data["user_prompt"]
+        device_info = self.get_device_info()
+
+        # ------------------------------------------------------------------
+        # STEP 1: PROMPT ENHANCER
+        # ------------------------------------------------------------------
+        brief_json = self.checkpoint.get(PlanningStep.BRIEF.value)
+        if brief_json is not None:
+            logger.info("Step 1: Reusing checkpointed prompt brief.")
+        else:
+            logger.info("Step 1: Enhancing User Prompt...")
+            msgs_1 = [
+                {"role": "system", "content": ENHANCER_SYSTEM_PROMPT},
+                {"role": "user", "content": _with_device_info(user_prompt, device_info)}
+            ]
+            resp_1_str = await provider.completion(messages=msgs_1, response_schema=ResponseSchema.SCREENS)
+            brief_json = json.loads(resp_1_str)
+            await self._complete_step(PlanningStep.BRIEF, brief_json)
+            logger.info("Prompt Enhanced successfully.")
+
+        # ------------------------------------------------------------------
+        # STEP 2: INFORMATION ARCHITECTURE
+        # ------------------------------------------------------------------
+        sitemap_json = self.checkpoint.get(PlanningStep.SITEMAP.value)
+        if sitemap_json is not None:
+            logger.info("Step 2: Reusing checkpointed sitemap.")
+        else:
+            logger.info("Step 2: Designing Information Architecture...")
+            # Pass the enhanced brief as input
+            msgs_2 = [
+                {"role": "system", "content": IA_SYSTEM_PROMPT},
+                {"role": "user", "content": _with_device_info(json.dumps(brief_json, indent=2), device_info)}
+            ]
+            resp_2_str = await provider.completion(messages=msgs_2, response_schema=ResponseSchema.SCREENS)
+            sitemap_json = json.loads(resp_2_str)
+            await self._complete_step(PlanningStep.SITEMAP, sitemap_json)
+            logger.info(f"Sitemap generated with {len(sitemap_json.get('screens', []))} screens.")
+
+        return {
+            "brief": brief_json,
+            "sitemap": sitemap_json,
+            "device_info": device_info
+        }
+
+    def _sub_prompt_messages(self, plan: dict) -> List[Dict[str, str]]:
+        # Prepare input for sub-prompter
+        sub_gen_input = {
+            **plan["sitemap"],  # merge sitemap details
+            "generation_type": self.job_data["generation_type"],
+            "screen_count": self.job_data["screen_count"]
+        }
+
+        return [
+            {"role": "system", "content": SUB_PROMPT_SYSTEM_PROMPT},
+            {"role": "user", "content": _with_device_info(json.dumps(sub_gen_input, indent=2), plan["device_info"])}
+        ]
+
+    def _planning_result(self, plan: dict, sub_prompts: dict) -> dict:
+        # Return both key artifacts: the detailed sub-prompts AND the sitemap context
+        # (The workflow orchestrator will need to pass the sitemap to ComponentGenerator)
+        return {
+            "optimized_prompt": str(plan["brief"]),
+            "information_architecture": str(plan["sitemap"]),
+            "sub_prompts": sub_prompts,
+            "device_info": plan["device_info"]
+        }
+
+    async def prepare(self, provider: LLMProvider) -> dict:
+        """
+        Runs steps 1 and 2 of the planning chain. The returned planning dict has
+        no "sub_prompts" yet; those are streamed by `stream_sub_prompts`.
+        """
         try:
             logger.info("Starting Chained Planning Phase...")
-            provider = LLMFactory.create_provider(self.job_data["model"])
-            
-            try:
-                # 0. Setup Context
-                user_prompt = self.job_data["user_prompt"]
-                screen_count = self.job_data["screen_count"]
-                generation_type = self.job_data["generation_type"]
-                # Detect device size or default
-                device = self.job_data.get("device")
-                if not device or "name" not in device:
-                    raise DeviceSizeNotFoundException("Device information is missing from job data.")
-                
-                device_name = device["name"]
-                try:
-                    device_enum = AvailableDeviceSizes.get_device_by_name(device_name)
-                    # Store device info as dict
-                    device_info = {
-                        "name": device_enum.name,
-                        "width": device_enum.width,
-                        "height": device_enum.height,
-                        "corner_radius": device_enum.corner_radius
-                    }
-                except ValueError:
-                     raise DeviceSizeNotFoundException("Device size not found for device: " + device_name)
-    
-                # ------------------------------------------------------------------
-                # STEP 1: PROMPT ENHANCER
-                # ------------------------------------------------------------------
-                logger.info("Step 1: Enhancing User Prompt...")
-                enhancer_system = PROMPT_ENHANCER.format(
-                    json_rules=JSON_RULES_SNIPPET,
-                    ux_laws=UX_LAWS_SNIPPET,
-                    device_info=json.dumps(device_info, indent=2)
-                )
-                
-                msgs_1 = [
-                    {"role": "system", "content": enhancer_system},
-                    {"role": "user", "content": user_prompt}
-                ]
-                resp_1_str = provider.completion(messages=msgs_1)
-                brief_json = json.loads(resp_1_str)
-                logger.info("Prompt Enhanced successfully.")
-    
-                # ------------------------------------------------------------------
-                # STEP 2: INFORMATION ARCHITECTURE
-                # ------------------------------------------------------------------
-                logger.info("Step 2: Designing Information Architecture...")
-                ia_system = INFORMATION_ARCHITECTURE.format(
-                    json_rules=JSON_RULES_SNIPPET,
-                    ux_laws=UX_LAWS_SNIPPET,
-                    device_info=json.dumps(device_info, indent=2)
-                )
-                # Pass the enhanced brief as input
-                msgs_2 = [
-                    {"role": "system", "content": ia_system},
-                    {"role": "user", "content": json.dumps(brief_json, indent=2)}
-                ]
-                resp_2_str = provider.completion(messages=msgs_2)
-                sitemap_json = json.loads(resp_2_str)
-                logger.info(f"Sitemap generated with {len(sitemap_json.get('screens', []))} screens.")
-    
-                # ------------------------------------------------------------------
-                # STEP 3: SUB-PROMPT GENERATOR
-                # ------------------------------------------------------------------
-                logger.info("Step 3: Generating Screen Sub-Prompts...")
-                sub_gen_system = SCREEN_SUB_PROMPT_GENERATOR_AGENT.format(
-                    json_rules=JSON_RULES_SNIPPET,
-                    ux_laws=UX_LAWS_SNIPPET,
-                    device_info=json.dumps(device_info, indent=2)
-                )
-                
-                # Prepare input for sub-prompter
-                sub_gen_input = {
-                    **sitemap_json,  # merge sitemap details
-                    "generation_type": generation_type,
-                    "screen_count": screen_count
-                }
-    
-                msgs_3 = [
-                    {"role": "system", "content": sub_gen_system},
-                    {"role": "user", "content": json.dumps(sub_gen_input, indent=2)}
-                ]
-                resp_3_str = provider.completion(messages=msgs_3)
-                final_prompts_json = json.loads(resp_3_str)
-                
-                # Return both key artifacts: the detailed sub-prompts AND the sitemap context
-                # (The workflow orchestrator will need to pass the sitemap to ComponentGenerator)
-                return {
-                    "optimized_prompt": str(brief_json),
-                    "information_architecture": str(sitemap_json),
-                    "sub_prompts": final_prompts_json,
-                    "device_info": device_info
-                }
-            finally:
-                if hasattr(provider, "close"):
-                    provider.close()
+            plan = await self._plan(provider)
+            planning = self._planning_result(plan, None)
+            planning["plan"] = plan
+            return planning
+
+        except Exception as e:
+            logger.error(f"Planning Phase Failed: {str(e)}")
+            raise PromptGenerationFailedException(f"Failed to execute planning chain: {str(e)}")
+
+    async def stream_sub_prompts(self, provider: LLMProvider, planning: dict) -> AsyncIterator[dict]:
+        """
+        Step 3 of the planning chain in streaming mode. Yields each
+        {screen_name, sub_prompt} as soon as it is complete in the stream and
+        stores the full result under planning["sub_prompts"] once it ends.
+        """
+        checkpointed = self.checkpoint.get(PlanningStep.SUB_PROMPTS.value)
+        if checkpointed is not None:
+            logger.info("Step 3: Reusing checkpointed Screen Sub-Prompts.")
+            planning["sub_prompts"] = checkpointed
+            for screen in checkpointed.get("screens", []):
+                yield screen
+            return
+
+        try:
+            logger.info("Step 3: Streaming Screen Sub-Prompts...")
+            parser = ScreenStreamParser()
+            screens = []
+
+            async for chunk in provider.stream_completion(messages=self._sub_prompt_messages(planning["plan"])):
+                for screen in parser.feed(chunk):
+                    screens.append(screen)
+                    logger.info(f"Streamed sub-prompt {len(screens)}: {screen.get('screen_name')}")
+                    yield screen
+
+            if not screens:
+                # Nothing could be parsed incrementally, fall back to the full response
+                screens = json.loads(parser.text).get("screens", [])
+                for screen in screens:
+                    yield screen
+
+            planning["sub_prompts"] = {"screens": screens}
+            await self._complete_step(PlanningStep.SUB_PROMPTS, planning["sub_prompts"])
 
         except Exception as e:
             logger.error(f"Planning Phase Failed: {str(e)}")
@@ -4,7 +4,9 @@
 # -----------------------------------------------------------------------------
 # JSON_UI_GENERATOR_SYSTEM_PROMPT — unified single/multi-screen JSON generator
 # -----------------------------------------------------------------------------
-# vars {device_specs, JSON_RULES_SNIPPET, UX_LAWS_SNIPPET}
+# vars {JSON_RULES_SNIPPET, UX_LAWS_SNIPPET}
+# The prompt is the same for every device and job, so providers can cache it as a
+# prefix. Device specs go at the end of the request, see DEVICE_SPECS_BLOCK.
 
 JSON_UI_GENERATOR_SYSTEM_PROMPT = """
 <role>
@@ -14,13 +16,11 @@ plugin can render directly. You support BOTH single-screen and multi-screen
 generation, using the SAME JSON output shape.
 </role>
 
-<device_specs>
-{device_specs}
-
-Rules:
+<device_specs_rules>
+The target device is given in a <device_specs> block at the end of the request.
 - Use the provided width/height for the root frame of each screen.
 - Use the provided cornerRadius for the root frame (or main outer container).
-</device_specs>
+</device_specs_rules>
 
 {JSON_RULES_SNIPPET}
 
@@ -233,4 +233,10 @@ For each requested screen:
   ]
 }}
 </json_output_format>
-"""
\ No newline at end of file
+"""
+
+
+# Appended after the variable parts of the request, never into the system prompt
+DEVICE_SPECS_BLOCK = """<device_specs>
+{device_specs}
+</device_specs>"""
@@ -14,8 +14,7 @@ into a structured, enriched brief that downstream agents can use.
 {ux_laws}
 
 <device_sizes_reference>
-
-{device_info}
+The target device is given in a <device_info> block at the end of the input.
 </device_sizes_reference>
 
 <task>
@@ -75,7 +74,7 @@ and screen plan for the entire app.
   {ux_laws}
 
   <device_info>
-  {device_info}
+  The target device is given in a <device_info> block at the end of the input.
   </device_info>
 
   <task>
@@ -165,7 +164,7 @@ into deeply structured, self-contained sub-prompts for downstream JSON/UI genera
   {ux_laws}
 
   <device_info>
-  {device_info}
+  The target device is given in a <device_info> block at the end of the input.
   </device_info>
 
   <task>
@@ -232,3 +231,14 @@ Interpretation:
 }}
 </json_output_format>
 """
+
+
+# -----------------------------------------------------------------------------
+# DEVICE_INFO_BLOCK — the only device-specific part of the planning prompts
+# -----------------------------------------------------------------------------
+# The agent prompts above are the same for every device and job, so providers can
+# cache them as a prefix. This block goes at the end of the input instead.
+
+DEVICE_INFO_BLOCK = """<device_info>
+{device_info}
+</device_info>"""
@@ -0,0 +1,195 @@
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from llm.providers.concurrency import AdaptiveConcurrency, get_concurrency_controller
+from logs import logger
+
+# Slots of a scheduler one user may hold at once, per subscription_status, e.g. {"active": 8, "trialing": 4}
+USER_MAX_IN_FLIGHT: Dict[str, int] = json.loads(os.environ.get("USER_MAX_IN_FLIGHT", "{}"))
+# Cap for statuses without an entry
+USER_DEFAULT_MAX_IN_FLIGHT = int(os.environ.get("USER_DEFAULT_MAX_IN_FLIGHT", "4"))
+
+
+@dataclass
+class Tenant:
+    user_id: str
+    max_in_flight: int
+
+    @classmethod
+    def from_user(cls, user_id: str, user: Optional[dict]) -> "Tenant":
+        subscription_status = (user or {}).get("subscription_status")
+        return cls(user_id, USER_MAX_IN_FLIGHT.get(subscription_status, USER_DEFAULT_MAX_IN_FLIGHT))
+
+
+# User the current job runs for; work submitted without one shares a single uncapped queue
+current_tenant: ContextVar[Optional[Tenant]] = ContextVar("tenant", default=None)
+
+
+@dataclass(order=True)
+class _ScheduledTask:
+    priority: int
+    sequence: int
+    factory: Callable[[], Awaitable[Any]] = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    label: str = field(compare=False, default="")
+    enqueued_at: float = field(compare=False, default=0.0)
+    timings: Optional[List["TaskTiming"]] = field(compare=False, default=None)
+    user_id: str = field(compare=False, default="")
+    user_max_in_flight: Optional[int] = field(compare=False, default=None)
+    task: Optional[asyncio.Task] = field(compare=False, default=None)
+
+
+@dataclass
+class TaskTiming:
+    label: str
+    priority: int
+    queue_wait: float
+    execution: float
+
+
+class ComponentScheduler:
+    """
+    Runs submitted coroutines with at most `max_in_flight` executing at once.
+    Work is queued per user of the `current_tenant`: a free slot goes to the user
+    with the fewest tasks running who is under their cap, so a large job cannot
+    starve small ones, and within a user by ascending priority (FIFO within a
+    priority). With a `controller` the limit follows its adaptive window instead.
+    Queue wait and execution time are logged for every task and appended to the
+    caller's `timings` list when one is given.
+    """
+
+    def __init__(self, name: str, max_in_flight: int, controller: Optional[AdaptiveConcurrency] = None):
+        self.name = name
+        self._max_in_flight = max(1, max_in_flight)
+        self.controller = controller
+        self.in_flight = 0
+        self._queues: Dict[str, List[_ScheduledTask]] = {}
+        self._user_in_flight: Dict[str, int] = {}
+        self._sequence = itertools.count()
+
+    @property
+    def max_in_flight(self) -> int:
+        if self.controller is not None:
+            return self.controller.limit
+        return self._max_in_flight
+
+    async def submit(self, factory: Callable[[], Awaitable[Any]], priority: int = 0, label: str = "", timings: Optional[List[TaskTiming]] = None) -> Any:
+        tenant = current_tenant.get()
+        entry = _ScheduledTask(
+            priority=priority,
+            sequence=next(self._sequence),
+            factory=factory,
+            future=asyncio.get_running_loop().create_future(),
+            label=label,
+            enqueued_at=time.monotonic(),
+            timings=timings,
+            user_id=tenant.user_id if tenant else "",
+            user_max_in_flight=max(1, tenant.max_in_flight) if tenant else None
+        )
+        heapq.heappush(self._queues.setdefault(entry.user_id, []), entry)
+        self._dispatch()
+
+        try:
+            return await entry.future
+        except asyncio.CancelledError:
+            # Queued entries are skipped by _dispatch, running ones are stopped
+            if entry.task is not None:
+                entry.task.cancel()
+            raise
+
+    def _next_user(self) -> Optional[str]:
+        """User with queued work and a free slot under their cap that has the fewest tasks running."""
+        next_user, next_key = None, None
+        for user_id, queue in list(self._queues.items()):
+            # Entries cancelled while queued are dropped lazily
+            while queue and queue[0].future.done():
+                heapq.heappop(queue)
+            if not queue:
+                del self._queues[user_id]
+                continue
+
+            running = self._user_in_flight.get(user_id, 0)
+            cap = queue[0].user_max_in_flight
+            if cap is not None and running >= cap:
+                continue
+            key = (running, queue[0].sequence)
+            if next_key is None or key < next_key:
+                next_user, next_key = user_id, key
+        return next_user
+
+    def _dispatch(self) -> None:
+        while self.in_flight < self.max_in_flight:
+            user_id = self._next_user()
+            if user_id is None:
+                return
+
+            entry = heapq.heappop(self._queues[user_id])
+            self.in_flight += 1
+            self._user_in_flight[user_id] = self._user_in_flight.get(user_id, 0) + 1
+            entry.task = asyncio.create_task(self._execute(entry))
+
+    async def _execute(self, entry: _ScheduledTask) -> None:
+        started_at = time.monotonic()
+        try:
+            result = await entry.factory()
+            if not entry.future.done():
+                entry.future.set_result(result)
+        except BaseException as e:
+            if not entry.future.done():
+                entry.future.set_exception(e)
+        finally:
+            self.in_flight -= 1
+            self._user_in_flight[entry.user_id] -= 1
+            if not self._user_in_flight[entry.user_id]:
+                del self._user_in_flight[entry.user_id]
+            timing = TaskTiming(
+                label=entry.label,
+                priority=entry.priority,
+                queue_wait=started_at - entry.enqueued_at,
+                execution=time.monotonic() - started_at
+            )
+            if entry.timings is not None:
+                entry.timings.append(timing)
+            logger.info(
+                f"Scheduler {self.name}: {timing.label} (priority {timing.priority}) "
+                f"waited {timing.queue_wait:.2f}s, ran {timing.execution:.2f}s"
+            )
+            self._dispatch()
+
+
+def summarize_timings(timings: List[TaskTiming]) -> Dict[str, float]:
+    """Aggregated queue wait vs execution time of a set of scheduled tasks."""
+    if not timings:
+        return {"tasks": 0}
+
+    waits = [t.queue_wait for t in timings]
+    executions = [t.execution for t in timings]
+    return {
+        "tasks": len(timings),
+        "avg_queue_wait": round(sum(waits) / len(waits), 3),
+        "max_queue_wait": round(max(waits), 3),
+        "avg_execution": round(sum(executions) / len(executions), 3),
+        "max_execution": round(max(executions), 3)
+    }
+
+
+_schedulers: Dict[str, ComponentScheduler] = {}
+
+
+def get_scheduler(model_name: str, max_in_flight: int) -> ComponentScheduler:
+    """
+    Returns the process-wide scheduler for a model, so concurrent jobs share its
+    limit. `max_in_flight` is the starting point of the model's adaptive window.
+    """
+    scheduler = _schedulers.get(model_name)
+    if scheduler is None:
+        scheduler = ComponentScheduler(model_name, max_in_flight, get_concurrency_controller(model_name, max_in_flight))
+        _schedulers[model_name] = scheduler
+    return scheduler
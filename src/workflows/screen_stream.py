@@ -0,0 +1,91 @@
+import json
+from typing import Dict, List
+
+from logs import logger
+
+
+class ScreenStreamParser:
+    """
+    Incrementally parses a streamed `{"screens": [...]}` response and hands back
+    every screen object as soon as its closing brace arrives, so component
+    generation can start before the sub-prompt generator has finished.
+    """
+
+    def __init__(self, array_key: str = "screens"):
+        self.array_key = array_key
+        self.buffer = ""
+        self.position = 0
+        self.in_array = False
+        self.array_closed = False
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.object_start = None
+
+    def feed(self, chunk: str) -> List[Dict]:
+        """Consumes a text chunk and returns the screens completed by it."""
+        self.buffer += chunk
+        completed = []
+
+        if not self.in_array and not self._find_array_start():
+            return completed
+
+        while self.position < len(self.buffer) and not self.array_closed:
+            char = self.buffer[self.position]
+
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char == "{":
+                if self.depth == 0:
+                    self.object_start = self.position
+                self.depth += 1
+            elif char == "}":
+                self.depth -= 1
+                if self.depth == 0 and self.object_start is not None:
+                    screen = self._parse_object(self.buffer[self.object_start:self.position + 1])
+                    if screen is not None:
+                        completed.append(screen)
+                    self.object_start = None
+            elif char == "]" and self.depth == 0:
+                self.array_closed = True
+
+            self.position += 1
+
+        return completed
+
+    def _find_array_start(self) -> bool:
+        key_index = self.buffer.find(f'"{self.array_key}"')
+        if key_index < 0:
+            return False
+
+        bracket_index = self.buffer.find("[", key_index)
+        if bracket_index < 0:
+            return False
+
+        self.in_array = True
+        self.position = bracket_index + 1
+        return True
+
+    def _parse_object(self, raw: str):
+        try:
+            screen = json.loads(raw)
+        except json.JSONDecodeError as e:
+            logger.warning(f"Skipping unparseable streamed screen: {e}")
+            return None
+
+        if not isinstance(screen, dict) or "sub_prompt" not in screen:
+            logger.warning(f"Skipping streamed screen without sub_prompt: {raw[:100]}")
+            return None
+
+        return screen
+
+    @property
+    def text(self) -> str:
+        return self.buffer
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Same as running with PYTHONPATH=./src
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
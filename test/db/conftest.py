@@ -0,0 +1,34 @@
+"""
+Tests using the `db` fixture run against a real MongoDB, e.g. a local container:
+
+  docker run -d -p 27017:27017 mongo:7
+  PYTHONPATH=./src python -m pytest test/db -v
+
+TEST_MONGO_URI points them at another server; they are skipped when none is reachable.
+"""
+import os
+import uuid
+
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+TEST_MONGO_URI = os.environ.get("TEST_MONGO_URI", "mongodb://localhost:27017")
+
+
+@pytest.fixture(scope="session")
+def mongo_client():
+    client = MongoClient(TEST_MONGO_URI, serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command("ping")
+    except PyMongoError as e:
+        pytest.skip(f"No MongoDB reachable at {TEST_MONGO_URI}: {e}")
+    yield client
+    client.close()
+
+
+@pytest.fixture
+def db(mongo_client):
+    name = f"test_{uuid.uuid4().hex[:12]}"
+    yield mongo_client[name]
+    mongo_client.drop_database(name)
@@ -0,0 +1,117 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from db import component_writer
+from db.component_writer import ComponentWriteBuffer
+from exceptions import ComponentStatusUpdateFailedException, DatabaseQueryFailedException
+from job_config import ComponentStatus
+
+
+@pytest.fixture
+def bulk_writes(monkeypatch):
+    """Records every bulk write; `errors` and `seconds` shape the next ones."""
+    recorder = SimpleNamespace(writes=[], errors={}, seconds=0.0)
+
+    def bulk_update_components_by_id(db, updates):
+        time.sleep(recorder.seconds)
+        recorder.writes.append(dict(updates))
+        return {component_id: error for component_id, error in recorder.errors.items() if component_id in updates}
+
+    monkeypatch.setattr(component_writer, "bulk_update_components_by_id", bulk_update_components_by_id)
+    return recorder
+
+
+def _buffer(flush_delay=0.01):
+    return ComponentWriteBuffer(db=None, flush_delay=flush_delay)
+
+
+class TestComponentWriteBuffer:
+    def test_concurrent_updates_share_one_bulk_write(self, bulk_writes):
+        async def scenario():
+            writer = _buffer()
+            await asyncio.gather(*(writer.update_result(f"c{i}", ComponentStatus.SUCCESSFUL, code="{}") for i in range(5)))
+            await writer.close()
+
+        asyncio.run(scenario())
+
+        assert len(bulk_writes.writes) == 1
+        assert sorted(bulk_writes.writes[0]) == [f"c{i}" for i in range(5)]
+
+    def test_later_update_of_a_component_wins_within_a_window(self, bulk_writes):
+        async def scenario():
+            writer = _buffer()
+            await asyncio.gather(
+                writer.update_planning("c1", ComponentStatus.RUNNING, "home"),
+                writer.update_result("c1", ComponentStatus.SUCCESSFUL, code="{}")
+            )
+            await writer.close()
+
+        asyncio.run(scenario())
+
+        assert bulk_writes.writes == [{"c1": {"status": "SUCCESSFUL", "sub_prompt": "home", "code": "{}"}}]
+
+    def test_failed_update_only_fails_its_own_writers(self, bulk_writes):
+        bulk_writes.errors = {"c2": ComponentStatusUpdateFailedException("c2 not found")}
+
+        async def scenario():
+            writer = _buffer()
+            results = await asyncio.gather(
+                writer.update_result("c1", ComponentStatus.SUCCESSFUL),
+                writer.update_result("c2", ComponentStatus.SUCCESSFUL),
+                return_exceptions=True
+            )
+            await writer.close()
+            return results
+
+        ok, failed = asyncio.run(scenario())
+
+        assert ok is None
+        assert isinstance(failed, ComponentStatusUpdateFailedException)
+
+    def test_failed_bulk_write_fails_every_writer(self, bulk_writes, monkeypatch):
+        def unavailable(db, updates):
+            raise DatabaseQueryFailedException("no database")
+
+        monkeypatch.setattr(component_writer, "bulk_update_components_by_id", unavailable)
+
+        async def scenario():
+            writer = _buffer()
+            results = await asyncio.gather(
+                writer.update_result("c1", ComponentStatus.SUCCESSFUL),
+                writer.update_result("c2", ComponentStatus.FAILED),
+                return_exceptions=True
+            )
+            await writer.close()
+            return results
+
+        assert all(isinstance(result, DatabaseQueryFailedException) for result in asyncio.run(scenario()))
+
+    def test_close_flushes_pending_updates_right_away(self, bulk_writes):
+        async def scenario():
+            writer = _buffer(flush_delay=60)
+            update = asyncio.create_task(writer.update_result("c1", ComponentStatus.FAILED))
+            await asyncio.sleep(0)
+            await writer.close()
+            await update
+
+        asyncio.run(asyncio.wait_for(scenario(), timeout=5))
+
+        assert bulk_writes.writes == [{"c1": {"status": "FAILED"}}]
+
+    def test_close_waits_for_a_bulk_write_already_running(self, bulk_writes):
+        bulk_writes.seconds = 0.2
+
+        async def scenario():
+            writer = _buffer()
+            # Cancelled like a pipeline at the deadline, after its update was handed to the flush
+            update = asyncio.create_task(writer.update_result("c1", ComponentStatus.SUCCESSFUL))
+            await asyncio.sleep(0.05)
+            update.cancel()
+            await writer.close()
+            return list(bulk_writes.writes)
+
+        # Landed before close returned, so it cannot overwrite what the caller writes next
+        assert asyncio.run(scenario()) == [{"c1": {"status": "SUCCESSFUL"}}]
@@ -0,0 +1,195 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from db import job_utils
+from db.job_utils import (
+    bulk_update_components,
+    bulk_update_components_by_id,
+    claim_job,
+    claim_next_submitted_job,
+    extend_job_lease,
+    release_job
+)
+from exceptions import (
+    ComponentStatusUpdateFailedException,
+    DatabaseQueryFailedException,
+    JobAlreadyClaimedException,
+    JobNotFoundException
+)
+from job_config import JobStatus
+
+
+def _now():
+    # Mongo returns naive UTC datetimes
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _insert_job(db, job_id, status=JobStatus.SUBMITTED, created_at="2026-01-01T00:00:00", **fields):
+    db["generation_jobs"].insert_one({"_id": job_id, "status": status.value, "created_at": created_at, **fields})
+
+
+def _insert_leased_job(db, job_id, owner, expires_in, attempts=1):
+    _insert_job(
+        db, job_id, JobStatus.RUNNING,
+        lease_owner=owner,
+        lease_expires_at=datetime.now(timezone.utc) + timedelta(seconds=expires_in),
+        attempts=attempts
+    )
+
+
+def _job(db, job_id):
+    return db["generation_jobs"].find_one({"_id": job_id})
+
+
+class TestClaimJob:
+    def test_claims_a_claimable_job_under_a_lease(self, db):
+        _insert_job(db, "job")
+
+        claimed = claim_job(db, "job", "owner", [JobStatus.SUBMITTED])
+
+        # The job as it was, so callers still see the status it was claimed from
+        assert claimed["status"] == JobStatus.SUBMITTED.value
+        job = _job(db, "job")
+        assert job["status"] == JobStatus.RUNNING.value
+        assert job["lease_owner"] == "owner"
+        assert job["lease_expires_at"] > _now()
+        assert job["attempts"] == 1
+
+    def test_status_outside_the_mode_is_not_claimed(self, db):
+        _insert_job(db, "job", JobStatus.COMPLETED)
+        with pytest.raises(JobAlreadyClaimedException):
+            claim_job(db, "job", "owner", [JobStatus.SUBMITTED])
+        assert claim_job(db, "job", "owner", [JobStatus.COMPLETED])["status"] == JobStatus.COMPLETED.value
+
+    def test_live_lease_of_another_owner_is_not_claimed(self, db):
+        _insert_leased_job(db, "job", "other", expires_in=60)
+        with pytest.raises(JobAlreadyClaimedException):
+            claim_job(db, "job", "owner", [JobStatus.SUBMITTED])
+        assert _job(db, "job")["lease_owner"] == "other"
+
+    def test_missing_job_is_not_found(self, db):
+        with pytest.raises(JobNotFoundException):
+            claim_job(db, "job", "owner", [JobStatus.SUBMITTED])
+
+    def test_expired_lease_is_reclaimed_as_a_new_attempt(self, db):
+        _insert_leased_job(db, "job", "other", expires_in=-1)
+
+        claim_job(db, "job", "owner", [JobStatus.SUBMITTED])
+
+        job = _job(db, "job")
+        assert job["lease_owner"] == "owner"
+        assert job["attempts"] == 2
+
+    def test_expired_lease_is_not_reclaimed_past_the_max_attempts(self, db):
+        _insert_leased_job(db, "job", "other", expires_in=-1, attempts=job_utils.JOB_MAX_ATTEMPTS)
+        with pytest.raises(JobAlreadyClaimedException):
+            claim_job(db, "job", "owner", [JobStatus.SUBMITTED])
+
+    def test_job_leased_before_attempts_were_counted_is_reclaimed(self, db):
+        _insert_job(db, "job", JobStatus.RUNNING, lease_owner="other", lease_expires_at=datetime.now(timezone.utc) - timedelta(seconds=1))
+        claim_job(db, "job", "owner", [JobStatus.SUBMITTED])
+        assert _job(db, "job")["attempts"] == 1
+
+    def test_handover_from_the_claiming_worker_is_not_another_attempt(self, db):
+        _insert_job(db, "job")
+
+        worker_claim = claim_next_submitted_job(db, "owner")
+        claimed = claim_job(db, "job", worker_claim["lease_owner"], [JobStatus.SUBMITTED])
+
+        assert claimed["status"] == JobStatus.RUNNING.value
+        assert _job(db, "job")["attempts"] == 1
+
+
+class TestClaimNextSubmittedJob:
+    def test_claims_the_oldest_submitted_job(self, db):
+        _insert_job(db, "newer", created_at="2026-01-02T00:00:00")
+        _insert_job(db, "older", created_at="2026-01-01T00:00:00")
+
+        job = claim_next_submitted_job(db, "owner")
+
+        # The job after the claim, leased to the worker
+        assert job["_id"] == "older"
+        assert job["status"] == JobStatus.RUNNING.value
+        assert job["lease_owner"] == "owner"
+        assert job["attempts"] == 1
+
+    def test_claims_expired_leases_until_the_max_attempts(self, db):
+        _insert_leased_job(db, "live", "other", expires_in=60)
+        _insert_leased_job(db, "exhausted", "other", expires_in=-1, attempts=job_utils.JOB_MAX_ATTEMPTS)
+        _insert_leased_job(db, "expired", "other", expires_in=-1)
+
+        assert claim_next_submitted_job(db, "owner")["_id"] == "expired"
+        assert claim_next_submitted_job(db, "owner") is None
+
+    def test_returns_none_without_jobs(self, db):
+        _insert_job(db, "done", JobStatus.COMPLETED)
+        assert claim_next_submitted_job(db, "owner") is None
+
+
+class TestJobLease:
+    def test_owner_extends_its_lease(self, db):
+        _insert_leased_job(db, "job", "owner", expires_in=1)
+        assert extend_job_lease(db, "job", "owner")
+        assert _job(db, "job")["lease_expires_at"] > _now() + timedelta(seconds=job_utils.JOB_LEASE_SECONDS / 2)
+
+    def test_taken_over_lease_is_not_extended(self, db):
+        _insert_leased_job(db, "job", "other", expires_in=1)
+        assert not extend_job_lease(db, "job", "owner")
+
+    def test_release_sets_the_status_and_drops_the_lease(self, db):
+        _insert_leased_job(db, "job", "owner", expires_in=60)
+
+        assert release_job(db, "job", "owner", JobStatus.FAILED, "boom")
+
+        job = _job(db, "job")
+        assert job["status"] == JobStatus.FAILED.value
+        assert job["error_message"] == "boom"
+        assert "lease_owner" not in job and "lease_expires_at" not in job
+
+    def test_release_of_a_taken_over_lease_changes_nothing(self, db):
+        _insert_leased_job(db, "job", "other", expires_in=60)
+        assert not release_job(db, "job", "owner", JobStatus.FAILED, "boom")
+        assert _job(db, "job")["status"] == JobStatus.RUNNING.value
+
+
+class TestBulkUpdateComponents:
+    @pytest.fixture
+    def components(self, db):
+        db["generated_components"].insert_many([
+            {"_id": "c1", "parent_job_id": "job", "status": "RUNNING"},
+            {"_id": "c2", "parent_job_id": "job", "status": "RUNNING", "code": "not a document"}
+        ])
+        return db["generated_components"]
+
+    def test_applies_every_update_in_one_call(self, db, components):
+        errors = bulk_update_components_by_id(db, {
+            "c1": {"status": "SUCCESSFUL", "code": "{}"},
+            "c2": {"status": "FAILED", "error_message": "boom"}
+        })
+
+        assert errors == {}
+        assert components.find_one({"_id": "c1"})["code"] == "{}"
+        assert components.find_one({"_id": "c2"})["error_message"] == "boom"
+
+    def test_unmatched_components_fail_on_their_own(self, db, components):
+        errors = bulk_update_components_by_id(db, {"c1": {"status": "SUCCESSFUL"}, "missing": {"status": "SUCCESSFUL"}})
+
+        assert list(errors) == ["missing"]
+        assert isinstance(errors["missing"], ComponentStatusUpdateFailedException)
+        assert components.find_one({"_id": "c1"})["status"] == "SUCCESSFUL"
+
+    def test_rejected_updates_fail_on_their_own(self, db, components):
+        # A field cannot be created under a string, the server rejects this update alone
+        errors = bulk_update_components_by_id(db, {"c1": {"status": "SUCCESSFUL"}, "c2": {"code.tree": {}}})
+
+        assert list(errors) == ["c2"]
+        assert isinstance(errors["c2"], DatabaseQueryFailedException)
+        assert components.find_one({"_id": "c1"})["status"] == "SUCCESSFUL"
+
+    def test_raising_wrapper_reports_the_unmatched_components(self, db, components):
+        with pytest.raises(ComponentStatusUpdateFailedException, match="missing"):
+            bulk_update_components(db, {"c1": {"status": "SUCCESSFUL"}, "missing": {"status": "SUCCESSFUL"}})
+
+    def test_nothing_to_update_makes_no_call(self):
+        assert bulk_update_components_by_id(None, {}) == {}
@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from db import llm_cache
+from db.llm_cache import LLM_CACHE_COLLECTION, find_cached_response, store_cached_response
+
+
+@pytest.fixture(autouse=True)
+def ttl_index(monkeypatch):
+    # Every test gets a fresh database, which needs its own index
+    monkeypatch.setattr(llm_cache, "_ttl_index_ready", False)
+
+
+class TestLLMCache:
+    def test_stored_response_is_found(self, db):
+        store_cached_response(db, "key", "model", '{"type": "frame"}')
+
+        assert find_cached_response(db, "key") == '{"type": "frame"}'
+        assert find_cached_response(db, "other") is None
+
+    def test_collection_expires_documents(self, db):
+        store_cached_response(db, "key", "model", "{}")
+
+        ttl = [index for index in db[LLM_CACHE_COLLECTION].list_indexes() if index["key"] == {"expires_at": 1}]
+        assert ttl and ttl[0]["expireAfterSeconds"] == 0
+
+    def test_expired_response_is_not_served_before_the_ttl_monitor_removes_it(self, db):
+        store_cached_response(db, "key", "model", "{}")
+        db[LLM_CACHE_COLLECTION].update_one(
+            {"_id": "key"}, {"$set": {"expires_at": datetime.now(timezone.utc) - timedelta(seconds=1)}}
+        )
+
+        assert find_cached_response(db, "key") is None
+
+    def test_storing_again_refreshes_an_expired_response(self, db):
+        store_cached_response(db, "key", "model", "{}")
+        db[LLM_CACHE_COLLECTION].update_one(
+            {"_id": "key"}, {"$set": {"expires_at": datetime.now(timezone.utc) - timedelta(seconds=1)}}
+        )
+
+        store_cached_response(db, "key", "model", '{"type": "frame"}')
+
+        assert find_cached_response(db, "key") == '{"type": "frame"}'
+        assert db[LLM_CACHE_COLLECTION].count_documents({}) == 1
@@ -0,0 +1,125 @@
+import asyncio
+import threading
+from datetime import datetime, timezone
+
+import pytest
+
+from db import rate_limiter
+from db.rate_limiter import RATE_LIMIT_COLLECTION, acquire_rate_limit, estimate_tokens, lease_rate_limit_window
+from deadline import PERSIST_RESERVE_SECONDS, Deadline, current_deadline
+from exceptions import RateLimitExceededException
+
+WINDOW = rate_limiter.RATE_LIMIT_WINDOW_SECONDS
+# Start of a window, so tests control where in it each lease happens
+WINDOW_START = 1_700_000_000 // WINDOW * WINDOW
+
+
+def _window_doc(db, key, window_start=WINDOW_START):
+    return db[RATE_LIMIT_COLLECTION].find_one({"_id": f"{key}:{window_start}"})
+
+
+class TestLeaseRateLimitWindow:
+    def test_grants_up_to_the_rpm_limit(self, db):
+        limits = {"rpm": 3}
+        for offset in range(3):
+            assert lease_rate_limit_window(db, "model", 0, limits, WINDOW_START + offset) is None
+        assert _window_doc(db, "model")["requests"] == 3
+
+    def test_full_window_returns_the_wait_until_the_next_one(self, db):
+        limits = {"rpm": 2}
+        lease_rate_limit_window(db, "model", 0, limits, WINDOW_START)
+        lease_rate_limit_window(db, "model", 0, limits, WINDOW_START + 1)
+
+        # The conditional upsert collides with the full window: DuplicateKeyError
+        assert lease_rate_limit_window(db, "model", 0, limits, WINDOW_START + 15.5) == pytest.approx(WINDOW - 15.5)
+        assert _window_doc(db, "model")["requests"] == 2
+
+    def test_tokens_are_limited_per_window(self, db):
+        limits = {"rpm": 100, "tpm": 1000}
+        assert lease_rate_limit_window(db, "model", 600, limits, WINDOW_START) is None
+        assert lease_rate_limit_window(db, "model", 500, limits, WINDOW_START + 1) == pytest.approx(WINDOW - 1)
+        assert lease_rate_limit_window(db, "model", 400, limits, WINDOW_START + 2) is None
+
+        doc = _window_doc(db, "model")
+        assert (doc["requests"], doc["tokens"]) == (2, 1000)
+
+    def test_window_rolls_over_at_its_boundary(self, db):
+        limits = {"rpm": 1}
+        assert lease_rate_limit_window(db, "model", 0, limits, WINDOW_START + WINDOW - 1) is None
+        assert lease_rate_limit_window(db, "model", 0, limits, WINDOW_START + WINDOW - 0.25) == pytest.approx(0.25)
+
+        assert lease_rate_limit_window(db, "model", 0, limits, WINDOW_START + WINDOW) is None
+        assert _window_doc(db, "model")["requests"] == 1
+        assert _window_doc(db, "model", WINDOW_START + WINDOW)["requests"] == 1
+
+    def test_window_document_expires_after_the_window(self, db):
+        lease_rate_limit_window(db, "model", 10, {"rpm": 5}, WINDOW_START)
+        doc = _window_doc(db, "model")
+        assert doc["key"] == "model"
+        assert doc["window_start"] == WINDOW_START
+        expires_at = doc["expires_at"].replace(tzinfo=timezone.utc)
+        assert expires_at == datetime.fromtimestamp(WINDOW_START + 2 * WINDOW, tz=timezone.utc)
+
+    def test_keys_have_separate_windows(self, db):
+        limits = {"rpm": 1}
+        assert lease_rate_limit_window(db, "a", 0, limits, WINDOW_START) is None
+        assert lease_rate_limit_window(db, "b", 0, limits, WINDOW_START) is None
+        assert lease_rate_limit_window(db, "a", 0, limits, WINDOW_START + 1) is not None
+
+    def test_concurrent_leases_never_exceed_the_limit(self, db):
+        limits = {"rpm": 10}
+        granted = []
+        barrier = threading.Barrier(8)
+
+        def lease():
+            barrier.wait()
+            for _ in range(5):
+                if lease_rate_limit_window(db, "model", 0, limits, WINDOW_START + 1) is None:
+                    granted.append(1)
+
+        threads = [threading.Thread(target=lease) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # The threads also race to create the window, the losers must not see it as full
+        assert len(granted) == 10
+        assert _window_doc(db, "model")["requests"] == 10
+
+
+class TestAcquireRateLimit:
+    def test_models_without_limits_are_not_leased(self, monkeypatch):
+        monkeypatch.setattr(rate_limiter, "RATE_LIMITS", {})
+        monkeypatch.setattr(rate_limiter, "get_db", lambda: pytest.fail("no lease expected"))
+        asyncio.run(acquire_rate_limit("model", 100))
+
+    def test_unavailable_database_proceeds_without_a_lease(self, monkeypatch):
+        def unavailable():
+            raise ConnectionError("no database")
+
+        monkeypatch.setattr(rate_limiter, "RATE_LIMITS", {"model": {"rpm": 1}})
+        monkeypatch.setattr(rate_limiter, "get_db", unavailable)
+        asyncio.run(acquire_rate_limit("model"))
+
+    def test_waits_for_the_next_window(self, monkeypatch):
+        waits = [0.01, None]
+        monkeypatch.setattr(rate_limiter, "_next_wait", lambda key, tokens: waits.pop(0))
+        monkeypatch.setattr(rate_limiter.random, "uniform", lambda low, high: 0.0)
+        asyncio.run(acquire_rate_limit("model"))
+        assert waits == []
+
+    def test_wait_past_the_deadline_raises(self, monkeypatch):
+        monkeypatch.setattr(rate_limiter, "_next_wait", lambda key, tokens: 30.0)
+
+        async def within_deadline():
+            current_deadline.set(Deadline.from_timeout(PERSIST_RESERVE_SECONDS + 5))
+            await acquire_rate_limit("model")
+
+        with pytest.raises(RateLimitExceededException):
+            asyncio.run(within_deadline())
+
+
+def test_estimate_tokens():
+    assert estimate_tokens([{"role": "system", "content": "x" * 40}, {"role": "user", "content": "y" * 8}]) == 12
+    assert estimate_tokens([{"role": "user", "content": None}]) == 0
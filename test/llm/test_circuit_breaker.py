@@ -0,0 +1,189 @@
+import asyncio
+
+import httpx
+import pytest
+
+from exceptions import LLMProviderCompletionFailedException, RateLimitExceededException
+from llm.providers import circuit_breaker
+from llm.providers.circuit_breaker import BreakerState, CircuitBreaker, get_circuit_breaker, is_model_failure
+from llm.providers.failover import FailoverProvider
+
+
+class _StatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+def _wrapped(error: Exception) -> LLMProviderCompletionFailedException:
+    """The provider exception as raised from inside the provider's except block."""
+    try:
+        try:
+            raise error
+        except Exception as e:
+            raise LLMProviderCompletionFailedException(f"request failed: {e}")
+    except LLMProviderCompletionFailedException as wrapped:
+        return wrapped
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture(autouse=True)
+def breaker_settings(monkeypatch):
+    monkeypatch.setattr(circuit_breaker, "BREAKER_MIN_CALLS", 4)
+    monkeypatch.setattr(circuit_breaker, "BREAKER_ERROR_RATE", 0.5)
+    monkeypatch.setattr(circuit_breaker, "BREAKER_SLOW_CALL_RATE", 0.8)
+    monkeypatch.setattr(circuit_breaker, "BREAKER_SLOW_CALL_SECONDS", 10.0)
+    monkeypatch.setattr(circuit_breaker, "BREAKER_OPEN_SECONDS", 30.0)
+    monkeypatch.setattr(circuit_breaker, "_breakers", {})
+
+
+def _open_breaker(breaker: CircuitBreaker) -> None:
+    for _ in range(4):
+        breaker.record_failure()
+    assert breaker.state == BreakerState.OPEN
+
+
+class TestCircuitBreaker:
+    def test_stays_closed_below_min_calls(self, clock):
+        breaker = CircuitBreaker("m")
+        for _ in range(3):
+            breaker.record_failure()
+        assert breaker.state == BreakerState.CLOSED
+        assert breaker.allow_request()
+
+    def test_opens_at_the_error_rate(self, clock):
+        breaker = CircuitBreaker("m")
+        breaker.record_success(1.0)
+        breaker.record_success(1.0)
+        breaker.record_failure()
+        assert breaker.state == BreakerState.CLOSED
+        breaker.record_failure()
+        assert breaker.state == BreakerState.OPEN
+        assert not breaker.allow_request()
+
+    def test_opens_at_the_slow_call_rate(self, clock):
+        breaker = CircuitBreaker("m")
+        breaker.record_success(1.0)
+        for _ in range(3):
+            breaker.record_success(20.0)
+        assert breaker.state == BreakerState.CLOSED
+        breaker.record_success(20.0)
+        assert breaker.state == BreakerState.OPEN
+
+    def test_lets_one_probe_through_after_the_open_period(self, clock):
+        breaker = CircuitBreaker("m")
+        _open_breaker(breaker)
+
+        clock[0] += 29
+        assert not breaker.allow_request()
+        clock[0] += 2
+        assert breaker.allow_request()
+        assert breaker.state == BreakerState.HALF_OPEN
+        assert not breaker.allow_request()
+
+    def test_successful_probe_closes(self, clock):
+        breaker = CircuitBreaker("m")
+        _open_breaker(breaker)
+        clock[0] += 31
+        assert breaker.allow_request()
+
+        breaker.record_success(1.0)
+        assert breaker.state == BreakerState.CLOSED
+        assert breaker.allow_request()
+
+    @pytest.mark.parametrize("outcome", ["failure", "slow"])
+    def test_failed_or_slow_probe_reopens(self, clock, outcome):
+        breaker = CircuitBreaker("m")
+        _open_breaker(breaker)
+        clock[0] += 31
+        assert breaker.allow_request()
+
+        if outcome == "failure":
+            breaker.record_failure()
+        else:
+            breaker.record_success(20.0)
+        assert breaker.state == BreakerState.OPEN
+        assert not breaker.allow_request()
+
+    def test_released_probe_lets_another_through(self, clock):
+        breaker = CircuitBreaker("m")
+        _open_breaker(breaker)
+        clock[0] += 31
+        assert breaker.allow_request()
+        breaker.release_probe()
+        assert breaker.allow_request()
+
+    def test_breakers_are_shared_per_model(self):
+        assert get_circuit_breaker("a") is get_circuit_breaker("a")
+        assert get_circuit_breaker("a") is not get_circuit_breaker("b")
+
+
+class TestIsModelFailure:
+    @pytest.mark.parametrize("error", [
+        _StatusError(500),
+        _StatusError(503),
+        _StatusError(408),
+        httpx.ConnectError("connection reset"),
+        asyncio.TimeoutError(),
+        TimeoutError()
+    ])
+    def test_transport_errors_timeouts_and_5xx_count(self, error):
+        assert is_model_failure(_wrapped(error))
+
+    @pytest.mark.parametrize("error", [
+        _StatusError(429),
+        _StatusError(400),
+        RateLimitExceededException("no capacity before the deadline"),
+        LLMProviderCompletionFailedException("Content blocked by safety filters: SAFETY"),
+        ValueError("unparseable response")
+    ])
+    def test_rate_limits_and_rejected_requests_do_not(self, error):
+        assert not is_model_failure(_wrapped(error))
+
+    def test_unwraps_nested_provider_exceptions(self):
+        assert is_model_failure(_wrapped(_wrapped(_StatusError(502))))
+
+
+class _Provider:
+    def __init__(self, name, error=None):
+        self.name = name
+        self.error = error
+        self.calls = 0
+
+    async def completion(self, messages, response_schema=None):
+        self.calls += 1
+        if self.error is not None:
+            raise _wrapped(self.error)
+        return self.name
+
+
+class TestFailoverProvider:
+    def test_falls_back_and_opens_the_failing_models_breaker(self, clock):
+        primary, fallback = _Provider("primary", _StatusError(503)), _Provider("fallback")
+        provider = FailoverProvider([("primary", primary), ("fallback", fallback)])
+
+        results = [asyncio.run(provider.completion([])) for _ in range(6)]
+        assert results == ["fallback"] * 6
+        # Skipped without being called once its breaker opened
+        assert primary.calls == 4
+        assert get_circuit_breaker("primary").state == BreakerState.OPEN
+
+    def test_rate_limits_fall_back_without_opening_the_breaker(self, clock):
+        primary, fallback = _Provider("primary", _StatusError(429)), _Provider("fallback")
+        provider = FailoverProvider([("primary", primary), ("fallback", fallback)])
+
+        results = [asyncio.run(provider.completion([])) for _ in range(6)]
+        assert results == ["fallback"] * 6
+        assert primary.calls == 6
+        assert get_circuit_breaker("primary").state == BreakerState.CLOSED
+
+    def test_raises_when_no_model_succeeds(self, clock):
+        provider = FailoverProvider([("a", _Provider("a", _StatusError(500))), ("b", _Provider("b", _StatusError(400)))])
+        with pytest.raises(LLMProviderCompletionFailedException):
+            asyncio.run(provider.completion([]))
@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+from llm.providers import hedging
+from llm.providers.hedging import LatencyTracker, get_hedge_stats, get_latency_tracker, hedged_call
+
+
+@pytest.fixture
+def hedging_on(monkeypatch):
+    monkeypatch.setattr(hedging, "HEDGING_ENABLED", True)
+    monkeypatch.setattr(hedging, "HEDGE_MIN_SAMPLES", 3)
+    monkeypatch.setattr(hedging, "HEDGE_PERCENTILE", 95)
+    monkeypatch.setattr(hedging, "HEDGE_MAX_RATE", 1.0)
+    monkeypatch.setattr(hedging, "_trackers", {})
+    monkeypatch.setattr(hedging, "_stats", {})
+    tracker = get_latency_tracker("m", "component")
+    for _ in range(5):
+        tracker.record(0.05)
+    return tracker
+
+
+def _requests(*latencies):
+    """Attempts that take the given times, in order, and return their attempt number."""
+    attempts = []
+
+    async def request():
+        attempts.append(len(attempts) + 1)
+        attempt = len(attempts)
+        await asyncio.sleep(latencies[attempt - 1])
+        return f"attempt {attempt}"
+
+    return request, attempts
+
+
+class TestLatencyTracker:
+    def test_percentile(self):
+        tracker = LatencyTracker(window=10)
+        assert tracker.percentile(95) is None
+        for latency in range(1, 11):
+            tracker.record(float(latency))
+        assert tracker.percentile(50) == 5.0
+        assert tracker.percentile(100) == 10.0
+
+    def test_window_keeps_recent_latencies(self):
+        tracker = LatencyTracker(window=3)
+        for latency in (100.0, 1.0, 2.0, 3.0):
+            tracker.record(latency)
+        assert len(tracker) == 3
+        assert tracker.percentile(100) == 3.0
+
+
+class TestHedgedCall:
+    def test_disabled_is_a_plain_await(self, hedging_on, monkeypatch):
+        monkeypatch.setattr(hedging, "HEDGING_ENABLED", False)
+        request, attempts = _requests(0.2)
+        assert asyncio.run(hedged_call("m", "component", request)) == "attempt 1"
+        assert attempts == [1]
+
+    def test_fast_call_is_not_hedged(self, hedging_on):
+        request, attempts = _requests(0.01)
+        assert asyncio.run(hedged_call("m", "component", request)) == "attempt 1"
+        assert attempts == [1]
+        assert get_hedge_stats("m").hedged == 0
+
+    def test_slow_call_is_won_by_the_hedge(self, hedging_on):
+        request, attempts = _requests(1.0, 0.05)
+        assert asyncio.run(hedged_call("m", "component", request)) == "attempt 2"
+        assert attempts == [1, 2]
+
+        stats = get_hedge_stats("m")
+        assert (stats.hedged, stats.hedge_wins) == (1, 1)
+        # The primary ran ~0.10s before it was cancelled, the hedge answered in ~0.05s
+        assert 0.03 <= stats.latency_saved <= 0.1
+
+    def test_cancelled_primary_is_recorded_as_a_lower_bound(self, hedging_on):
+        request, _ = _requests(1.0, 0.05)
+        asyncio.run(hedged_call("m", "component", request))
+        # The hedge's latency and the time the primary had run
+        assert len(hedging_on) == 7
+        assert hedging_on.percentile(100) >= 0.09
+
+    def test_primary_can_still_win(self, hedging_on):
+        request, attempts = _requests(0.08, 1.0)
+        assert asyncio.run(hedged_call("m", "component", request)) == "attempt 1"
+        assert attempts == [1, 2]
+        assert get_hedge_stats("m").hedge_wins == 0
+        assert get_hedge_stats("m").latency_saved == 0.0
+
+    def test_hedge_rescues_a_failed_primary(self, hedging_on):
+        attempts = []
+
+        async def request():
+            attempts.append(1)
+            if len(attempts) == 1:
+                await asyncio.sleep(0.08)
+                raise ConnectionError("reset")
+            await asyncio.sleep(0.1)
+            return "hedge"
+
+        assert asyncio.run(hedged_call("m", "component", request)) == "hedge"
+        # A failed primary is no latency sample and saves nothing
+        assert get_hedge_stats("m").latency_saved == 0.0
+
+    def test_max_rate_caps_hedging(self, hedging_on, monkeypatch):
+        monkeypatch.setattr(hedging, "HEDGE_MAX_RATE", 0.0)
+        request, attempts = _requests(0.1)
+        assert asyncio.run(hedged_call("m", "component", request)) == "attempt 1"
+        assert attempts == [1]
@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from llm.providers import image_gen
+from llm.providers.image_gen import generate_images_concurrently
+from llm.providers.key_pool import KeyPool
+
+
+@pytest.fixture
+def generations(monkeypatch):
+    """Records the Imagen requests sent, each answered after a short delay."""
+    sent = []
+
+    async def generate(key_pool, model_name, prompt, count=1):
+        sent.append(prompt if count == 1 else (prompt, count))
+        number = len(sent)
+        await asyncio.sleep(0.01)
+        if "fail" in prompt:
+            return []
+        return [f"{prompt}#{number}".encode()] + [f"{prompt}#{number}.{i}".encode() for i in range(1, count)]
+
+    monkeypatch.setattr(image_gen, "_generate_single_image_set", generate)
+    monkeypatch.setattr(image_gen, "get_google_key_pool", lambda: KeyPool("Google", ["key"]))
+    monkeypatch.setattr(image_gen, "_in_flight", {})
+    return sent
+
+
+class TestGenerateImagesConcurrently:
+    def test_normalised_duplicates_are_generated_once(self, generations):
+        images = asyncio.run(generate_images_concurrently({
+            "a": ["User avatar", "hero"],
+            "b": ["user avatar.", "cart"],
+            "c": ["  USER   avatar"]
+        }))
+        assert generations == ["User avatar", "hero", "cart"]
+        assert images == {
+            "a": [b"User avatar#1", b"hero#2"],
+            "b": [b"User avatar#1", b"cart#3"],
+            "c": [b"User avatar#1"]
+        }
+
+    def test_concurrent_calls_join_the_request_in_flight(self, generations):
+        async def scenario():
+            return await asyncio.gather(*(generate_images_concurrently({f"c{i}": ["avatar"]}) for i in range(5)))
+
+        results = asyncio.run(scenario())
+        assert generations == ["avatar"]
+        assert [result[f"c{i}"] for i, result in enumerate(results)] == [[b"avatar#1"]] * 5
+        assert image_gen._in_flight == {}
+
+    def test_cancelled_caller_does_not_cancel_the_shared_request(self, generations):
+        async def scenario():
+            first = asyncio.create_task(generate_images_concurrently({"a": ["avatar"]}))
+            second = asyncio.create_task(generate_images_concurrently({"b": ["avatar"]}))
+            await asyncio.sleep(0)
+            first.cancel()
+            return await second
+
+        assert asyncio.run(scenario()) == {"b": [b"avatar#1"]}
+        assert generations == ["avatar"]
+
+    def test_finished_prompts_are_generated_again(self, generations):
+        asyncio.run(generate_images_concurrently({"a": ["avatar"]}))
+        asyncio.run(generate_images_concurrently({"b": ["avatar"]}))
+        assert generations == ["avatar", "avatar"]
+
+    def test_failed_prompts_are_left_out(self, generations):
+        images = asyncio.run(generate_images_concurrently({"a": ["fail me", "hero"], "b": ["fail me"]}))
+        assert images == {"a": [b"hero#2"], "b": []}
+
+    def test_no_keys_generates_nothing(self, generations, monkeypatch):
+        monkeypatch.setattr(image_gen, "get_google_key_pool", lambda: KeyPool("Google", []))
+        assert asyncio.run(generate_images_concurrently({"a": ["avatar"]})) == {}
+        assert generations == []
+
+
+class TestDistinctVariants:
+    def test_repeats_are_batched_into_one_request(self, generations):
+        images = asyncio.run(generate_images_concurrently({"a": ["avatar", "hero"], "b": ["Avatar."], "c": ["avatar"]}, distinct_variants=True))
+        assert sorted(generations, key=str) == [("avatar", 3), "hero"]
+        assert images["a"][0] != images["b"][0] != images["c"][0] != images["a"][0]
+        assert {images["a"][0], images["b"][0], images["c"][0]} == {b"avatar#1", b"avatar#1.1", b"avatar#1.2"}
+
+    def test_more_repeats_than_a_request_returns_are_split(self, generations):
+        images = asyncio.run(generate_images_concurrently({f"c{i}": ["avatar"] for i in range(6)}, distinct_variants=True))
+        assert generations == [("avatar", image_gen.IMAGES_PER_REQUEST), ("avatar", 2)]
+        assert len({image for component_images in images.values() for image in component_images}) == 6
+
+    def test_single_occurrences_still_join_the_request_in_flight(self, generations):
+        async def scenario():
+            return await asyncio.gather(*(generate_images_concurrently({f"c{i}": ["avatar"]}, distinct_variants=True) for i in range(3)))
+
+        results = asyncio.run(scenario())
+        assert generations == ["avatar"]
+        assert [result[f"c{i}"] for i, result in enumerate(results)] == [[b"avatar#1"]] * 3
+
+    def test_missing_variants_are_left_out(self, generations, monkeypatch):
+        async def generate_fewer(key_pool, model_name, prompt, count=1):
+            return [b"only one"]
+
+        monkeypatch.setattr(image_gen, "_generate_single_image_set", generate_fewer)
+        images = asyncio.run(generate_images_concurrently({"a": ["avatar"], "b": ["avatar"]}, distinct_variants=True))
+        assert images == {"a": [b"only one"], "b": []}
@@ -0,0 +1,157 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from llm.providers import key_pool
+from llm.providers.key_pool import KeyPool, get_key_pool
+
+
+class _StatusError(Exception):
+    def __init__(self, status_code: int, headers: dict = None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=headers or {})
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(key_pool, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    monkeypatch.setattr(key_pool, "KEY_COOLDOWN_SECONDS", 30.0)
+    return now
+
+
+def _use(pool: KeyPool, clock, error: Exception = None) -> str:
+    """One call through the pool, returning the key it was given."""
+    clock[0] += 1
+    used = []
+
+    async def request(api_key):
+        used.append(api_key)
+        if error is not None:
+            raise error
+        return api_key
+
+    try:
+        asyncio.run(pool.call(request))
+    except Exception:
+        pass
+    return used[0]
+
+
+class TestKeyPool:
+    def test_idle_keys_rotate(self, clock):
+        pool = KeyPool("test", ["a", "b", "c"])
+        assert [_use(pool, clock) for _ in range(6)] == ["a", "b", "c", "a", "b", "c"]
+
+    def test_concurrent_calls_spread_over_keys(self):
+        async def scenario():
+            pool = KeyPool("test", ["a", "b"])
+            release = asyncio.Event()
+            used = []
+
+            async def request(api_key):
+                used.append(api_key)
+                await release.wait()
+
+            calls = [asyncio.create_task(pool.call(request)) for _ in range(4)]
+            await asyncio.sleep(0)
+            release.set()
+            await asyncio.gather(*calls)
+            assert sorted(used) == ["a", "a", "b", "b"]
+
+        asyncio.run(scenario())
+
+    def test_prefers_the_key_with_most_reported_headroom(self, clock):
+        pool = KeyPool("test", ["a", "b"])
+        pool.observe_headers("a", {"x-ratelimit-remaining-requests": "5"})
+        pool.observe_headers("b", {"x-ratelimit-remaining-requests": "50"})
+        assert _use(pool, clock) == "b"
+
+        # Unreported headroom counts as unlimited
+        pool.observe_headers("b", {"x-ratelimit-remaining-requests": "1"})
+        pool.observe_headers("a", {})
+        assert _use(pool, clock) == "a"
+
+    def test_stale_headroom_is_ignored(self, clock):
+        pool = KeyPool("test", ["a", "b"])
+        pool.observe_headers("a", {"x-ratelimit-remaining-requests": "0"})
+        assert _use(pool, clock) == "b"
+
+        clock[0] += key_pool.KEY_HEADROOM_TTL_SECONDS + 1
+        assert _use(pool, clock) == "a"
+
+    def test_rate_limited_key_cools_down(self, clock):
+        pool = KeyPool("test", ["a", "b"])
+        assert _use(pool, clock, _StatusError(429)) == "a"
+        # Skipped while cooling down, even when the other key reports no headroom left
+        pool.observe_headers("b", {"x-ratelimit-remaining-requests": "0"})
+        assert [_use(pool, clock) for _ in range(3)] == ["b", "b", "b"]
+
+        clock[0] += 30
+        pool.observe_headers("b", {"x-ratelimit-remaining-requests": "0"})
+        assert _use(pool, clock) == "a"
+
+    def test_cooldown_follows_retry_after(self, clock):
+        pool = KeyPool("test", ["a", "b"])
+        _use(pool, clock, _StatusError(429, headers={"retry-after": "5"}))
+        pool.observe_headers("b", {"x-ratelimit-remaining-requests": "0"})
+        assert _use(pool, clock) == "b"
+
+        clock[0] += 5
+        pool.observe_headers("b", {"x-ratelimit-remaining-requests": "0"})
+        assert _use(pool, clock) == "a"
+
+    def test_recovered_key_is_preferred_again_once_its_headroom_is_stale(self, clock):
+        pool = KeyPool("test", ["a", "b"])
+        _use(pool, clock, _StatusError(429))
+        clock[0] += 30
+        # Its last report is no headroom left
+        assert _use(pool, clock) == "b"
+
+        clock[0] += key_pool.KEY_HEADROOM_TTL_SECONDS
+        assert _use(pool, clock) == "a"
+
+    def test_other_errors_do_not_cool_down(self, clock):
+        pool = KeyPool("test", ["a", "b"])
+        assert _use(pool, clock, _StatusError(500)) == "a"
+        assert _use(pool, clock) == "b"
+        assert _use(pool, clock) == "a"
+
+    def test_all_keys_cooling_down_picks_the_first_to_recover(self, clock):
+        pool = KeyPool("test", ["a", "b"])
+        _use(pool, clock, _StatusError(429, headers={"retry-after": "20"}))
+        _use(pool, clock, _StatusError(429, headers={"retry-after": "5"}))
+        assert _use(pool, clock) == "b"
+
+    def test_errors_reach_the_caller(self, clock):
+        pool = KeyPool("test", ["a"])
+
+        async def request(api_key):
+            raise _StatusError(429)
+
+        with pytest.raises(_StatusError):
+            asyncio.run(pool.call(request))
+
+
+class TestGetKeyPool:
+    def test_reads_comma_separated_keys(self, monkeypatch):
+        monkeypatch.setattr(key_pool, "_pools", {})
+        monkeypatch.setenv("TEST_API_KEYS", "k1, k2,,k3")
+        monkeypatch.setenv("TEST_API_KEY", "single")
+        assert get_key_pool("test", "TEST_API_KEYS", "TEST_API_KEY").keys == ["k1", "k2", "k3"]
+
+    def test_falls_back_to_the_single_key(self, monkeypatch):
+        monkeypatch.setattr(key_pool, "_pools", {})
+        monkeypatch.delenv("TEST_API_KEYS", raising=False)
+        monkeypatch.setenv("TEST_API_KEY", "single")
+        pool = get_key_pool("test", "TEST_API_KEYS", "TEST_API_KEY")
+        assert pool.keys == ["single"]
+        assert get_key_pool("test", "TEST_API_KEYS", "TEST_API_KEY") is pool
+
+    def test_empty_pool_is_falsy(self, monkeypatch):
+        monkeypatch.setattr(key_pool, "_pools", {})
+        monkeypatch.delenv("TEST_API_KEYS", raising=False)
+        monkeypatch.delenv("TEST_API_KEY", raising=False)
+        assert not get_key_pool("test", "TEST_API_KEYS", "TEST_API_KEY")
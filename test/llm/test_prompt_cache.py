@@ -0,0 +1,68 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from llm.config.models import LLMAvailableModels
+from llm.providers.factory import LLMFactory
+from llm.providers import google, prompt_cache
+from llm.providers.google import AsyncGeminiProvider
+from llm.providers.key_pool import KeyPool
+from llm.providers.prompt_cache import get_prompt_cache_stats, prompt_cache_key, record_prompt_usage
+
+SYSTEM = {"role": "system", "content": "static instructions"}
+
+
+@pytest.fixture(autouse=True)
+def stats(monkeypatch):
+    monkeypatch.setattr(prompt_cache, "_stats", {})
+
+
+class TestPromptCacheKey:
+    def test_only_the_leading_system_messages_are_keyed(self):
+        first = prompt_cache_key("model", [SYSTEM, {"role": "user", "content": "a fitness app"}])
+        second = prompt_cache_key("model", [SYSTEM, {"role": "user", "content": "a banking app"}])
+        assert first == second
+
+    def test_system_prompt_and_model_change_the_key(self):
+        key = prompt_cache_key("model", [SYSTEM])
+        assert prompt_cache_key("model", [{"role": "system", "content": "other instructions"}]) != key
+        assert prompt_cache_key("other-model", [SYSTEM]) != key
+
+
+class TestPromptUsage:
+    def test_summary_reports_the_cached_share(self):
+        record_prompt_usage("model", 1000, 750)
+        record_prompt_usage("model", 1000, None)
+
+        assert get_prompt_cache_stats("model").summary() == {
+            "requests": 2,
+            "prompt_tokens": 2000,
+            "cached_tokens": 750,
+            "cached_ratio": 0.375
+        }
+
+    def test_async_gemini_completion_records_its_usage(self, monkeypatch):
+        response = SimpleNamespace(
+            text='{"type": "frame"}',
+            prompt_feedback=None,
+            sdk_http_response=None,
+            usage_metadata=SimpleNamespace(prompt_token_count=1200, cached_content_token_count=1000)
+        )
+
+        async def generate_content(model, contents, config):
+            return response
+
+        async def acquire_rate_limit(model_name, tokens):
+            return None
+
+        client = SimpleNamespace(aio=SimpleNamespace(models=SimpleNamespace(generate_content=generate_content)))
+        monkeypatch.setattr(google, "get_genai_client", lambda api_key: client)
+        monkeypatch.setattr(google, "acquire_rate_limit", acquire_rate_limit)
+        monkeypatch.setattr(google, "get_google_key_pool", lambda: KeyPool("Google", ["key"]))
+        provider = AsyncGeminiProvider("gemini-test", LLMFactory.get_model_config(LLMAvailableModels.GEMINI_3_FLASH.value.name))
+
+        assert asyncio.run(provider.completion([SYSTEM, {"role": "user", "content": "a login screen"}])) == response.text
+
+        stats = get_prompt_cache_stats("gemini-test")
+        assert (stats.requests, stats.prompt_tokens, stats.cached_tokens) == (1, 1200, 1000)
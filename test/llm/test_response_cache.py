@@ -0,0 +1,187 @@
+import asyncio
+import os
+
+import pytest
+
+from llm.providers import response_cache
+from llm.providers.failover import served_model
+from llm.providers.response_cache import (
+    CachedProvider,
+    _DiskTier,
+    _MemoryTier,
+    cache_bypass,
+    cache_key,
+    get_cache_stats,
+    response_cache_bypass
+)
+from llm.providers.schemas import ResponseSchema
+
+MESSAGES = [{"role": "system", "content": "instructions"}, {"role": "user", "content": "a login screen"}]
+
+
+class FakeProvider:
+    model_name = "primary"
+
+    def __init__(self, response='{"type": "frame"}', served_by=None):
+        self.response = response
+        self.served_by = served_by or self.model_name
+        self.calls = 0
+
+    def is_available(self):
+        return True
+
+    async def completion(self, messages, response_schema=ResponseSchema.COMPONENT):
+        self.calls += 1
+        served_model.set(self.served_by)
+        return self.response
+
+    async def stream_completion(self, messages, response_schema=ResponseSchema.SCREENS):
+        self.calls += 1
+        served_model.set(self.served_by)
+        for start in range(0, len(self.response), 5):
+            yield self.response[start:start + 5]
+
+
+@pytest.fixture
+def tiers(monkeypatch, tmp_path):
+    """Fresh memory and disk tiers, and a dict standing in for the Mongo collection."""
+    db = {}
+
+    def find_cached_response(_, key):
+        return db.get(key)
+
+    def store_cached_response(_, key, model_name, response):
+        db[key] = response
+
+    monkeypatch.setattr(response_cache, "_memory_tier", _MemoryTier(16))
+    monkeypatch.setattr(response_cache, "_disk_tier", _DiskTier(str(tmp_path), 1024 * 1024))
+    monkeypatch.setattr(response_cache, "find_cached_response", find_cached_response)
+    monkeypatch.setattr(response_cache, "store_cached_response", store_cached_response)
+    monkeypatch.setattr(response_cache, "get_db", lambda: None)
+    monkeypatch.setattr(response_cache, "_stats", {})
+    return db
+
+
+def _complete(provider, schema=ResponseSchema.COMPONENT):
+    return asyncio.run(CachedProvider(provider).completion(MESSAGES, response_schema=schema))
+
+
+def _clear_memory(monkeypatch):
+    monkeypatch.setattr(response_cache, "_memory_tier", _MemoryTier(16))
+
+
+class TestCachedProvider:
+    def test_repeated_request_is_served_from_memory(self, tiers):
+        provider = FakeProvider()
+
+        assert _complete(provider) == _complete(provider) == provider.response
+
+        assert provider.calls == 1
+        stats = get_cache_stats("primary")
+        assert (stats.misses, stats.memory_hits) == (1, 1)
+
+    def test_disk_tier_outlives_the_memory_tier(self, tiers, monkeypatch):
+        provider = FakeProvider()
+        _complete(provider)
+        _clear_memory(monkeypatch)
+
+        assert _complete(provider) == provider.response
+        assert _complete(provider) == provider.response
+
+        assert provider.calls == 1
+        stats = get_cache_stats("primary")
+        assert (stats.disk_hits, stats.memory_hits) == (1, 1)
+
+    def test_database_tier_is_shared_between_instances(self, tiers, monkeypatch, tmp_path):
+        provider = FakeProvider()
+        _complete(provider)
+        # Another instance: its own memory and /tmp, the same collection
+        _clear_memory(monkeypatch)
+        other_disk = _DiskTier(str(tmp_path / "other"), 1024 * 1024)
+        monkeypatch.setattr(response_cache, "_disk_tier", other_disk)
+
+        assert _complete(provider) == provider.response
+
+        assert provider.calls == 1
+        assert get_cache_stats("primary").db_hits == 1
+        assert other_disk.get(cache_key("primary", MESSAGES, ResponseSchema.COMPONENT)) == provider.response
+
+    def test_schema_is_part_of_the_key(self, tiers):
+        provider = FakeProvider()
+        _complete(provider, ResponseSchema.COMPONENT)
+        _complete(provider, ResponseSchema.SCREENS)
+        assert provider.calls == 2
+
+    def test_responses_that_are_not_json_are_not_cached(self, tiers):
+        provider = FakeProvider(response='{"type": "fra')
+        _complete(provider)
+        _complete(provider)
+        assert provider.calls == 2
+        assert tiers == {}
+
+    def test_fallback_response_is_cached_under_the_model_that_answered(self, tiers):
+        fallback = FakeProvider(served_by="fallback")
+        _complete(fallback)
+
+        assert list(tiers) == [cache_key("fallback", MESSAGES, ResponseSchema.COMPONENT)]
+        _complete(fallback)
+        assert fallback.calls == 2
+
+    @pytest.mark.parametrize("bypass", [cache_bypass, response_cache_bypass])
+    def test_bypassed_jobs_neither_read_nor_write(self, tiers, bypass):
+        provider = FakeProvider()
+        _complete(provider)
+
+        async def bypassed():
+            bypass.set(True)
+            cached = CachedProvider(provider)
+            return [await cached.completion(MESSAGES) for _ in range(2)]
+
+        asyncio.run(bypassed())
+
+        assert provider.calls == 3
+        assert get_cache_stats("primary").bypassed == 2
+
+    def test_unavailable_database_tier_does_not_fail_the_call(self, tiers, monkeypatch):
+        def unavailable(*args):
+            raise ConnectionError("no database")
+
+        monkeypatch.setattr(response_cache, "find_cached_response", unavailable)
+        monkeypatch.setattr(response_cache, "store_cached_response", unavailable)
+        provider = FakeProvider()
+
+        assert _complete(provider) == provider.response
+        assert provider.calls == 1
+
+    def test_stream_is_cached_once_complete_and_replayed_as_one_chunk(self, tiers):
+        provider = FakeProvider(response='{"screens": []}')
+
+        async def stream():
+            return [chunk async for chunk in CachedProvider(provider).stream_completion(MESSAGES)]
+
+        assert len(asyncio.run(stream())) > 1
+        assert asyncio.run(stream()) == [provider.response]
+        assert provider.calls == 1
+
+
+class TestDiskTier:
+    def test_least_recently_used_files_are_evicted_past_the_bound(self, tmp_path):
+        tier = _DiskTier(str(tmp_path), max_bytes=250)
+        tier.put("a", "a" * 100)
+        tier.put("b", "b" * 100)
+        # Older than anything written next, even on coarse clocks
+        os.utime(tmp_path / "a", (1, 1))
+        os.utime(tmp_path / "b", (2, 2))
+        # A read makes "a" the most recently used
+        assert tier.get("a") == "a" * 100
+
+        tier.put("c", "c" * 100)
+
+        assert tier.get("b") is None
+        assert tier.get("a") == "a" * 100
+        assert tier.get("c") == "c" * 100
+
+    def test_entry_larger_than_the_bound_is_not_written(self, tmp_path):
+        tier = _DiskTier(str(tmp_path), max_bytes=10)
+        tier.put("big", "x" * 100)
+        assert tier.get("big") is None
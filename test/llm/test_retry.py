@@ -0,0 +1,126 @@
+import asyncio
+import time
+from email.utils import formatdate
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from deadline import PERSIST_RESERVE_SECONDS, Deadline
+from llm.providers import retry
+from llm.providers.retry import get_retry_stats, is_retryable, retry_after_seconds, retry_async
+
+
+class _StatusError(Exception):
+    def __init__(self, status_code: int, headers: dict = None, details: dict = None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=headers or {})
+        self.details = details
+
+
+class _Flaky:
+    """Fails with the given errors, then returns "ok"."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+@pytest.fixture
+def delays(monkeypatch):
+    """Backoff at its jitter ceiling, with sleeps recorded instead of waited."""
+    recorded = []
+
+    async def sleep(seconds):
+        recorded.append(seconds)
+
+    monkeypatch.setattr(retry.random, "uniform", lambda low, high: high)
+    monkeypatch.setattr(retry.asyncio, "sleep", sleep)
+    monkeypatch.setattr(retry.time, "sleep", recorded.append)
+    monkeypatch.setattr(retry, "RETRY_MAX_ATTEMPTS", 5)
+    monkeypatch.setattr(retry, "RETRY_BASE_DELAY_SECONDS", 1.0)
+    monkeypatch.setattr(retry, "RETRY_MAX_DELAY_SECONDS", 3.0)
+    monkeypatch.setattr(retry, "_stats", {})
+    return recorded
+
+
+class TestIsRetryable:
+    @pytest.mark.parametrize("status_code", [408, 409, 429, 500, 502, 503, 504])
+    def test_transient_statuses(self, status_code):
+        assert is_retryable(_StatusError(status_code))
+
+    @pytest.mark.parametrize("status_code", [400, 401, 403, 404, 422])
+    def test_client_errors(self, status_code):
+        assert not is_retryable(_StatusError(status_code))
+
+    @pytest.mark.parametrize("error", [httpx.ConnectError("reset"), asyncio.TimeoutError(), ConnectionResetError()])
+    def test_transport_errors_and_timeouts(self, error):
+        assert is_retryable(error)
+
+    def test_other_errors(self):
+        assert not is_retryable(ValueError("bad json"))
+
+
+class TestRetryAfterSeconds:
+    def test_seconds_header(self):
+        assert retry_after_seconds(_StatusError(429, headers={"retry-after": "7"})) == 7.0
+
+    def test_milliseconds_header_wins(self):
+        assert retry_after_seconds(_StatusError(429, headers={"retry-after-ms": "1500", "retry-after": "7"})) == 1.5
+
+    def test_http_date_header(self):
+        delay = retry_after_seconds(_StatusError(503, headers={"retry-after": formatdate(time.time() + 30, usegmt=True)}))
+        assert 25 <= delay <= 30
+
+    def test_gemini_retry_info(self):
+        details = {"error": {"details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "12s"}]}}
+        assert retry_after_seconds(_StatusError(429, details=details)) == 12.0
+
+    def test_no_hint(self):
+        assert retry_after_seconds(_StatusError(503)) is None
+        assert retry_after_seconds(_StatusError(503, headers={"retry-after": "soon"})) is None
+
+
+class TestRetryAsync:
+    def test_backoff_doubles_up_to_the_ceiling(self, delays):
+        request = _Flaky(*[_StatusError(503)] * 4)
+        assert asyncio.run(retry_async("m", request)) == "ok"
+        assert request.calls == 5
+        assert delays == [1.0, 2.0, 3.0, 3.0]
+        assert get_retry_stats("m").summary() == {"calls": 1, "retries": 4, "gave_up": 0, "total_delay": 9.0}
+
+    def test_waits_at_least_the_retry_after_hint(self, delays):
+        request = _Flaky(_StatusError(429, headers={"retry-after": "10"}))
+        assert asyncio.run(retry_async("m", request)) == "ok"
+        assert delays == [10.0]
+
+    def test_gives_up_after_max_attempts(self, delays):
+        request = _Flaky(*[_StatusError(500)] * 5)
+        with pytest.raises(_StatusError):
+            asyncio.run(retry_async("m", request))
+        assert request.calls == 5
+        assert get_retry_stats("m").gave_up == 1
+
+    def test_non_retryable_errors_are_raised_at_once(self, delays):
+        request = _Flaky(_StatusError(400))
+        with pytest.raises(_StatusError):
+            asyncio.run(retry_async("m", request))
+        assert request.calls == 1
+        assert delays == []
+        assert get_retry_stats("m").gave_up == 0
+
+    def test_does_not_retry_past_the_deadline(self, delays):
+        request = _Flaky(_StatusError(503, headers={"retry-after": "5"}))
+        deadline = Deadline.from_timeout(PERSIST_RESERVE_SECONDS + 2)
+        with pytest.raises(_StatusError):
+            asyncio.run(retry_async("m", request, deadline=deadline))
+        assert request.calls == 1
+        assert get_retry_stats("m").gave_up == 1
+
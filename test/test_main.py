@@ -0,0 +1,321 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import main
+from db import component_writer
+from deadline import IMAGE_STAGE_MIN_SECONDS, PERSIST_RESERVE_SECONDS, Deadline, current_deadline
+from exceptions import JobAlreadyClaimedException
+from job_config import ComponentStatus, JobMode, JobStatus, PlanningStep
+from llm.providers import image_cache
+from llm.providers.response_cache import cache_bypass, response_cache_bypass
+from models.request_models import Component as GeneratedComponent
+from workflows.scheduler import get_scheduler
+
+_orchestrate_generation = main._orchestrate_generation
+
+
+def _image(prompt):
+    return {"type": "image", "prompt": prompt}
+
+
+def _component(*prompts):
+    code = {"type": "frame", "children": [_image(prompt) for prompt in prompts]}
+    return GeneratedComponent(id="component", code=json.dumps(code), sub_prompt="screen")
+
+
+def _sources(component):
+    return [child.get("src") for child in json.loads(component.code)["children"]]
+
+
+@pytest.fixture
+def images(monkeypatch):
+    """Stand-ins for Imagen, S3 and the image cache; records the prompts generated."""
+    generated = []
+    cache = {}
+
+    async def generate_images_concurrently(component_prompts, distinct_variants=False):
+        generated.append(sorted(prompt for prompts in component_prompts.values() for prompt in prompts))
+        return {key: [f"image {len(generated)}.{i}".encode()] for i, key in enumerate(component_prompts)}
+
+    async def upload_images_concurrently(images_by_key):
+        return {key: [f"https://s3/{images[0].decode()}"] for key, images in images_by_key.items()}
+
+    async def find_cached_image_urls(keys):
+        if cache_bypass.get():
+            return {}
+        return {key: cache[key] for key in keys if key in cache}
+
+    async def store_image_urls_for_prompts(model_name, entries):
+        if not cache_bypass.get():
+            cache.update({key: url for key, (prompt, url) in entries.items()})
+
+    monkeypatch.setattr(main, "generate_images_concurrently", generate_images_concurrently)
+    monkeypatch.setattr(main, "upload_images_concurrently", upload_images_concurrently)
+    monkeypatch.setattr(main, "find_cached_image_urls", find_cached_image_urls)
+    monkeypatch.setattr(main, "store_image_urls_for_prompts", store_image_urls_for_prompts)
+    return generated
+
+
+class TestProcessComponentImages:
+    def test_repeats_within_a_component_get_distinct_variants(self, images, monkeypatch):
+        monkeypatch.setattr(main, "IMAGE_DISTINCT_VARIANTS", True)
+
+        component = asyncio.run(main._process_component_images(_component("avatar", "hero", "Avatar."), {}))
+
+        assert images == [["Avatar.", "avatar", "hero"]]
+        avatar, hero, other_avatar = _sources(component)
+        assert len({avatar, hero, other_avatar}) == 3
+
+    def test_repeats_share_one_image_without_variants(self, images, monkeypatch):
+        monkeypatch.setattr(main, "IMAGE_DISTINCT_VARIANTS", False)
+
+        component = asyncio.run(main._process_component_images(_component("avatar", "hero", "Avatar."), {}))
+
+        assert images == [["avatar", "hero"]]
+        avatar, hero, other_avatar = _sources(component)
+        assert avatar == other_avatar != hero
+
+    def test_later_components_of_a_bypassed_job_reuse_its_images(self, images, monkeypatch):
+        monkeypatch.setattr(main, "IMAGE_DISTINCT_VARIANTS", True)
+
+        async def job():
+            cache_bypass.set(True)
+            job_image_urls = {}
+            first = await main._process_component_images(_component("avatar", "avatar"), job_image_urls)
+            second = await main._process_component_images(_component("avatar", "cart", "avatar"), job_image_urls)
+            return first, second
+
+        first, second = asyncio.run(job())
+
+        assert images == [["avatar", "avatar"], ["cart"]]
+        assert _sources(second)[0::2] == _sources(first)
+
+    def test_cached_images_are_not_generated_again(self, images):
+        asyncio.run(main._process_component_images(_component("avatar"), {}))
+        component = asyncio.run(main._process_component_images(_component("avatar"), {}))
+
+        assert images == [["avatar"]]
+        assert _sources(component) == ["https://s3/image 1.0"]
+
+
+def _job(**fields):
+    return {
+        "_id": "job",
+        "user_id": "user",
+        "model": "gpt-5-mini",
+        "status": JobStatus.COMPLETED.value,
+        "device": {"name": "iPhone 16"},
+        **fields
+    }
+
+
+@pytest.fixture
+def job_store(monkeypatch):
+    """In-memory stand-ins for the job, its components and the writes run_async makes."""
+    store = SimpleNamespace(job=_job(), components=[], component_results={}, statuses=[], charged=[], generated=[])
+
+    def claim_job(db, job_id, owner, claimable_statuses):
+        if store.job["status"] not in [status.value for status in claimable_statuses]:
+            raise JobAlreadyClaimedException(f"Job {job_id} is {store.job['status']}")
+        return dict(store.job)
+
+    async def orchestrate_generation(db, provider, job_data, screens, job_components, device_info, deadline):
+        store.generated.append({
+            "component_ids": [component["_id"] for component in job_components],
+            "sub_prompts": [screen["sub_prompt"] async for screen in screens],
+            "response_cache_bypassed": response_cache_bypass.get(),
+            "image_cache_enabled": image_cache._enabled()
+        })
+        # Every regenerated component succeeds but the last
+        return {component["_id"]: component is not job_components[-1] for component in job_components}
+
+    monkeypatch.setattr(main, "get_db", lambda: None)
+    monkeypatch.setattr(main, "claim_job", claim_job)
+    monkeypatch.setattr(main, "find_user_by_id", lambda db, user_id: {"subscription_status": "free"})
+    monkeypatch.setattr(main, "find_job_components", lambda db, job_id: store.components)
+    monkeypatch.setattr(main.LLMFactory, "create_async_provider", lambda model_name: None)
+    monkeypatch.setattr(main, "_orchestrate_generation", orchestrate_generation)
+    monkeypatch.setattr(main, "bulk_update_components_with_results", lambda db, results: store.component_results.update(results))
+    monkeypatch.setattr(main, "update_job_status", lambda db, job_id, status, completed_at=None: store.statuses.append(status))
+    monkeypatch.setattr(main, "consume_user_credits", lambda db, user_id, count: store.charged.append(count))
+    return store
+
+
+def _db_component(component_id, status, sub_prompt=None):
+    return {"_id": component_id, "parent_job_id": "job", "status": status.value, "sub_prompt": sub_prompt}
+
+
+class TestRegenerateFailed:
+    def test_only_failed_components_are_regenerated_and_charged(self, job_store):
+        job_store.components = [
+            _db_component("c1", ComponentStatus.SUCCESSFUL, "home"),
+            _db_component("c2", ComponentStatus.FAILED, "profile"),
+            _db_component("c3", ComponentStatus.FAILED, "cart")
+        ]
+
+        asyncio.run(main.run_async("job", mode=JobMode.REGENERATE_FAILED))
+
+        [generation] = job_store.generated
+        assert generation["component_ids"] == ["c2", "c3"]
+        assert generation["sub_prompts"] == ["profile", "cart"]
+        assert job_store.statuses == [JobStatus.COMPLETED]
+        assert job_store.charged == [1]
+
+    def test_sub_prompts_missing_on_components_come_from_the_checkpoint(self, job_store):
+        checkpoint = {PlanningStep.SUB_PROMPTS.value: {"screens": [{"sub_prompt": "home"}, {"sub_prompt": "profile"}, {"sub_prompt": "cart"}]}}
+        job_store.job = _job(planning_checkpoint=checkpoint)
+        job_store.components = [
+            _db_component("c1", ComponentStatus.FAILED),
+            _db_component("c2", ComponentStatus.SUCCESSFUL, "profile"),
+            _db_component("c3", ComponentStatus.FAILED, "cart")
+        ]
+
+        asyncio.run(main.run_async("job", mode=JobMode.REGENERATE_FAILED))
+
+        assert job_store.generated[0]["sub_prompts"] == ["home", "cart"]
+
+    def test_components_without_a_sub_prompt_are_left_failed(self, job_store):
+        job_store.components = [_db_component("c1", ComponentStatus.FAILED), _db_component("c2", ComponentStatus.FAILED, "cart")]
+
+        asyncio.run(main.run_async("job", mode=JobMode.REGENERATE_FAILED))
+
+        assert job_store.generated[0]["component_ids"] == ["c2"]
+
+    def test_bypasses_only_the_response_cache(self, job_store):
+        job_store.components = [_db_component("c1", ComponentStatus.FAILED, "home")]
+
+        asyncio.run(main.run_async("job", mode=JobMode.REGENERATE_FAILED))
+
+        assert job_store.generated[0]["response_cache_bypassed"]
+        assert job_store.generated[0]["image_cache_enabled"]
+
+    def test_job_that_is_not_completed_is_skipped(self, job_store):
+        job_store.job = _job(status=JobStatus.SUBMITTED.value)
+        job_store.components = [_db_component("c1", ComponentStatus.FAILED, "home")]
+
+        asyncio.run(main.run_async("job", mode=JobMode.REGENERATE_FAILED))
+
+        assert job_store.generated == [] and job_store.statuses == []
+
+
+@pytest.fixture
+def persisted(monkeypatch):
+    """Component updates that reached the bulk writes of ComponentWriteBuffer."""
+    updates = {}
+
+    def bulk_update_components_by_id(db, component_updates):
+        updates.update(component_updates)
+        return {}
+
+    monkeypatch.setattr(component_writer, "bulk_update_components_by_id", bulk_update_components_by_id)
+    return updates
+
+
+@pytest.fixture
+def timed_pipelines(monkeypatch):
+    """Component pipelines that take the number of seconds in their sub-prompt, then persist a success."""
+    cancelled = []
+
+    async def run_component_pipeline(writer, scheduler, priority, timings, outcomes, image_urls, job_data, prompt, provider, component_id, device_info):
+        try:
+            await asyncio.sleep(float(prompt))
+        except asyncio.CancelledError:
+            cancelled.append(component_id)
+            raise
+        await writer.update_result(component_id, ComponentStatus.SUCCESSFUL, code="{}")
+        outcomes[component_id] = True
+        return True
+
+    monkeypatch.setattr(main, "_run_component_pipeline", run_component_pipeline)
+    return cancelled
+
+
+def _deadline_in(budget):
+    return Deadline.from_timeout(PERSIST_RESERVE_SECONDS + budget)
+
+
+class TestDeadline:
+    def test_stragglers_are_cancelled_and_finished_components_kept(self, persisted, timed_pipelines):
+        components = [{"_id": "fast"}, {"_id": "slow"}]
+        screens = main._replay_screens([{"sub_prompt": "0.01"}, {"sub_prompt": "30"}])
+
+        started = time.monotonic()
+        outcomes = asyncio.run(_orchestrate_generation(None, None, _job(), screens, components, {}, _deadline_in(1.0)))
+
+        assert time.monotonic() - started < 5
+        assert outcomes == {"fast": True}
+        assert timed_pipelines == ["slow"]
+        assert list(persisted) == ["fast"]
+
+    def test_unfinished_components_fail_with_the_deadline_and_are_not_charged(self, job_store, persisted, timed_pipelines, monkeypatch):
+        class Planner:
+            def __init__(self, job_data, on_step_completed=None):
+                pass
+
+            async def prepare(self, provider):
+                return {"optimized_prompt": "", "information_architecture": "", "sub_prompts": None, "device_info": {}, "plan": {}}
+
+            async def stream_sub_prompts(self, provider, planning):
+                for sub_prompt in ["0.01", "30"]:
+                    yield {"sub_prompt": sub_prompt}
+
+        job_store.job = _job(status=JobStatus.SUBMITTED.value)
+        job_store.components = [_db_component("c1", ComponentStatus.PENDING), _db_component("c2", ComponentStatus.PENDING)]
+        monkeypatch.setattr(main, "PromptGenerator", Planner)
+        monkeypatch.setattr(main, "update_job_planning", lambda db, job_id, planning: None)
+        monkeypatch.setattr(main, "_orchestrate_generation", _orchestrate_generation)
+
+        asyncio.run(main.run_async("job", deadline=_deadline_in(1.0)))
+
+        assert list(persisted) == ["c1"]
+        assert job_store.component_results["c2"]["error_message"] == "Component did not complete before the job deadline"
+        assert job_store.statuses == [JobStatus.COMPLETED]
+        assert job_store.charged == [1]
+
+
+class TestComponentImagesDeadline:
+    @pytest.fixture
+    def pipeline(self, monkeypatch, persisted):
+        processed = []
+
+        async def generate_single_component(job_data, prompt, provider, component_id, device_info):
+            return GeneratedComponent(id=component_id, code=json.dumps(_image("avatar")), sub_prompt=prompt)
+
+        async def process_component_images(component, job_image_urls):
+            processed.append(component.id)
+            return component
+
+        async def no_reuse(model, device_info, sub_prompt):
+            return None
+
+        async def no_index(*args):
+            return None
+
+        monkeypatch.setattr(main, "_generate_single_component", generate_single_component)
+        monkeypatch.setattr(main, "_process_component_images", process_component_images)
+        monkeypatch.setattr(main, "find_reusable_component", no_reuse)
+        monkeypatch.setattr(main, "index_component", no_index)
+
+        def run(deadline):
+            async def scenario():
+                current_deadline.set(deadline)
+                writer = main.ComponentWriteBuffer(None)
+                succeeded = await main._run_component_pipeline(writer, get_scheduler("test-model", 2), 0, [], {}, {}, _job(), "home", None, "c1", {})
+                await writer.close()
+                return succeeded
+            return asyncio.run(scenario())
+
+        return SimpleNamespace(run=run, processed=processed, persisted=persisted)
+
+    def test_images_are_skipped_when_the_deadline_is_close(self, pipeline):
+        assert pipeline.run(_deadline_in(IMAGE_STAGE_MIN_SECONDS / 2))
+        assert pipeline.processed == []
+        assert pipeline.persisted["c1"]["status"] == ComponentStatus.SUCCESSFUL.value
+
+    def test_images_run_when_there_is_time_for_them(self, pipeline):
+        assert pipeline.run(_deadline_in(IMAGE_STAGE_MIN_SECONDS * 2))
+        assert pipeline.processed == ["c1"]
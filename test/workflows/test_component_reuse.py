@@ -0,0 +1,140 @@
+import asyncio
+
+import pytest
+
+from llm.providers.response_cache import cache_bypass
+from workflows import component_reuse
+from workflows.component_reuse import (
+    MINHASH_BAND_ROWS,
+    MINHASH_PERMUTATIONS,
+    device_key,
+    estimated_similarity,
+    find_reusable_component,
+    get_reuse_stats,
+    index_component,
+    minhash_signature,
+    signature_bands
+)
+
+DEVICE = {"name": "iPhone 15", "width": 393, "height": 852}
+WORDS = [f"word{i}" for i in range(60)]
+
+
+def _text(words):
+    return " ".join(words)
+
+
+def _jaccard(a, b):
+    return len(set(a) & set(b)) / len(set(a) | set(b))
+
+
+@pytest.fixture
+def index(monkeypatch):
+    """In-memory stand-in for the component_reuse_index collection."""
+    entries = []
+
+    def find_component_candidates(db, model, device, bands):
+        return [entry for entry in entries if entry["model"] == model and entry["device"] == device and set(entry["bands"]) & set(bands)]
+
+    def insert_component_index(db, component_id, model, device, signature, bands, sub_prompt, code, generation_seconds):
+        entries.append({
+            "component_id": component_id, "model": model, "device": device, "signature": signature,
+            "bands": bands, "code": code, "generation_seconds": generation_seconds
+        })
+
+    monkeypatch.setattr(component_reuse, "get_db", lambda: None)
+    monkeypatch.setattr(component_reuse, "find_component_candidates", find_component_candidates)
+    monkeypatch.setattr(component_reuse, "insert_component_index", insert_component_index)
+    monkeypatch.setattr(component_reuse, "COMPONENT_REUSE_ENABLED", True)
+    monkeypatch.setattr(component_reuse, "COMPONENT_REUSE_MIN_SIMILARITY", 0.8)
+    monkeypatch.setattr(component_reuse, "_stats", {})
+    return entries
+
+
+def _index(component_id, words, code, generation_seconds=10.0, device=DEVICE):
+    asyncio.run(index_component("model", device, component_id, _text(words), code, generation_seconds))
+
+
+def _find(words, device=DEVICE):
+    return asyncio.run(find_reusable_component("model", device, _text(words)))
+
+
+class TestMinHash:
+    def test_short_texts_have_no_signature(self):
+        assert minhash_signature("a login screen with two fields") is None
+        assert minhash_signature(_text(WORDS[:component_reuse.COMPONENT_REUSE_MIN_WORDS])) is not None
+
+    def test_signature_ignores_case_punctuation_and_word_order(self):
+        signature = minhash_signature(_text(WORDS[:20]))
+        assert len(signature) == MINHASH_PERMUTATIONS
+        assert minhash_signature(", ".join(reversed(WORDS[:20])).upper() + "!") == signature
+
+    @pytest.mark.parametrize("shared", [40, 30, 15])
+    def test_similarity_estimates_jaccard(self, shared):
+        a = WORDS[:40]
+        b = WORDS[:shared] + [f"other{i}" for i in range(40 - shared)]
+        estimate = estimated_similarity(minhash_signature(_text(a)), minhash_signature(_text(b)))
+        assert estimate == pytest.approx(_jaccard(a, b), abs=0.12)
+
+    def test_bands(self):
+        signature = minhash_signature(_text(WORDS[:20]))
+        bands = signature_bands(signature)
+        assert len(bands) == MINHASH_PERMUTATIONS // MINHASH_BAND_ROWS
+        assert len(set(bands)) == len(bands)
+        assert signature_bands(minhash_signature(_text(WORDS[20:40]))) != bands
+
+
+class TestFindReusableComponent:
+    def test_near_duplicate_is_reused(self, index):
+        _index("c1", WORDS[:40], '{"type": "frame"}', generation_seconds=12.0)
+        # 39 of 41 words shared, Jaccard 0.95
+        assert _find(WORDS[:39] + ["extra"]) == '{"type": "frame"}'
+        assert get_reuse_stats("model").summary() == {"lookups": 1, "hits": 1, "hit_rate": 1.0, "latency_saved": 12.0}
+
+    def test_different_sub_prompt_is_generated(self, index):
+        _index("c1", WORDS[:40], '{"type": "frame"}')
+        # 20 of 60 words shared, Jaccard 0.33
+        assert _find(WORDS[20:60]) is None
+        assert get_reuse_stats("model").hits == 0
+
+    def test_threshold_is_configurable(self, index, monkeypatch):
+        _index("c1", WORDS[:40], '{"type": "frame"}')
+        # 28 of 52 words shared, Jaccard 0.54
+        near = WORDS[:28] + [f"other{i}" for i in range(12)]
+        assert _find(near) is None
+        monkeypatch.setattr(component_reuse, "COMPONENT_REUSE_MIN_SIMILARITY", 0.3)
+        assert _find(near) == '{"type": "frame"}'
+
+    def test_most_similar_candidate_wins(self, index, monkeypatch):
+        monkeypatch.setattr(component_reuse, "COMPONENT_REUSE_MIN_SIMILARITY", 0.5)
+        _index("far", WORDS[:30] + [f"far{i}" for i in range(10)], '"far"')
+        _index("near", WORDS[:38] + ["near0", "near1"], '"near"')
+        assert _find(WORDS[:40]) == '"near"'
+
+    def test_other_device_is_not_reused(self, index):
+        _index("c1", WORDS[:40], '{"type": "frame"}', device={"name": "iPad", "width": 820, "height": 1180})
+        assert _find(WORDS[:40]) is None
+
+    def test_short_sub_prompts_are_not_looked_up(self, index):
+        assert _find(WORDS[:3]) is None
+        assert get_reuse_stats("model").lookups == 0
+
+    def test_bypass_cache_skips_lookup_and_indexing(self, index):
+        async def bypassed():
+            cache_bypass.set(True)
+            await index_component("model", DEVICE, "c1", _text(WORDS[:40]), "code", 1.0)
+            return await find_reusable_component("model", DEVICE, _text(WORDS[:40]))
+
+        assert asyncio.run(bypassed()) is None
+        assert index == []
+
+    def test_unavailable_index_falls_back_to_generating(self, index, monkeypatch):
+        def unavailable(*args):
+            raise ConnectionError("no database")
+
+        monkeypatch.setattr(component_reuse, "find_component_candidates", unavailable)
+        assert _find(WORDS[:40]) is None
+
+
+def test_device_key():
+    assert device_key(DEVICE) == "iPhone 15:393x852"
@@ -0,0 +1,118 @@
+import asyncio
+import json
+
+import pytest
+
+from exceptions import PromptGenerationFailedException
+from job_config import PlanningStep
+from workflows.prompt_generator import ENHANCER_SYSTEM_PROMPT, IA_SYSTEM_PROMPT, PromptGenerator
+
+BRIEF = {"screens": [{"name": "brief"}]}
+SITEMAP = {"screens": [{"name": "Home"}, {"name": "Profile"}]}
+SCREENS = [{"screen_name": "Home", "sub_prompt": "home screen"}, {"screen_name": "Profile", "sub_prompt": "profile screen"}]
+
+
+class FakeProvider:
+    def __init__(self, stream_chunks=None):
+        self.calls = []
+        self.stream_chunks = stream_chunks or [json.dumps({"screens": SCREENS})]
+        self.streams = 0
+
+    async def completion(self, messages, response_schema=None):
+        system_prompt = messages[0]["content"]
+        self.calls.append(system_prompt)
+        return json.dumps({ENHANCER_SYSTEM_PROMPT: BRIEF, IA_SYSTEM_PROMPT: SITEMAP}[system_prompt])
+
+    async def stream_completion(self, messages, response_schema=None):
+        self.streams += 1
+        for chunk in self.stream_chunks:
+            yield chunk
+
+
+def _job(checkpoint=None):
+    return {
+        "_id": "job",
+        "user_prompt": "a fitness app",
+        "device": {"name": "iPhone 16"},
+        "generation_type": "flow",
+        "screen_count": 2,
+        "planning_checkpoint": checkpoint
+    }
+
+
+def _checkpointer(steps):
+    async def on_step_completed(step, output):
+        steps.append((step, output))
+    return on_step_completed
+
+
+def _stream(generator, provider, planning):
+    async def collect():
+        return [screen async for screen in generator.stream_sub_prompts(provider, planning)]
+    return asyncio.run(collect())
+
+
+class TestPlanningCheckpoint:
+    def test_completed_steps_are_checkpointed_in_order(self):
+        steps = []
+        provider = FakeProvider()
+
+        planning = asyncio.run(PromptGenerator(_job(), on_step_completed=_checkpointer(steps)).prepare(provider))
+
+        assert steps == [(PlanningStep.BRIEF, BRIEF), (PlanningStep.SITEMAP, SITEMAP)]
+        assert planning["information_architecture"] == str(SITEMAP)
+        assert planning["sub_prompts"] is None
+
+    def test_retry_resumes_after_the_last_checkpointed_step(self):
+        steps = []
+        provider = FakeProvider()
+
+        planning = asyncio.run(PromptGenerator(_job({PlanningStep.BRIEF.value: BRIEF}), on_step_completed=_checkpointer(steps)).prepare(provider))
+
+        assert provider.calls == [IA_SYSTEM_PROMPT]
+        assert steps == [(PlanningStep.SITEMAP, SITEMAP)]
+        assert planning["optimized_prompt"] == str(BRIEF)
+
+    def test_fully_checkpointed_plan_makes_no_calls(self):
+        provider = FakeProvider()
+        checkpoint = {PlanningStep.BRIEF.value: BRIEF, PlanningStep.SITEMAP.value: SITEMAP, PlanningStep.SUB_PROMPTS.value: {"screens": SCREENS}}
+        generator = PromptGenerator(_job(checkpoint))
+
+        planning = asyncio.run(generator.prepare(provider))
+        screens = _stream(generator, provider, planning)
+
+        assert screens == SCREENS
+        assert planning["sub_prompts"] == {"screens": SCREENS}
+        assert provider.calls == [] and provider.streams == 0
+
+    def test_failed_checkpoint_write_does_not_fail_planning(self):
+        async def unavailable(step, output):
+            raise ConnectionError("no database")
+
+        provider = FakeProvider()
+        generator = PromptGenerator(_job(), on_step_completed=unavailable)
+
+        planning = asyncio.run(generator.prepare(provider))
+        screens = _stream(generator, provider, planning)
+
+        assert screens == SCREENS
+        assert planning["sub_prompts"] == {"screens": SCREENS}
+
+    def test_streamed_sub_prompts_are_checkpointed_once_complete(self):
+        steps = []
+        text = json.dumps({"screens": SCREENS})
+        provider = FakeProvider(stream_chunks=[text[:30], text[30:]])
+        generator = PromptGenerator(_job({PlanningStep.BRIEF.value: BRIEF, PlanningStep.SITEMAP.value: SITEMAP}), on_step_completed=_checkpointer(steps))
+
+        screens = _stream(generator, provider, asyncio.run(generator.prepare(provider)))
+
+        assert screens == SCREENS
+        assert steps == [(PlanningStep.SUB_PROMPTS, {"screens": SCREENS})]
+
+    def test_failed_planning_call_is_a_planning_failure(self):
+        class FailingProvider(FakeProvider):
+            async def completion(self, messages, response_schema=None):
+                raise ConnectionError("provider down")
+
+        with pytest.raises(PromptGenerationFailedException):
+            asyncio.run(PromptGenerator(_job()).prepare(FailingProvider()))
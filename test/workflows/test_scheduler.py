@@ -0,0 +1,246 @@
+import asyncio
+
+import pytest
+
+from workflows import scheduler as scheduler_module
+from workflows.scheduler import ComponentScheduler, TaskTiming, Tenant, current_tenant, summarize_timings
+
+
+class _Work:
+    """Tasks that record when they start and run until released."""
+
+    def __init__(self):
+        self.started = []
+        self.running = 0
+        self.max_running = 0
+        self.release = asyncio.Event()
+
+    def task(self, name, result=None):
+        async def run():
+            self.started.append(name)
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            try:
+                await self.release.wait()
+                return result if result is not None else name
+            finally:
+                self.running -= 1
+        return run
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def _submit_as(tenant, scheduler, factory, priority=0):
+    """Submits from a task running for `tenant`, as a job's component pipelines do."""
+    async def submit():
+        current_tenant.set(tenant)
+        return await scheduler.submit(factory, priority=priority)
+    return asyncio.create_task(submit())
+
+
+class TestComponentScheduler:
+    def test_runs_at_most_max_in_flight(self):
+        async def scenario():
+            scheduler = ComponentScheduler("test", max_in_flight=2)
+            work = _Work()
+            submitted = [asyncio.create_task(scheduler.submit(work.task(i))) for i in range(5)]
+            await _settle()
+            assert work.running == 2
+            work.release.set()
+            results = await asyncio.gather(*submitted)
+            assert results == list(range(5))
+            assert work.max_running == 2
+            assert scheduler.in_flight == 0
+
+        asyncio.run(scenario())
+
+    def test_dispatches_by_priority_then_fifo(self):
+        async def scenario():
+            scheduler = ComponentScheduler("test", max_in_flight=1)
+            work = _Work()
+            blocker = asyncio.create_task(scheduler.submit(work.task("blocker")))
+            await _settle()
+            submitted = [
+                asyncio.create_task(scheduler.submit(work.task(name), priority=priority))
+                for name, priority in [("low", 5), ("high-1", 0), ("mid", 2), ("high-2", 0)]
+            ]
+            await _settle()
+            work.release.set()
+            await asyncio.gather(blocker, *submitted)
+            assert work.started == ["blocker", "high-1", "high-2", "mid", "low"]
+
+        asyncio.run(scenario())
+
+    def test_cancelled_queued_task_never_runs(self):
+        async def scenario():
+            scheduler = ComponentScheduler("test", max_in_flight=1)
+            work = _Work()
+            first = asyncio.create_task(scheduler.submit(work.task("first")))
+            queued = asyncio.create_task(scheduler.submit(work.task("queued")))
+            last = asyncio.create_task(scheduler.submit(work.task("last")))
+            await _settle()
+
+            queued.cancel()
+            await _settle()
+            work.release.set()
+            await asyncio.gather(first, last)
+
+            assert queued.cancelled()
+            assert work.started == ["first", "last"]
+
+        asyncio.run(scenario())
+
+    def test_cancelling_a_running_task_stops_it_and_frees_its_slot(self):
+        async def scenario():
+            scheduler = ComponentScheduler("test", max_in_flight=1)
+            work = _Work()
+            running = asyncio.create_task(scheduler.submit(work.task("running")))
+            queued = asyncio.create_task(scheduler.submit(work.task("queued")))
+            await _settle()
+            assert work.started == ["running"]
+
+            running.cancel()
+            await _settle()
+            assert work.started == ["running", "queued"]
+            assert work.running == 1
+
+            work.release.set()
+            assert await queued == "queued"
+            assert scheduler.in_flight == 0
+
+        asyncio.run(scenario())
+
+    def test_errors_reach_the_submitter_and_free_the_slot(self):
+        async def scenario():
+            scheduler = ComponentScheduler("test", max_in_flight=1)
+
+            async def fail():
+                raise ValueError("boom")
+
+            with pytest.raises(ValueError):
+                await scheduler.submit(fail)
+            assert scheduler.in_flight == 0
+
+            async def succeed():
+                return "ok"
+
+            assert await scheduler.submit(succeed) == "ok"
+
+        asyncio.run(scenario())
+
+    def test_timings_are_appended_for_the_caller(self):
+        async def scenario():
+            scheduler = ComponentScheduler("test", max_in_flight=1)
+            timings = []
+
+            async def succeed():
+                return "ok"
+
+            await asyncio.gather(*(scheduler.submit(succeed, priority=i, label=f"t{i}", timings=timings) for i in range(3)))
+            assert [timing.label for timing in timings] == ["t0", "t1", "t2"]
+            assert all(timing.queue_wait >= 0 and timing.execution >= 0 for timing in timings)
+
+        asyncio.run(scenario())
+
+
+class TestFairScheduling:
+    def test_free_slots_go_to_the_user_with_fewer_tasks_running(self):
+        async def scenario():
+            scheduler = ComponentScheduler("test", max_in_flight=2)
+            started = []
+            releases = {}
+
+            def task(name):
+                releases[name] = asyncio.Event()
+
+                async def run():
+                    started.append(name)
+                    await releases[name].wait()
+                return run
+
+            big, small = Tenant("big", 10), Tenant("small", 10)
+            # The large job queues everything first
+            submitted = [_submit_as(big, scheduler, task(f"big{i}")) for i in range(4)]
+            await _settle()
+            submitted += [_submit_as(small, scheduler, task(f"small{i}")) for i in range(2)]
+            await _settle()
+            assert started == ["big0", "big1"]
+
+            # Tasks finish one at a time in the order they started
+            for position in range(6):
+                releases[started[position]].set()
+                await _settle()
+            await asyncio.gather(*submitted)
+            assert started == ["big0", "big1", "small0", "big2", "small1", "big3"]
+
+        asyncio.run(scenario())
+
+    def test_user_with_fewest_running_tasks_goes_first(self):
+        async def scenario():
+            scheduler = ComponentScheduler("test", max_in_flight=3)
+            work = _Work()
+            big, small = Tenant("big", 10), Tenant("small", 10)
+            submitted = [_submit_as(big, scheduler, work.task(f"big{i}")) for i in range(6)]
+            await _settle()
+            submitted += [_submit_as(small, scheduler, work.task("small0"))]
+            await _settle()
+            assert work.started == ["big0", "big1", "big2"]
+            work.release.set()
+            await asyncio.gather(*submitted)
+            # The first free slot goes to the small job ahead of the large job's queue
+            assert work.started.index("small0") == 3
+
+        asyncio.run(scenario())
+
+    def test_user_cap_leaves_slots_to_others(self):
+        async def scenario():
+            scheduler = ComponentScheduler("test", max_in_flight=4)
+            work = _Work()
+            capped, other = Tenant("capped", 1), Tenant("other", 10)
+            submitted = [_submit_as(capped, scheduler, work.task(f"capped{i}")) for i in range(3)]
+            await _settle()
+            assert work.started == ["capped0"]
+
+            submitted += [_submit_as(other, scheduler, work.task(f"other{i}")) for i in range(2)]
+            await _settle()
+            assert work.started == ["capped0", "other0", "other1"]
+            assert scheduler.in_flight == 3
+
+            work.release.set()
+            await asyncio.gather(*submitted)
+            assert len(work.started) == 5
+
+        asyncio.run(scenario())
+
+    def test_work_without_tenant_is_uncapped(self):
+        async def scenario():
+            scheduler = ComponentScheduler("test", max_in_flight=3)
+            work = _Work()
+            submitted = [asyncio.create_task(scheduler.submit(work.task(i))) for i in range(3)]
+            await _settle()
+            assert work.running == 3
+            work.release.set()
+            await asyncio.gather(*submitted)
+
+        asyncio.run(scenario())
+
+
+class TestTenant:
+    def test_cap_follows_the_subscription_status(self, monkeypatch):
+        monkeypatch.setattr(scheduler_module, "USER_MAX_IN_FLIGHT", {"active": 8})
+        monkeypatch.setattr(scheduler_module, "USER_DEFAULT_MAX_IN_FLIGHT", 2)
+        assert Tenant.from_user("u1", {"subscription_status": "active"}) == Tenant("u1", 8)
+        assert Tenant.from_user("u2", {"subscription_status": "canceled"}) == Tenant("u2", 2)
+        assert Tenant.from_user("u3", None) == Tenant("u3", 2)
+
+
+class TestSummarizeTimings:
+    def test_empty(self):
+        assert summarize_timings([]) == {"tasks": 0}
+
+    def test_aggregates(self):
+        summary = summarize_timings([TaskTiming("a", 0, 1.0, 2.0), TaskTiming("b", 1, 3.0, 4.0)])
+        assert summary == {"tasks": 2, "avg_queue_wait": 2.0, "max_queue_wait": 3.0, "avg_execution": 3.0, "max_execution": 4.0}
@@ -0,0 +1,62 @@
+import json
+
+from workflows.screen_stream import ScreenStreamParser
+
+
+SCREENS = [
+    {"screen_name": "Home", "sub_prompt": "A feed of \"featured\" items {with braces}"},
+    {"screen_name": "Detail", "sub_prompt": "Item detail with a [gallery] and \\ a back button"},
+    {"screen_name": "Cart", "sub_prompt": "Cart summary"}
+]
+
+
+def _feed_in_chunks(parser: ScreenStreamParser, text: str, size: int):
+    completed = []
+    for start in range(0, len(text), size):
+        completed.extend(parser.feed(text[start:start + size]))
+    return completed
+
+
+class TestScreenStreamParser:
+    def test_single_chunk(self):
+        parser = ScreenStreamParser()
+        assert parser.feed(json.dumps({"screens": SCREENS})) == SCREENS
+
+    def test_any_chunking_yields_the_same_screens(self):
+        text = json.dumps({"screens": SCREENS})
+        for size in (1, 2, 7, 64):
+            assert _feed_in_chunks(ScreenStreamParser(), text, size) == SCREENS
+
+    def test_screen_is_returned_as_soon_as_it_closes(self):
+        text = json.dumps({"screens": SCREENS})
+        first_end = len('{"screens": [' + json.dumps(SCREENS[0]))
+        parser = ScreenStreamParser()
+
+        assert parser.feed(text[:first_end - 1]) == []
+        assert parser.feed(text[first_end - 1:first_end]) == [SCREENS[0]]
+
+    def test_text_before_the_array_key_is_ignored(self):
+        text = json.dumps({"reasoning": {"notes": "{ not a screen }"}, "screens": SCREENS[:1]})
+        assert _feed_in_chunks(ScreenStreamParser(), text, 5) == SCREENS[:1]
+
+    def test_objects_after_the_array_are_ignored(self):
+        text = json.dumps({"screens": SCREENS[:1], "extra": {"sub_prompt": "not a screen"}})
+        assert ScreenStreamParser().feed(text) == SCREENS[:1]
+
+    def test_nested_objects_stay_in_their_screen(self):
+        screen = {"screen_name": "Home", "sub_prompt": "p", "meta": {"tabs": [{"name": "a"}]}}
+        assert ScreenStreamParser().feed(json.dumps({"screens": [screen]})) == [screen]
+
+    def test_screens_without_sub_prompt_are_skipped(self):
+        text = json.dumps({"screens": [{"screen_name": "Broken"}, SCREENS[2]]})
+        assert ScreenStreamParser().feed(text) == [SCREENS[2]]
+
+    def test_custom_array_key(self):
+        text = json.dumps({"pages": SCREENS[:2]})
+        assert ScreenStreamParser(array_key="pages").feed(text) == SCREENS[:2]
+
+    def test_text_keeps_the_whole_response(self):
+        text = json.dumps({"screens": SCREENS})
+        parser = ScreenStreamParser()
+        _feed_in_chunks(parser, text, 3)
+        assert parser.text == text